@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed summary tables for the questions people ask most: career totals, totals for a player with one team, and
+season league leaders. Without them the LLM writes SUM(...) GROUP BY playerID over all of Batting/Pitching every time.
+
+    python aggregates.py build     [--db baseball_db.db]   (re)creates the tables and their indexes
+    python aggregates.py validate  [--db baseball_db.db]   checks every table still matches its definition
+
+The tables are documented for the LLM in SCHEMA_DOCS, which app.py appends to the database description in the prompt.
+"""
+
+import argparse
+import sqlite3
+import sys
+
+BATTING_STATS = ['G', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'IBB', 'HBP', 'SH', 'SF', 'GIDP']
+PITCHING_STATS = ['W', 'L', 'G', 'GS', 'CG', 'SHO', 'SV', 'IPOuts', 'H', 'ER', 'HR', 'BB', 'SO', 'IBB', 'WP', 'HBP', 'BK',
+                  'BFP', 'GF', 'R', 'SH', 'SF', 'GIDP']
+BATTING_POST_STATS = ['G', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'IBB', 'HBP', 'SH', 'SF', 'GIDP']
+
+# stats we keep the top 10 of, for each season and league, in SeasonLeaders
+LEADER_STATS = [('Batting', s) for s in ['HR', 'RBI', 'H', 'R', '2B', '3B', 'SB', 'BB']] + \
+               [('Pitching', s) for s in ['W', 'SV', 'SO', 'SHO', 'CG']]
+LEADER_RANKS = 10
+
+
+def _sums(stats):
+    return ', '.join(f'SUM("{s}") AS "{s}"' for s in stats)
+
+
+BATTING_AVERAGE = 'CASE WHEN SUM(AB) > 0 THEN SUM(H) * 1.0 / SUM(AB) END AS BA'
+ERA = 'CASE WHEN SUM(IPOuts) > 0 THEN SUM(ER) * 27.0 / SUM(IPOuts) END AS ERA'
+
+
+def _season_leaders():
+    parts = []
+    for table, stat in LEADER_STATS:
+        parts.append(f"""SELECT yearID, lgID, '{stat}' AS stat, RANK() OVER (PARTITION BY yearID, lgID ORDER BY SUM("{stat}") DESC) AS rank,
+                                playerID, SUM("{stat}") AS value
+                         FROM {table} GROUP BY playerID, yearID, lgID""")
+    return f'SELECT * FROM ({" UNION ALL ".join(parts)}) WHERE rank <= {LEADER_RANKS} AND value > 0'
+
+
+# name -> (definition, columns to index). Each table is exactly CREATE TABLE name AS definition
+AGGREGATES = {
+    'CareerBatting': (f'SELECT playerID, COUNT(DISTINCT yearID) AS seasons, MIN(yearID) AS firstYear, MAX(yearID) AS lastYear, '
+                      f'{_sums(BATTING_STATS)}, {BATTING_AVERAGE} FROM Batting GROUP BY playerID',
+                      [['playerID']]),
+    'CareerPitching': (f'SELECT playerID, COUNT(DISTINCT yearID) AS seasons, MIN(yearID) AS firstYear, MAX(yearID) AS lastYear, '
+                       f'{_sums(PITCHING_STATS)}, {ERA} FROM Pitching GROUP BY playerID',
+                       [['playerID']]),
+    'PlayerTeamBatting': (f'SELECT playerID, teamID, COUNT(DISTINCT yearID) AS seasons, MIN(yearID) AS firstYear, MAX(yearID) AS lastYear, '
+                          f'{_sums(BATTING_STATS)}, {BATTING_AVERAGE} FROM Batting GROUP BY playerID, teamID',
+                          [['playerID', 'teamID'], ['teamID']]),
+    'PlayerTeamPitching': (f'SELECT playerID, teamID, COUNT(DISTINCT yearID) AS seasons, MIN(yearID) AS firstYear, MAX(yearID) AS lastYear, '
+                           f'{_sums(PITCHING_STATS)}, {ERA} FROM Pitching GROUP BY playerID, teamID',
+                           [['playerID', 'teamID'], ['teamID']]),
+    'CareerBattingPost': (f'SELECT playerID, round, COUNT(DISTINCT yearID) AS seasons, {_sums(BATTING_POST_STATS)} '
+                          f'FROM BattingPost GROUP BY playerID, round',
+                          [['playerID', 'round'], ['round']]),
+    'SeasonLeaders': (_season_leaders(),
+                      [['stat', 'yearID', 'lgID', 'rank'], ['playerID']]),
+}
+
+SCHEMA_DOCS = """
+--------------------------------------------------------------------------------------------------------------------------------------------
+PRECOMPUTED SUMMARY TABLES
+
+These tables are precomputed from Batting, Pitching and BattingPost. They are much faster to query than the tables they
+summarize, so use them instead of SUM(...) GROUP BY playerID over Batting/Pitching/BattingPost whenever they can answer
+the question. They hold totals only; go back to the base tables when you need individual seasons or a range of years.
+
+CAREERBATTING TABLE          One row per player: career batting totals (all teams, regular season)
+PLAYERTEAMBATTING TABLE      One row per player per team: batting totals while with that team (teamID as in Batting)
+
+playerID       Player ID code
+teamID         Team (PlayerTeamBatting only)
+seasons        Number of seasons with at least one Batting row
+firstYear      First year with a Batting row
+lastYear       Last year with a Batting row
+G, AB, R, H, 2B, 3B, HR, RBI, SB, CS, BB, SO, IBB, HBP, SH, SF, GIDP      Totals of the Batting columns of the same name
+BA             Batting average, H / AB
+
+CAREERPITCHING TABLE         One row per player: career pitching totals (all teams, regular season)
+PLAYERTEAMPITCHING TABLE     One row per player per team: pitching totals while with that team
+
+playerID       Player ID code
+teamID         Team (PlayerTeamPitching only)
+seasons, firstYear, lastYear    As for CareerBatting
+W, L, G, GS, CG, SHO, SV, IPOuts, H, ER, HR, BB, SO, IBB, WP, HBP, BK, BFP, GF, R, SH, SF, GIDP     Totals of the Pitching columns of the same name
+ERA            Earned run average, ER * 27 / IPOuts
+
+CAREERBATTINGPOST TABLE      One row per player per playoff round: post-season batting totals
+
+playerID       Player ID code
+round          Level of playoffs ('WS' is the World Series)
+seasons        Number of post-seasons the player batted in that round
+G, AB, R, H, 2B, 3B, HR, RBI, SB, CS, BB, SO, IBB, HBP, SH, SF, GIDP      Totals of the BattingPost columns of the same name
+
+SEASONLEADERS TABLE          The top 10 (ties included) in each league, each season, for a few stats
+
+yearID         Year
+lgID           League
+stat           One of HR, RBI, H, R, 2B, 3B, SB, BB (batting) or W, SV, SO, SHO, CG (pitching)
+rank           1 is the league leader
+playerID       Player ID code
+value          The player's season total for that stat, across all of his teams in that league
+"""
+
+
+def build(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, (definition, indexes) in AGGREGATES.items():
+            conn.execute(f'DROP TABLE IF EXISTS {name}')
+            conn.execute(f'CREATE TABLE {name} AS {definition}')
+            for columns in indexes:
+                conn.execute(f'CREATE INDEX idx_{name.lower()}_{"_".join(columns).lower()} ON {name} ({", ".join(columns)})')
+            count = conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0]
+            print(f'built {name}: {count} rows')
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def validate(db_path):
+    """Check every aggregate table holds exactly the rows its definition produces. Returns the names that don't."""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    failed = []
+    try:
+        for name, (definition, _) in AGGREGATES.items():
+            try:
+                extra = conn.execute(f'SELECT COUNT(*) FROM (SELECT * FROM {name} EXCEPT SELECT * FROM ({definition}))').fetchone()[0]
+                missing = conn.execute(f'SELECT COUNT(*) FROM (SELECT * FROM ({definition}) EXCEPT SELECT * FROM {name})').fetchone()[0]
+            except sqlite3.Error as e:
+                print(f'{name}: FAILED ({e})')
+                failed.append(name)
+                continue
+            if extra or missing:
+                print(f'{name}: FAILED, {extra} rows not in the definition, {missing} rows missing')
+                failed.append(name)
+            else:
+                print(f'{name}: ok')
+    finally:
+        conn.close()
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or validate the precomputed summary tables')
+    parser.add_argument('command', choices=['build', 'validate'])
+    parser.add_argument('--db', default='baseball_db.db')
+    args = parser.parse_args()
+    if args.command == 'build':
+        build(args.db)
+    else:
+        sys.exit(1 if validate(args.db) else 0)
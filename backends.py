@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Execution backends for the generated SQL: SQLite (the database itself, always there) and an optional columnar copy of
+the same data in DuckDB, which runs the queries that scan and aggregate all of Batting, Pitching, Fielding or
+Appearances many times faster.
+
+BackendRouter picks one per query, once the query governor has passed its plan (a cartesian join of big tables is
+refused on either engine, though DuckDB has no VM step budget, only the wall clock one). It adds up the rows of every
+table SQLite's EXPLAIN QUERY PLAN would scan, and only queries that scan at least COLUMNAR_MIN_SCAN_ROWS go to DuckDB,
+and then only if DuckDB can compile them. Anything DuckDB reads differently from SQLite (LIKE is case sensitive in
+DuckDB, for one) stays on SQLite, and if DuckDB fails at run time the query is run again on SQLite. With
+COLUMNAR_COMPARE=1 every routed query runs on both, and the timings and whether the results match are logged.
+
+The columnar copy is a one-time Parquet export of every table, which DuckDB loads into memory at startup:
+
+    python backends.py export [--db baseball_db.db] [--out columnar]
+        writes columnar/<table>.parquet and a manifest. Re-run it after rebuilding the database, a stale export
+        (the database fingerprint in the manifest doesn't match) isn't loaded.
+
+    python backends.py compare [--fixtures bench/fixtures.jsonl]
+        runs the SQL of every fixture on both engines and prints their timings and whether the results match.
+
+DuckDB is optional (pip install duckdb). Without it, or without an export, everything runs on SQLite as before.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import pyarrow as pa
+
+from executor import interruptible
+from governor import QueryBudgetExceeded, table_aliases
+from result_cache import database_fingerprint
+from results import FETCH_BATCH_ROWS, column_array, table_rows
+import tracing
+
+try:
+    import duckdb
+except ImportError:   # optional, see the module docstring
+    duckdb = None
+
+MANIFEST = 'manifest.json'
+
+# SQL that compiles in DuckDB but means something different there, and why. (Things DuckDB refuses outright, like
+# selecting a column that isn't grouped by, fail its EXPLAIN and stay on SQLite that way. NULLs sorting first is a
+# setting, see DuckDBBackend._cursor.)
+_DIALECT_RISKS = [
+    (re.compile(r'\b(?:LIKE|GLOB)\b', re.IGNORECASE), 'LIKE and GLOB are case sensitive in DuckDB'),
+    (re.compile(r'\bCAST\s*\(.*?\bAS\s+INT', re.IGNORECASE | re.DOTALL),
+     'CAST(... AS INTEGER) rounds in DuckDB, SQLite truncates'),
+    (re.compile(r'\bROUND\s*\(', re.IGNORECASE), 'ROUND() is a DECIMAL in DuckDB, a REAL in SQLite'),
+]
+
+
+class BackendError(Exception):
+    """A backend couldn't run a query that SQLite might still be able to."""
+
+
+class BackendUnavailable(Exception):
+    """The columnar backend can't be loaded (DuckDB isn't installed, or there's no up to date export)."""
+
+
+class SQLiteBackend:
+    """Runs queries on the pooled read-only SQLite connection, under the query governor."""
+
+    name = 'sqlite'
+
+    def __init__(self, governor):
+        self.governor = governor
+
+    def execute(self, conn, query, max_rows=None, params=()):
+        return self.governor.execute(conn, query, max_rows, params)
+
+
+class DuckDBBackend:
+    """An in-memory DuckDB database loaded from the Parquet export. Each query gets its own cursor, with the same row
+    cap as the governor and a wall clock budget enforced by interrupting the cursor."""
+
+    name = 'duckdb'
+
+    def __init__(self, conn, max_rows=1000, max_seconds=10.0):
+        self._conn = conn
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def load(cls, export_dir, db_path, **kwargs):
+        if duckdb is None:
+            raise BackendUnavailable('duckdb is not installed')
+        manifest_path = os.path.join(export_dir, MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise BackendUnavailable(f'no export in {export_dir}, run python backends.py export')
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('database') != database_fingerprint(db_path):
+            raise BackendUnavailable(f'the export in {export_dir} is older than {db_path}, run python backends.py export')
+        conn = duckdb.connect(':memory:')
+        for table, entry in manifest['tables'].items():
+            conn.execute(f'CREATE TABLE "{table}" AS SELECT * FROM read_parquet(?)', [os.path.join(export_dir, entry['file'])])
+        return cls(conn, **kwargs)
+
+    def _cursor(self):
+        cursor = self._conn.cursor()
+        cursor.execute('SET integer_division = true')   # 7 / 2 is 3 in SQLite, make it 3 here too
+        # SQLite sorts NULLs first in ascending order and last in descending order, DuckDB the other way round
+        cursor.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+        return cursor
+
+    def incompatible(self, query, params=()):
+        """Why this query can't safely run on DuckDB, or None if it can."""
+        for risk, reason in _DIALECT_RISKS:
+            if risk.search(query):
+                return reason
+        cursor = self._cursor()
+        try:
+            cursor.execute('EXPLAIN ' + query.strip().rstrip(';'), list(params))
+        except duckdb.Error as e:
+            return str(e).split('\n')[0]
+        finally:
+            cursor.close()
+        return None
+
+    def execute(self, conn, query, max_rows=None, params=()):
+        max_rows = max_rows or self.max_rows
+        cursor = self._cursor()
+        state = {'interrupted': False}
+
+        def interrupt():
+            state['interrupted'] = True
+            cursor.interrupt()
+
+        timer = threading.Timer(self.max_seconds, interrupt) if self.max_seconds else None
+        try:
+            if timer is not None:
+                timer.start()
+            with interruptible(cursor):   # so a stopped query doesn't fall back to SQLite
+                cursor.execute(query.strip().rstrip(';'), list(params))
+                # to_arrow_reader replaced fetch_record_batch in duckdb 1.5
+                reader = getattr(cursor, 'to_arrow_reader', cursor.fetch_record_batch)(FETCH_BATCH_ROWS)
+                batches, fetched = [], 0
+                for batch in reader:
+                    batches.append(batch)
+                    fetched += batch.num_rows
+                    if fetched > max_rows:
+                        break
+                table = sqlite_types(pa.Table.from_batches(batches, schema=reader.schema))
+        except duckdb.Error as e:
+            if state['interrupted']:
+                raise QueryBudgetExceeded('time', f'the query ran longer than {self.max_seconds} seconds and was stopped') from None
+            raise BackendError(str(e)) from e
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cursor.close()
+        return table.slice(0, max_rows), table.num_rows > max_rows
+
+
+def estimate_scan_rows(conn, query, table_rows, params=()):
+    """Total rows of the tables SQLite's plan for this query scans in full."""
+    aliases = table_aliases(query)
+    total = 0
+    for _, _, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + query, params):
+        if detail.startswith('SCAN '):
+            name = detail.split()[1].lower()
+            total += table_rows.get(aliases.get(name, name), 0)
+    return total
+
+
+def sqlite_types(table):
+    """DuckDB sums integers to HUGEINT, which Arrow gets as a decimal. Make whole decimals int64 and the rest float64,
+    as SQLite would have them."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            target = pa.int64() if field.type.scale == 0 else pa.float64()
+            table = table.set_column(i, field.name, table.column(i).cast(target))
+    return table
+
+
+def results_equal(rows, other_rows):
+    """Same rows in any order. Floats are compared to 6 decimal places, the engines add them up in different orders."""
+    def normalized(rows):
+        return sorted(repr(tuple(round(v, 6) if isinstance(v, float) else v for v in row)) for row in rows)
+    return normalized(rows) == normalized(other_rows)
+
+
+def compare_status(result, other_result):
+    """'equal', 'differ', 'error' (one of them failed) or 'truncated' (both hit the row cap, so without an ORDER BY
+    they may well have kept different rows) for two (table, truncated) results."""
+    if result is None or other_result is None:
+        return 'error'
+    if result[1] or other_result[1]:
+        return 'truncated'
+    return 'equal' if results_equal(table_rows(result[0]), table_rows(other_result[0])) else 'differ'
+
+
+class BackendRouter:
+
+    def __init__(self, sqlite_backend, columnar=None, min_scan_rows=100_000, compare=False):
+        self.sqlite = sqlite_backend
+        self.columnar = columnar
+        self.min_scan_rows = min_scan_rows
+        self.compare = compare
+
+    def choose(self, conn, query, params=()):
+        """(backend, reason) for this query."""
+        if self.columnar is None:
+            return self.sqlite, 'no columnar backend'
+        scan_rows = estimate_scan_rows(conn, query, self.sqlite.governor.table_rows(conn), params)
+        if scan_rows < self.min_scan_rows:
+            return self.sqlite, f'scans {scan_rows} rows'
+        problem = self.columnar.incompatible(query, params)
+        if problem is not None:
+            return self.sqlite, f'dialect: {problem}'
+        return self.columnar, f'scans {scan_rows} rows'
+
+    def execute(self, conn, query, params=()):
+        """Run a query, with params bound to its ? placeholders, on the backend that suits it. Returns
+        (table, truncated)."""
+        # the governor's plan check (no nested full scans of big tables) holds whichever engine runs the query
+        self.sqlite.governor.check_plan(conn, query, params)
+        backend, reason = self.choose(conn, query, params)
+        tracing.annotate(backend=backend.name, route=reason)
+        if self.compare and backend is self.columnar:
+            return self._compare(conn, query, params, backend)
+        if backend is self.sqlite:
+            return self.sqlite.execute(conn, query, params=params)
+        try:
+            return backend.execute(conn, query, params=params)
+        except BackendError as e:
+            tracing.annotate(backend='sqlite', fallback=str(e))
+            return self.sqlite.execute(conn, query, params=params)
+
+    def _compare(self, conn, query, params, chosen):
+        results = {}
+        for backend in (self.sqlite, self.columnar):
+            started = time.perf_counter()
+            try:
+                results[backend.name] = (backend.execute(conn, query, params=params), None, time.perf_counter() - started)
+            except Exception as e:
+                results[backend.name] = (None, e, time.perf_counter() - started)
+        (sqlite_result, sqlite_error, sqlite_seconds) = results[self.sqlite.name]
+        (columnar_result, columnar_error, columnar_seconds) = results[self.columnar.name]
+        status = compare_status(sqlite_result, columnar_result)
+        tracing.annotate(sqlite_seconds=round(sqlite_seconds, 6), duckdb_seconds=round(columnar_seconds, 6), results=status)
+        print(f'backend compare: sqlite {sqlite_seconds * 1000:.1f} ms, duckdb {columnar_seconds * 1000:.1f} ms, '
+              f'results {status}: {query}')
+        result, error, _ = results[chosen.name]
+        if result is None and chosen is not self.sqlite:
+            result, error = sqlite_result, sqlite_error
+        if result is None:
+            raise error
+        return result
+
+
+def export_parquet(db_path, out_dir):
+    """Write every table of the SQLite database to out_dir/<table>.parquet, plus a manifest."""
+    import pyarrow.parquet as pq
+    os.makedirs(out_dir, exist_ok=True)
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    manifest = {'database': database_fingerprint(db_path), 'tables': {}}
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        for table in tables:
+            started = time.perf_counter()
+            columns = [(r[1], r[2]) for r in conn.execute(f'PRAGMA table_info("{table}")')]
+            rows = conn.execute(f'SELECT * FROM "{table}"').fetchall()
+            arrays = [column_array([row[i] for row in rows], declared) for i, (_, declared) in enumerate(columns)]
+            pq.write_table(pa.table(arrays, names=[name for name, _ in columns]), os.path.join(out_dir, f'{table}.parquet'))
+            manifest['tables'][table] = {'file': f'{table}.parquet', 'rows': len(rows)}
+            print(f'{table:<24} {len(rows):>9} rows  {time.perf_counter() - started:6.2f}s')
+    finally:
+        conn.close()
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'exported {len(manifest["tables"])} tables to {out_dir}')
+
+
+def compare(fixtures_path, db_path, export_dir):
+    from governor import QueryGovernor
+    governor = QueryGovernor()
+    columnar = DuckDBBackend.load(export_dir, db_path, max_rows=governor.max_rows, max_seconds=governor.max_seconds)
+    backends = (SQLiteBackend(governor), columnar)
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    print(f'{"sqlite ms":>10} {"duckdb ms":>10}  {"result":<8} query')
+    with open(fixtures_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            sql = json.loads(line)['sql']
+            timings, results = [], []
+            for backend in backends:
+                started = time.perf_counter()
+                try:
+                    results.append(backend.execute(conn, sql))
+                except Exception:
+                    results.append(None)
+                timings.append((time.perf_counter() - started) * 1000)
+            problem = columnar.incompatible(sql)
+            status = compare_status(*results)
+            note = f'  ({problem})' if problem else ''
+            print(f'{timings[0]:10.2f} {timings[1]:10.2f}  {status:<8} {sql[:80]}{note}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Columnar copy of the database for the DuckDB backend')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export_parser = sub.add_parser('export', help='export every table to Parquet')
+    export_parser.add_argument('--db', default='baseball_db.db')
+    export_parser.add_argument('--out', default='columnar')
+    compare_parser = sub.add_parser('compare', help='run SQL on SQLite and DuckDB and compare timings and results')
+    compare_parser.add_argument('--fixtures', default=os.path.join('bench', 'fixtures.jsonl'))
+    compare_parser.add_argument('--db', default='baseball_db.db')
+    compare_parser.add_argument('--columnar', default='columnar')
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_parquet(args.db, args.out)
+    else:
+        compare(args.fixtures, args.db, args.columnar)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Answers a file of questions without the UI, through the same pipeline as the app.
+
+    python batch.py questions.jsonl [more.jsonl ...] [--out results.jsonl | results.csv]
+                    [--llm-workers 8] [--sql-workers 4] [--no-cache]
+    cat questions.txt | python batch.py - --out results.csv
+
+Each input line is a JSON object with a "question" field, or just the question as plain text. A question asked more
+than once (the same words, ignoring case, punctuation and stop words) is answered once. Every question has its SQL
+written on a pool of --llm-workers threads and then run on a separate pool of --sql-workers threads, so waiting on
+OpenAI never holds a database connection and the database never runs more than --sql-workers queries at a time.
+Results are written as each question finishes: JSONL with question, sql, columns, rows, truncated, error, llm_attempts,
+from_cache, from_template, intent and the milliseconds spent in each stage, or CSV with the rows as JSON. Progress goes to stderr.
+
+The output primes the caches for the app. Add it to QUESTION_CACHE_PRIME_PATHS and those questions are answered
+without asking OpenAI. The result cache (RESULT_CACHE_PATH) fills up as the batch runs, so an app using the same file
+reuses the rows too. `python examples.py harvest` can also turn the output into more sample queries.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from config import BATCH_LLM_WORKERS, BATCH_SQL_WORKERS
+from pipeline import Answer, annotate_outcome, run_sql, write_sql
+from query_cache import normalize_question
+from resources import get_client, warmup
+
+FIELDS = ['question', 'sql', 'columns', 'rows', 'truncated', 'error', 'llm_attempts', 'model', 'escalated', 'candidate',
+          'from_cache', 'from_template', 'intent', 'timings']
+
+
+def read_questions(paths):
+    """Yield the questions in JSONL or plain text files ('-' is stdin)."""
+    for path in paths:
+        f = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = line
+                question = entry.get('question') if isinstance(entry, dict) else entry
+                if isinstance(question, str) and question.strip():
+                    yield question.strip()
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def dedupe(questions):
+    """The questions without repeats, in the order first seen, and how many repeats were dropped."""
+    seen = set()
+    unique = []
+    for question in questions:
+        key = normalize_question(question)
+        if key not in seen:
+            seen.add(key)
+            unique.append(question)
+    return unique, len(questions) - len(unique)
+
+
+def answer_record(answer):
+    return {
+        'question': answer.question,
+        'sql': answer.sql,
+        'columns': answer.result.column_names if answer.result is not None else None,
+        'rows': [list(row) for row in answer.rows] if answer.rows is not None else None,
+        'truncated': answer.truncated,
+        'error': answer.error if answer.sql is not None else answer.error or 'the model did not write a query',
+        'llm_attempts': answer.llm_attempts,
+        'model': answer.model,
+        'escalated': answer.escalated,
+        'candidate': answer.candidate,
+        'from_cache': answer.from_cache,
+        'from_template': answer.from_template,
+        'intent': answer.intent,
+        'timings': {stage: round(seconds * 1000, 3) for stage, seconds in answer.timings.items()},
+    }
+
+
+class ResultWriter:
+    """Writes one answer at a time as JSONL or CSV, flushing after each so results can be read while the batch runs."""
+
+    def __init__(self, f, fmt='jsonl'):
+        self.f = f
+        self.fmt = fmt
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(f, fieldnames=FIELDS)
+            self._csv.writeheader()
+
+    def write(self, answer):
+        record = answer_record(answer)
+        if self._csv is not None:
+            self._csv.writerow({k: json.dumps(v, default=str) if isinstance(v, (list, dict)) else v
+                                for k, v in record.items()})
+        else:
+            self.f.write(json.dumps(record, default=str) + '\n')
+        self.f.flush()
+
+
+def run_batch(questions, client, writer, llm_workers=BATCH_LLM_WORKERS, sql_workers=BATCH_SQL_WORKERS,
+              use_cache=True, progress_every=25):
+    """Answer every question, writing each result as soon as it's ready. Returns {'answered': n, 'errors': n}."""
+    finished = queue.Queue()   # answers ready to write, from either pool
+
+    def write_phase(question):
+        trace = tracing.Trace(question)
+        with tracing.activate(trace):
+            try:
+                answer = write_sql(question, client, stream=False, use_cache=use_cache)
+            except Exception as e:
+                answer = Answer(question)
+                answer.error = f'OpenAI request failed: {e}'
+        return answer, trace
+
+    def run_phase(answer, trace):
+        with tracing.activate(trace):
+            try:
+                run_sql(answer, client, use_cache=use_cache)
+            except Exception as e:
+                answer.error = str(e)
+            annotate_outcome(answer)
+        tracing.finish(trace)
+        return answer
+
+    with ThreadPoolExecutor(llm_workers, thread_name_prefix='llm') as llm_pool, \
+            ThreadPoolExecutor(sql_workers, thread_name_prefix='sql') as sql_pool:
+
+        def written(future):
+            answer, trace = future.result()
+            if answer.sql is None or answer.error is not None:
+                with tracing.activate(trace):
+                    annotate_outcome(answer)
+                tracing.finish(trace)
+                finished.put(answer)
+            else:
+                sql_pool.submit(run_phase, answer, trace).add_done_callback(lambda f: finished.put(f.result()))
+
+        for question in questions:
+            llm_pool.submit(write_phase, question).add_done_callback(written)
+
+        started = time.perf_counter()
+        errors = 0
+        for done in range(1, len(questions) + 1):
+            answer = finished.get()
+            errors += answer.error is not None or answer.sql is None
+            writer.write(answer)
+            if done % progress_every == 0 or done == len(questions):
+                elapsed = time.perf_counter() - started
+                print(f'{done}/{len(questions)} answered, {errors} errors, {done / elapsed:.1f} questions/s',
+                      file=sys.stderr)
+    return {'answered': len(questions), 'errors': errors}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answer a file of questions without the UI')
+    parser.add_argument('paths', nargs='*', default=['-'], help="JSONL or text files of questions, '-' for stdin")
+    parser.add_argument('--out', default='-', help="results file, .jsonl or .csv ('-' for stdout)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default=None, help='defaults to the --out extension')
+    parser.add_argument('--llm-workers', type=int, default=BATCH_LLM_WORKERS, help='concurrent OpenAI requests')
+    parser.add_argument('--sql-workers', type=int, default=BATCH_SQL_WORKERS, help='concurrent database queries')
+    parser.add_argument('--no-cache', action='store_true', help="don't answer from the question or template caches or the intents, ask OpenAI every time")
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.out.endswith('.csv') else 'jsonl')
+    questions, repeats = dedupe(list(read_questions(args.paths)))
+    print(f'{len(questions)} questions ({repeats} repeats dropped)', file=sys.stderr)
+
+    out = sys.stdout if args.out == '-' else open(args.out, 'w', encoding='utf-8', newline='')
+    try:
+        # anything the pipeline prints goes to stderr, stdout may be the results
+        with contextlib.redirect_stdout(sys.stderr):
+            warmup(client=False, metrics=False)
+            started = time.perf_counter()
+            summary = run_batch(questions, get_client(), ResultWriter(out, fmt), llm_workers=args.llm_workers,
+                                sql_workers=args.sql_workers, use_cache=not args.no_cache)
+        print(f'answered {summary["answered"]} questions in {time.perf_counter() - started:.1f}s, '
+              f'{summary["errors"]} without a result', file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline end-to-end benchmark of the chatbot pipeline.
+
+Every question in the fixtures file goes through pipeline.answer_question exactly as the app runs it (prompt assembly,
+OpenAI, validation and repair, execution on baseball_db.db), except that OpenAI is bench/stub_server.py replaying
+the recorded responses, so it needs no network or API key. The report has p50/p95/p99 latency for each stage, the SQL
+execution time of each query, and whether each query's rows match the fixture's gold SQL.
+
+    python bench/run.py [--fixtures bench/fixtures.jsonl] [--repeat 3] [--stream] [--latency 0.5]
+                        [--json report.json] [--min-accuracy 1.0]
+
+The question cache is bypassed so every run asks the stub, and the result cache is off unless --result-cache is given,
+so execution time is measured on the database. Pass --base-url to benchmark against some other server instead.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import StubOpenAI, read_fixtures   # noqa: E402
+
+
+def percentile(values, p):
+    """Nearest rank percentile, p in 0..100."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))   # ceil(p * n / 100)
+    return ordered[rank - 1]
+
+
+def same_rows(rows, gold_rows):
+    """Whether two results hold the same rows, in any order. Column names and order of rows don't matter."""
+    return sorted(map(repr, map(tuple, rows))) == sorted(map(repr, map(tuple, gold_rows)))
+
+
+def run(fixtures, repeat=1, stream=False, verbose=False):
+    # imported here so the environment run() was called with is what config.py sees
+    from pipeline import STAGES, answer_question
+    from results import table_rows
+    from resources import get_client, get_db_pool, get_query_governor, warmup
+
+    client = get_client()
+    warmup(client=False, metrics=False)   # startup costs aren't what we're measuring, and the app may have the metrics port
+    governor = get_query_governor()
+
+    gold = []
+    with get_db_pool().connection() as conn:
+        for fixture in fixtures:
+            try:
+                gold.append(table_rows(governor.execute(conn, fixture['sql'])[0]))
+            except Exception as e:
+                gold.append(e)
+
+    stage_times = {stage: [] for stage in STAGES + ('total',)}
+    queries = [{'question': f['question'], 'execute_ms': [], 'llm_attempts': 0, 'status': None} for f in fixtures]
+    output = sys.stdout if verbose else io.StringIO()   # the pipeline prints every OpenAI response
+    for _ in range(repeat):
+        for fixture, gold_rows, query in zip(fixtures, gold, queries):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(output):
+                answer = answer_question(fixture['question'], client, stream=stream, use_cache=False)
+            stage_times['total'].append(time.perf_counter() - started)
+            for stage, seconds in answer.timings.items():
+                stage_times[stage].append(seconds)
+            if 'execute' in answer.timings:
+                query['execute_ms'].append(answer.timings['execute'] * 1000)
+            query['llm_attempts'] = answer.llm_attempts
+            query['sql'] = answer.sql
+            if isinstance(gold_rows, Exception):
+                query['status'] = f'gold sql failed: {gold_rows}'
+            elif answer.error is not None or answer.rows is None:
+                query['status'] = f'error: {answer.error or "no query"}'
+            else:
+                query['status'] = 'ok' if same_rows(answer.rows, gold_rows) else 'wrong'
+
+    stages = {}
+    for stage, times in stage_times.items():
+        if times:
+            stages[stage] = {'n': len(times), **{f'p{p}': percentile(times, p) * 1000 for p in (50, 95, 99)}}
+    correct = sum(1 for q in queries if q['status'] == 'ok')
+    return {'stages': stages, 'queries': queries, 'correct': correct, 'total': len(queries),
+            'accuracy': correct / len(queries) if queries else 1.0}
+
+
+def print_report(report):
+    print(f'{"stage":<10} {"n":>5} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10}')
+    for stage, row in report['stages'].items():
+        print(f'{stage:<10} {row["n"]:>5} {row["p50"]:>10.2f} {row["p95"]:>10.2f} {row["p99"]:>10.2f}')
+    print()
+    print(f'{"exec ms":>9} {"llm":>4}  {"question":<60}  result')
+    for query in report['queries']:
+        execute = f'{percentile(query["execute_ms"], 50):9.2f}' if query['execute_ms'] else f'{"-":>9}'
+        print(f'{execute} {query["llm_attempts"]:>4}  {query["question"][:60]:<60}  {query["status"]}')
+    print()
+    print(f'correct: {report["correct"]}/{report["total"]} ({report["accuracy"]:.0%})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the chatbot pipeline against a stub OpenAI server')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures.jsonl'))
+    parser.add_argument('--repeat', type=int, default=3, help='times to run every question')
+    parser.add_argument('--stream', action='store_true', help='use the streaming OpenAI request, like the app does by default')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the stub waits before each reply')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--base-url', default=None, help='benchmark against this OpenAI compatible server instead of the stub')
+    parser.add_argument('--result-cache', action='store_true', help='leave the result cache on')
+    parser.add_argument('--json', default=None, help='also write the report to this file')
+    parser.add_argument('--min-accuracy', type=float, default=0.0, help='exit with an error below this fraction correct')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    fixtures = read_fixtures(args.fixtures)
+    os.chdir(ROOT)   # DB_PATH and the examples are relative to the app
+    if not args.result_cache:
+        os.environ['RESULT_CACHE_PATH'] = ''
+    stub = None
+    if args.base_url is None:
+        stub = StubOpenAI(fixtures, port=args.port, latency=args.latency).start()
+        args.base_url = stub.base_url
+    os.environ['OPENAI_BASE_URL'] = args.base_url
+    os.environ.setdefault('OPENAI_API_KEY', 'bench')
+
+    report = run(fixtures, repeat=args.repeat, stream=args.stream, verbose=args.verbose)
+    if stub is not None:
+        report['llm_requests'] = stub.requests
+        report['prompt_tokens'] = stub.prompt_tokens
+    print_report(report)
+    if stub is not None:
+        print(f'{stub.requests} OpenAI requests, about {stub.prompt_tokens / max(stub.requests, 1):.0f} prompt tokens each')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['accuracy'] < args.min_accuracy:
+        sys.exit(1)
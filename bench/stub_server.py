@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the OpenAI chat completions API, for benchmarking without a network.
+
+It replays the responses recorded in a fixtures file: a tool call whose query is the fixture's "response" (or its
+gold "sql" if nothing was recorded) for a question, and the fixture's "repair" (or gold sql) for a repair request
+about that response. Streaming and non-streaming requests are both supported, and --latency adds a fixed delay
+before each reply to stand in for the model's time.
+
+    python bench/stub_server.py [--fixtures bench/fixtures.jsonl] [--port 18080] [--latency 0.5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_cache import normalize_question   # noqa: E402
+
+
+def read_fixtures(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class StubOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures, port=18080, latency=0.0):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.responses = {}   # normalized question -> recorded SQL
+        self.repairs = {}     # recorded SQL -> repaired SQL
+        for fixture in fixtures:
+            response = fixture.get('response', fixture['sql'])
+            self.responses[normalize_question(fixture['question'])] = response
+            self.repairs[response] = fixture.get('repair', fixture['sql'])
+        self.requests = 0
+        self.prompt_tokens = 0
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def answer(self, content):
+        """The SQL to reply with for this user message."""
+        # the question is the first paragraph of the message, the resolved names (if any) follow it
+        question = normalize_question(content.split('\n\n')[0])
+        if question in self.responses:
+            return self.responses[question]
+        for response, repair in self.repairs.items():   # a repair request quotes the SQL it wants fixed
+            if response in content:
+                return repair
+        return 'SELECT 1'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        content = body['messages'][-1]['content']
+        sql = self.server.answer(content)
+        # roughly 4 characters a token, good enough to see a prompt get bigger or smaller
+        prompt_tokens = (sum(len(str(m.get('content') or '')) for m in body['messages']) +
+                         len(json.dumps(body.get('tools', '')))) // 4
+        self.server.requests += 1
+        self.server.prompt_tokens += prompt_tokens
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if 'tools' not in body:
+            message = {'role': 'assistant', 'content': sql}
+            return self.send_json(body, message, 'stop', prompt_tokens)
+        arguments = json.dumps({'query': sql})
+        tool_call = {'id': 'call_bench', 'type': 'function', 'function': {'name': 'ask_database', 'arguments': arguments}}
+        if not body.get('stream'):
+            return self.send_json(body, {'role': 'assistant', 'content': None, 'tool_calls': [tool_call]}, 'tool_calls',
+                                  prompt_tokens)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        first = dict(tool_call, index=0, function={'name': 'ask_database', 'arguments': ''})
+        self.send_chunk(body, {'role': 'assistant', 'tool_calls': [first]})
+        for i in range(0, len(arguments), 16):
+            self.send_chunk(body, {'tool_calls': [{'index': 0, 'function': {'arguments': arguments[i:i + 16]}}]})
+        self.send_chunk(body, {}, 'tool_calls')
+        if (body.get('stream_options') or {}).get('include_usage'):
+            self.send_chunk(body, None, usage=self.usage(prompt_tokens))
+        try:
+            self.wfile.write(b'data: [DONE]\n\n')
+        except OSError:
+            pass   # the client closes the stream as soon as the arguments are complete
+
+    def send_json(self, body, message, finish_reason, prompt_tokens):
+        data = json.dumps({
+            'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': self.usage(prompt_tokens),
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    @staticmethod
+    def usage(prompt_tokens):
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': 50, 'total_tokens': prompt_tokens + 50}
+
+    def send_chunk(self, body, delta, finish_reason=None, usage=None):
+        """One chunk of a streamed response, or with delta None the last one, which has no choices, only usage."""
+        chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                 'model': body['model'], 'usage': usage,
+                 'choices': [] if delta is None else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+        try:
+            self.wfile.write(b'data: ' + json.dumps(chunk).encode() + b'\n\n')
+            self.wfile.flush()
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub OpenAI server that replays recorded responses')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(__file__), 'fixtures.jsonl'))
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before each reply')
+    args = parser.parse_args()
+    server = StubOpenAI(read_fixtures(args.fixtures), port=args.port, latency=args.latency)
+    print(f'serving {len(server.responses)} recorded responses on {server.base_url}')
+    server.serve_forever()
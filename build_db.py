@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Builds baseball_db.db from the CSV files of a Lahman release (http://seanlahman.com/), the same way every time.
+
+    python build_db.py --csv lahman/core [--csv lahman/contrib] [--db baseball_db.db] [--page-size 8192]
+
+Every <Table>.csv becomes a table. Column types come from the data: a column whose values are all whole numbers is an
+INTEGER, all numbers a REAL, anything else TEXT, and empty cells are NULLs (so SUM(HR) and yearID > 1990 compare
+numbers, not strings). Tables get their natural primary key (PRIMARY_KEYS) when the data agrees it's one, stored
+WITHOUT ROWID when the key isn't a single integer and the rows are small, so lookups by key go straight to the row.
+Then the curated indexes (indexes.py) and summary tables (aggregates.py) are built, ANALYZE gathers the planner
+statistics, and VACUUM packs the file.
+
+The database is built next to db as db.building and only replaces db once it's complete. Next to it goes
+baseball_db.manifest.json: the source files and their hashes, each table's rows, column types and key, and a hash of
+the database content, which is the same for the same CSV files whatever SQLite version built the file.
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+
+import aggregates
+from indexes import INDEXES, create_indexes
+
+# the primary key of each Lahman table (lower case name). A key the data doesn't bear out (duplicates, NULLs) is
+# skipped with a message, and the table is built without one.
+PRIMARY_KEYS = {
+    'people': ['playerID'],
+    'batting': ['playerID', 'yearID', 'stint'],
+    'pitching': ['playerID', 'yearID', 'stint'],
+    'fielding': ['playerID', 'yearID', 'stint', 'POS'],
+    'fieldingof': ['playerID', 'yearID', 'stint'],
+    'fieldingofsplit': ['playerID', 'yearID', 'stint', 'POS'],
+    'appearances': ['playerID', 'yearID', 'teamID'],
+    'battingpost': ['playerID', 'yearID', 'round'],
+    'pitchingpost': ['playerID', 'yearID', 'round'],
+    'fieldingpost': ['playerID', 'yearID', 'round', 'POS'],
+    'allstarfull': ['playerID', 'yearID', 'gameNum'],
+    'awardsplayers': ['awardID', 'yearID', 'lgID', 'playerID'],
+    'awardsshareplayers': ['awardID', 'yearID', 'lgID', 'playerID'],
+    'awardsmanagers': ['awardID', 'yearID', 'lgID', 'playerID'],
+    'awardssharemanagers': ['awardID', 'yearID', 'lgID', 'playerID'],
+    'halloffame': ['playerID', 'yearid', 'votedBy'],
+    'managers': ['yearID', 'teamID', 'inseason'],
+    'managershalf': ['playerID', 'yearID', 'teamID', 'half'],
+    'teams': ['yearID', 'teamID'],
+    'teamshalf': ['yearID', 'teamID', 'Half'],
+    'teamsfranchises': ['franchID'],
+    'seriespost': ['yearID', 'round'],
+    'salaries': ['yearID', 'teamID', 'playerID'],
+    'collegeplaying': ['playerID', 'schoolID', 'yearID'],
+    'schools': ['schoolID'],
+}
+
+PAGE_SIZE = 8192          # scans of the big stat tables read half as many pages as with the default 4096
+WITHOUT_ROWID_ROWS = 20   # SQLite's advice: WITHOUT ROWID suits tables whose rows are under 1/20 of a page
+
+
+def manifest_path(db_path):
+    return os.path.splitext(db_path)[0] + '.manifest.json'
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_csv(path):
+    """(header, rows) of a CSV file. Older Lahman releases are Latin-1 rather than UTF-8."""
+    for encoding in ('utf-8-sig', 'latin-1'):
+        try:
+            with open(path, newline='', encoding=encoding) as f:
+                rows = list(csv.reader(f))
+            break
+        except UnicodeDecodeError:
+            continue
+    header = [name.strip() for name in rows[0]]
+    return header, [row + [''] * (len(header) - len(row)) for row in rows[1:] if row]
+
+
+def is_integer(value):
+    digits = value[1:] if value[:1] in '+-' else value
+    # a leading zero means a code (like a zip code), not a number
+    return digits.isdigit() and (len(digits) == 1 or digits[0] != '0')
+
+
+def is_real(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return value.strip().lower() not in ('nan', 'inf', '+inf', '-inf', 'infinity', '-infinity')
+
+
+def column_type(values):
+    """INTEGER, REAL or TEXT, the narrowest type that holds every (non-empty) value."""
+    present = [v for v in values if v != '']
+    if present and all(is_integer(v) for v in present):
+        return 'INTEGER'
+    if present and all(is_real(v) for v in present):
+        return 'REAL'
+    return 'TEXT'
+
+
+CONVERTERS = {'INTEGER': int, 'REAL': float, 'TEXT': str}
+
+
+def typed_rows(rows, types):
+    converters = [CONVERTERS[t] for t in types]
+    return [tuple(None if v == '' else convert(v) for convert, v in zip(converters, row)) for row in rows]
+
+
+def primary_key(name, header, rows):
+    """The columns of the table's primary key, or None (with the reason printed) if it doesn't have one."""
+    key = PRIMARY_KEYS.get(name.lower())
+    if key is None:
+        return None
+    positions = {column.lower(): i for i, column in enumerate(header)}
+    missing = [column for column in key if column.lower() not in positions]
+    if missing:
+        print(f'{name}: no primary key, there is no column {", ".join(missing)}')
+        return None
+    indexes = [positions[column.lower()] for column in key]
+    seen = set()
+    for row in rows:
+        values = tuple(row[i] for i in indexes)
+        if None in values or values in seen:
+            print(f'{name}: no primary key, ({", ".join(key)}) = {values} is NULL or repeated')
+            return None
+        seen.add(values)
+    return [header[i] for i in indexes]
+
+
+def load_table(conn, name, header, rows, page_size, source_bytes):
+    """Create and fill one table. Returns its manifest entry."""
+    types = [column_type([row[i] for row in rows]) for i in range(len(header))]
+    rows = typed_rows(rows, types)
+    key = primary_key(name, header, rows)
+    single_integer = key is not None and len(key) == 1 and types[header.index(key[0])] == 'INTEGER'
+    average_row = source_bytes / len(rows) if rows else 0
+    without_rowid = key is not None and not single_integer and average_row * WITHOUT_ROWID_ROWS <= page_size
+
+    columns = [f'"{column}" {column_type_}' for column, column_type_ in zip(header, types)]
+    if key is not None:
+        columns.append('PRIMARY KEY (' + ', '.join(f'"{column}"' for column in key) + ')')
+        # rows in key order fill the b-tree pages sequentially
+        positions = [header.index(column) for column in key]
+        rows.sort(key=lambda row: tuple(row[i] for i in positions))
+    conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    conn.execute(f'CREATE TABLE "{name}" (' + ', '.join(columns) + ')' + (' WITHOUT ROWID' if without_rowid else ''))
+    conn.executemany(f'INSERT INTO "{name}" VALUES (' + ', '.join('?' * len(header)) + ')', rows)
+    print(f'{name}: {len(rows)} rows' + (f', key ({", ".join(key)})' if key else '') +
+          (' WITHOUT ROWID' if without_rowid else ''))
+    return {'rows': len(rows), 'columns': dict(zip(header, types)), 'primary_key': key, 'without_rowid': without_rowid}
+
+
+def content_hash(conn):
+    """Hash of every table's name, columns and rows (in a fixed order), independent of how SQLite laid out the file."""
+    h = hashlib.sha256()
+    names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    for name in names:
+        columns = [(r[1], r[2]) for r in conn.execute(f'PRAGMA table_info("{name}")')]
+        h.update(json.dumps([name, columns]).encode())
+        order = ', '.join(str(i) for i in range(1, len(columns) + 1))
+        for row in conn.execute(f'SELECT * FROM "{name}" ORDER BY {order}'):
+            h.update(repr(row).encode())
+    return h.hexdigest()
+
+
+def build(csv_dirs, db_path, page_size=PAGE_SIZE):
+    """Build the database from the CSV files in csv_dirs. Returns the manifest."""
+    sources = sorted(path for csv_dir in csv_dirs for path in glob.glob(os.path.join(csv_dir, '*.csv')))
+    if not sources:
+        raise SystemExit(f'no CSV files in {", ".join(csv_dirs)}')
+    building = db_path + '.building'
+    if os.path.exists(building):
+        os.remove(building)
+
+    conn = sqlite3.connect(building)
+    tables = {}
+    try:
+        conn.execute(f'PRAGMA page_size = {int(page_size)}')   # only takes effect before the first table is created
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        for path in sources:
+            name = os.path.splitext(os.path.basename(path))[0]
+            header, rows = read_csv(path)
+            tables[name] = load_table(conn, name, header, rows, page_size, os.path.getsize(path))
+            tables[name]['source'] = {'file': os.path.basename(path), 'sha256': file_hash(path)}
+        conn.commit()
+        created = create_indexes(conn, INDEXES)   # and ANALYZE
+        print(f'created {len(created)} indexes')
+    finally:
+        conn.close()
+
+    aggregates.build(building)
+    if aggregates.validate(building):
+        raise SystemExit('the summary tables do not match their definitions, see above')
+
+    conn = sqlite3.connect(building)
+    try:
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.execute('VACUUM')
+        manifest = {
+            'page_size': conn.execute('PRAGMA page_size').fetchone()[0],
+            'sqlite_version': sqlite3.sqlite_version,
+            'tables': tables,
+            'indexes': conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0],
+            'content_sha256': content_hash(conn),
+        }
+    finally:
+        conn.close()
+
+    manifest['bytes'] = os.path.getsize(building)
+    os.replace(building, db_path)
+    with open(manifest_path(db_path), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'built {db_path}: {len(tables)} tables, {manifest["bytes"] / 1024 / 1024:.1f} MiB, '
+          f'content {manifest["content_sha256"][:16]}')
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the baseball database from the Lahman CSV files')
+    parser.add_argument('--csv', action='append', required=True,
+                        help='directory of Lahman CSV files (repeat for core and contrib)')
+    parser.add_argument('--db', default='baseball_db.db')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    args = parser.parse_args()
+    build(args.csv, args.db, page_size=args.page_size)
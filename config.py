@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Settings for the chatbot. Everything can be overridden with an environment variable of the same name,
+see the Configuration section of the README.
+"""
+
+import os
+
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')   # you need to put your Open AI key in an environment variable in your OS
+
+GPT_MODEL = os.environ.get('GPT_MODEL', 'gpt-4o-mini')   # the model that writes the SQL
+
+MODEL_ROUTING = os.environ.get('MODEL_ROUTING', '1') == '1'        # send easy questions to FAST_MODEL, hard ones (and failed fast answers) to STRONG_MODEL
+FAST_MODEL = os.environ.get('FAST_MODEL', GPT_MODEL)               # the cheap model most questions go to
+STRONG_MODEL = os.environ.get('STRONG_MODEL', 'gpt-4o')            # the model for hard questions and escalations
+ROUTE_MAX_WORDS = int(os.environ.get('ROUTE_MAX_WORDS', 20))       # longer questions go to the strong model
+ROUTE_MAX_TABLES = int(os.environ.get('ROUTE_MAX_TABLES', 2))      # so do questions that need more tables than this
+ROUTE_MAX_AMBIGUOUS = int(os.environ.get('ROUTE_MAX_AMBIGUOUS', 0))  # and ones with more names matching several players or teams
+
+HEDGE = os.environ.get('HEDGE', '0') == '1'                                   # ask OpenAI for several queries per question and keep the first that returns rows, see hedging.py
+HEDGE_CANDIDATES = int(os.environ.get('HEDGE_CANDIDATES', 2))                 # most queries we ask for per question, the first request included
+HEDGE_DELAY_SECONDS = float(os.environ.get('HEDGE_DELAY_SECONDS', 3))         # wait this long for a query that works before asking for another (0 = ask for them all at once)
+HEDGE_TEMPERATURE = float(os.environ.get('HEDGE_TEMPERATURE', 0.7))           # sampling temperature of the extra requests, so they don't all write the same query
+HEDGE_TOKENS_PER_MINUTE = int(os.environ.get('HEDGE_TOKENS_PER_MINUTE', 50_000))   # cost ceiling: tokens per minute the extra requests may use, more aren't sent (0 = no limit)
+
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', 500))     # OpenAI requests per minute we allow ourselves, 0 = no limit
+LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', 200_000))     # OpenAI tokens per minute (prompt + completion), 0 = no limit
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 30))            # per OpenAI request
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))                       # retries of a request that got a 429 or 5xx
+LLM_MAX_QUEUE_SECONDS = float(os.environ.get('LLM_MAX_QUEUE_SECONDS', 30))        # longest a request waits for the rate limit before failing
+
+QUESTION_CACHE_SIZE = int(os.environ.get('QUESTION_CACHE_SIZE', 1000))          # max number of cached question -> SQL entries
+QUESTION_CACHE_TTL = int(os.environ.get('QUESTION_CACHE_TTL', 7 * 24 * 3600))   # seconds before a cached entry expires
+INTENTS = os.environ.get('INTENTS', '1') == '1'                               # write the SQL for common kinds of question ourselves, see intents.py
+TEMPLATE_CACHE = os.environ.get('TEMPLATE_CACHE', '1') == '1'                 # answer questions like ones we've seen, with other names or numbers, from their SQL
+TEMPLATE_CACHE_SIZE = int(os.environ.get('TEMPLATE_CACHE_SIZE', 1000))          # max number of question shape -> SQL template entries
+QUESTION_CACHE_PRIME_PATHS = [p for p in os.environ.get('QUESTION_CACHE_PRIME_PATHS', '').split(',') if p]   # batch.py output files to load into the question cache at startup
+
+DB_PATH = 'baseball_db.db'   # the .db file for the baseball database must be in the same directory as the python file for the streamlit app
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', 'result_cache.db')   # put this on a shared volume to share results between replicas. Empty string disables the cache
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))                        # number of read-only connections to the database
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))        # bytes of the database file to memory map
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 64 * 1024))        # page cache per connection, in KiB
+DB_STATEMENT_CACHE = int(os.environ.get('DB_STATEMENT_CACHE', 256))          # compiled statements kept per connection
+DB_PREFETCH = os.environ.get('DB_PREFETCH', '1') == '1'                      # read the whole database file at startup so it's in the OS page cache
+
+QUERY_MAX_SECONDS = float(os.environ.get('QUERY_MAX_SECONDS', 10))              # wall clock budget per query
+QUERY_MAX_VM_STEPS = int(os.environ.get('QUERY_MAX_VM_STEPS', 200_000_000))     # SQLite VM instruction budget per query (0 = no limit)
+QUERY_MAX_ROWS = int(os.environ.get('QUERY_MAX_ROWS', 1000))                    # hard cap on rows returned by a query
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', 100_000))               # cap on rows in a CSV export, which re-runs the query without QUERY_MAX_ROWS
+RESULT_PAGE_SIZE = int(os.environ.get('RESULT_PAGE_SIZE', 50))                  # rows per page of a result in the chat
+
+HISTORY_MAX_BYTES = int(os.environ.get('HISTORY_MAX_BYTES', 16 * 1024 * 1024))          # results a session keeps in memory, older ones are spilled to disk
+HISTORY_MAX_MESSAGES = int(os.environ.get('HISTORY_MAX_MESSAGES', 200))                 # messages a session keeps at all
+HISTORY_PREVIEW_ROWS = int(os.environ.get('HISTORY_PREVIEW_ROWS', 10))                  # rows of each result kept in memory whatever happens to the rest
+HISTORY_RENDER_MESSAGES = int(os.environ.get('HISTORY_RENDER_MESSAGES', 20))            # messages rendered on each rerun, earlier ones behind a button
+HISTORY_SPILL_PATH = os.environ.get('HISTORY_SPILL_PATH', '/tmp/baseball_chatbot_history')   # local directory for spilled results
+HISTORY_SPILL_MAX_BYTES = int(os.environ.get('HISTORY_SPILL_MAX_BYTES', 1024 * 1024 * 1024))  # size cap of the spill directory, the oldest results go first
+LARGE_TABLE_ROWS = int(os.environ.get('LARGE_TABLE_ROWS', 20_000))              # tables this big can't be fully scanned inside another full scan
+
+SQL_WORKERS = int(os.environ.get('SQL_WORKERS', DB_POOL_SIZE))                     # threads running queries for the app, more than DB_POOL_SIZE just wait for a connection
+SQL_SESSION_CONCURRENCY = int(os.environ.get('SQL_SESSION_CONCURRENCY', 2))         # most queries one browser session runs at once, the rest wait their turn
+SQL_MAX_QUEUED = int(os.environ.get('SQL_MAX_QUEUED', 64))                          # queries waiting for a worker before new ones are refused (0 = no limit)
+
+COLUMNAR_BACKEND = os.environ.get('COLUMNAR_BACKEND', '1') == '1'                # run big scans on DuckDB, if it's installed and `python backends.py export` has been run
+COLUMNAR_PATH = os.environ.get('COLUMNAR_PATH', 'columnar')                       # directory of the Parquet export
+COLUMNAR_MIN_SCAN_ROWS = int(os.environ.get('COLUMNAR_MIN_SCAN_ROWS', 100_000))    # queries whose plan scans fewer rows than this stay on SQLite
+COLUMNAR_COMPARE = os.environ.get('COLUMNAR_COMPARE', '0') == '1'                 # run routed queries on both engines and log timings and whether results match
+
+SCHEMA_PRUNING = os.environ.get('SCHEMA_PRUNING', '1') == '1'              # only send OpenAI the docs for the tables a question needs
+SCHEMA_MIN_SCORE = int(os.environ.get('SCHEMA_MIN_SCORE', 1))             # below this many keyword matches we aren't confident, and send the full schema
+
+STREAM_RESPONSES = os.environ.get('STREAM_RESPONSES', '1') == '1'   # stream the SQL into the chat as OpenAI writes it
+
+REPAIR_MAX_ATTEMPTS = int(os.environ.get('REPAIR_MAX_ATTEMPTS', 2))              # times we ask OpenAI to fix SQL that doesn't compile (0 = never)
+REPAIR_BUDGET_SECONDS = float(os.environ.get('REPAIR_BUDGET_SECONDS', 20))       # no new repair attempt once this long has passed since the first check
+
+EXAMPLE_PATHS = os.environ.get('EXAMPLE_PATHS', 'examples.jsonl').split(',')   # JSONL files of sample (question, sql) pairs
+EXAMPLES_TOP_K = int(os.environ.get('EXAMPLES_TOP_K', 6))                     # how many of the most similar examples go in each prompt
+
+ENTITY_RESOLUTION = os.environ.get('ENTITY_RESOLUTION', '1') == '1'                   # resolve player/team/award/school names to IDs before asking OpenAI
+ENTITY_MAX_CANDIDATES = int(os.environ.get('ENTITY_MAX_CANDIDATES', 3))                # most IDs we list for one ambiguous name
+ENTITY_FUZZY_THRESHOLD = float(os.environ.get('ENTITY_FUZZY_THRESHOLD', 0.8))          # trigram similarity needed to match a misspelled player name
+
+BATCH_LLM_WORKERS = int(os.environ.get('BATCH_LLM_WORKERS', 8))   # batch.py: concurrent OpenAI requests
+BATCH_SQL_WORKERS = int(os.environ.get('BATCH_SQL_WORKERS', 4))   # batch.py: concurrent database queries, keep it at or below DB_POOL_SIZE
+
+QUERY_LOG_PATH = os.environ.get('QUERY_LOG_PATH', '')   # if set, every query we execute is logged here for the index advisor (python indexes.py advise)
+
+TRACE_LOG = os.environ.get('TRACE_LOG', '-')                 # one JSON line per question with the time spent in each stage: '-' for stdout, a file path, or empty to turn off
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))      # Prometheus metrics are served on http://<host>:METRICS_PORT/metrics (0 = off)
+
+READY_FILE = os.environ.get('READY_FILE', '/tmp/baseball_chatbot_ready.json')   # written by resources.warm_resources in the server process, with the startup time report
+HEALTH_URL = os.environ.get('HEALTH_URL', 'http://localhost:8501/_stcore/health')
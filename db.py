@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool of read-only connections to the baseball database.
+
+Every connection is opened with mode=ro and immutable=1 and has query_only switched on, so nothing the LLM generates
+can ever write to the database. Each thread borrows its own connection for the duration of a query, so concurrent
+sessions read in parallel instead of contending on one shared handle.
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded pool of read-only SQLite connections. Use it as `with pool.connection() as conn: ...`"""
+
+    def __init__(self, db_path, size=4, mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024, timeout=30,
+                 cached_statements=256):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.timeout = timeout          # seconds to wait for a free connection before giving up
+        self.cached_statements = cached_statements   # queries run with bound parameters reuse these, see templates.py
+        self._idle = queue.LifoQueue()  # LIFO so the most recently used (warmest) connection is handed out first
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _open(self):
+        uri = f'file:{quote(self.db_path)}?mode=ro&immutable=1'
+        # check_same_thread=False lets a connection move between threads, the pool makes sure only one uses it at a time
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.cached_statements)
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size_kb)}')   # negative means KiB rather than pages
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolExhausted(f'no database connection free after {self.timeout} seconds') from None
+
+    @contextmanager
+    def connection(self):
+        # re-entrant: if this thread already holds a connection, keep using it
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    def warmup(self):
+        """Open every connection up front and touch the schema, so the first user doesn't pay for it."""
+        conns = [self._acquire() for _ in range(self.size)]
+        try:
+            for conn in conns:
+                conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        finally:
+            for conn in conns:
+                self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
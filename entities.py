@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resolves the names in a question (players, teams, awards, schools) to the IDs the database uses, before we ask OpenAI.
+
+The index is built once from People, Teams/TeamsFranchises, AwardsPlayers and Schools. Exact matches are found by
+walking a token trie over the question, which takes microseconds. Player names that don't match exactly (typos,
+missing accents) fall back to a character trigram index. The matches are added to the prompt, so the LLM doesn't
+have to guess 'TOR' or 'Gold Glove', and doesn't need a subquery on People to find a playerID.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict, namedtuple
+
+Entity = namedtuple('Entity', 'kind id label')        # kind is one of player, team, award, school. label may be ''
+Mention = namedtuple('Mention', 'text start end entities')   # start/end are token positions in the question
+
+# extra ways people refer to awards, on top of the awardIDs themselves
+AWARD_ALIASES = {
+    'mvp': 'Most Valuable Player',
+    'league mvp': 'Most Valuable Player',
+    'most valuable player award': 'Most Valuable Player',
+    'cy young': 'Cy Young Award',
+    'golden glove': 'Gold Glove',
+    'all star mvp': 'All-Star Game MVP',
+    'all star game mvp': 'All-Star Game MVP',
+    'rookie of the year award': 'Rookie of the Year',
+}
+
+# words that show up in school names but mean nothing on their own
+SCHOOL_FILLER = {'university', 'college', 'of', 'the', 'at', 'community', 'junior'}
+
+# last words of old team names that are too common to mean that team on their own
+NOT_NICKNAMES = {'americans', 'anaheim', 'blues', 'city', 'citys', 'pepper', 'stars'}
+
+# words of team and league names that say nothing about which team: "National League" is no more the Nationals than
+# "Union League" is a team called the League. A team name variant made only of these isn't indexed
+GENERIC_WORDS = {'league', 'leagues', 'national', 'american', 'federal', 'union', 'association', 'players', 'major',
+                 'base', 'ball', 'baseball', 'club', 'team', 'teams', 'world', 'series', 'all', 'star', 'new', 'north',
+                 'south', 'east', 'west', 'western', 'eastern'}
+
+YEARS = range(1871, 2100)
+
+FUZZY_KINDS = {'player'}
+
+ID_COLUMNS = {'player': 'playerID', 'team': 'teamID', 'award': 'awardID', 'school': 'schoolID'}
+
+
+def normalize(text):
+    """Lower case ASCII words, so 'Peña' matches 'Pena' and 'Blue-Jays' matches 'Blue Jays'."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+    text = re.sub(r"'s\b", '', text)
+    return re.sub(r'[^a-z0-9]+', ' ', text).split()
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def team_name_tokens(name):
+    """The words of a team name, without the "(Union League)" some old names are told apart by."""
+    return normalize(re.sub(r'\([^)]*\)', ' ', name))
+
+
+def singular(tokens):
+    last = tokens[-1]
+    if len(last) > 3 and last.endswith('s') and not last.endswith('ss'):
+        return tokens[:-1] + [last[:-1]]
+    return None
+
+
+class EntityIndex:
+
+    def __init__(self, max_candidates=3, fuzzy_threshold=0.8):
+        self.max_candidates = max_candidates
+        self.fuzzy_threshold = fuzzy_threshold
+        self._trie = {}
+        self._fuzzy_names = []                     # (name, entity) for the fuzzy index
+        self._trigram_postings = defaultdict(list)  # trigram -> indexes into _fuzzy_names
+        self._team_years = {}                       # teamID -> (first year, last year)
+
+    def add(self, phrase, entity):
+        tokens = normalize(phrase) if isinstance(phrase, str) else phrase
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        entities = node.setdefault(None, [])
+        if any(e.kind == entity.kind and e.id == entity.id for e in entities):
+            return
+        entities.append(entity)
+        if entity.kind in FUZZY_KINDS and len(tokens) > 1:
+            index = len(self._fuzzy_names)
+            name = ' '.join(tokens)
+            self._fuzzy_names.append((name, entity))
+            for gram in trigrams(name):
+                self._trigram_postings[gram].append(index)
+
+    @classmethod
+    def from_database(cls, conn, **kwargs):
+        index = cls(**kwargs)
+        columns = lambda table: {r[1].lower(): r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+        if columns('People'):
+            # longest careers first, so when several players share a name the best known ones come first
+            rows = conn.execute("""SELECT playerID, nameFirst, nameLast, substr(debut, 1, 4), substr(finalGame, 1, 4)
+                                   FROM People WHERE nameLast IS NOT NULL
+                                   ORDER BY CAST(substr(finalGame, 1, 4) AS INTEGER) - CAST(substr(debut, 1, 4) AS INTEGER) DESC""")
+            for player_id, first, last, debut, final in rows:
+                name = f'{first or ""} {last}'.strip()
+                years = f', {debut}-{final}' if debut and final else ''
+                index.add(name, Entity('player', player_id, name + years))
+
+        if columns('Teams'):
+            # every name each teamID played under, and when: "Brooklyn Dodgers" and "Brooklyn Robins" are both BRO
+            names = defaultdict(dict)         # name -> {teamID: (first year, last year)}
+            franchises = defaultdict(dict)    # franchID -> {teamID: last year}
+            for team_id, name, franch_id, first, last in conn.execute(
+                    'SELECT teamID, name, franchID, min(yearID), max(yearID) FROM Teams GROUP BY teamID, name, franchID'):
+                years = index._team_years.get(team_id, (first, last))
+                index._team_years[team_id] = (min(years[0], first), max(years[1], last))
+                if name:
+                    names[name][team_id] = (first, last)
+                franchises[franch_id][team_id] = last
+            if columns('TeamsFranchises'):
+                # a franchise name none of its teams played under means its latest team
+                for franch_id, franch_name in conn.execute('SELECT franchID, franchName FROM TeamsFranchises'):
+                    teams = franchises.get(franch_id)
+                    if franch_name and teams and franch_name not in names:
+                        latest = max(teams, key=teams.get)
+                        names[franch_name][latest] = index._team_years[latest]
+
+            # "Toronto Blue Jays" is also "Blue Jays", "Blue Jay", "Jays" and "Jay". A one word variant has to be a
+            # nickname: not a generic word, and the last word of more team names than it's a word inside of
+            # ("Pittsburgh" ends "Chicago/Pittsburgh" but starts all the Pirates' names, so it's a city)
+            tokens_of = {name: team_name_tokens(name) for name in names}
+            last_words, inner_words = defaultdict(int), defaultdict(int)
+            for tokens in tokens_of.values():
+                if tokens:
+                    last_words[tokens[-1]] += 1
+                for token in set(tokens[:-1]):
+                    inner_words[token] += 1
+            for name, teams in names.items():
+                tokens = tokens_of[name]
+                if not tokens:
+                    continue
+                variants = [tokens] + [tokens[-n:] for n in (1, 2) if len(tokens) > n]
+                variants += [s for s in (singular(v) for v in list(variants)) if s]
+                nickname = last_words[tokens[-1]] > inner_words[tokens[-1]]
+                variants = [v for v in variants if any(token not in GENERIC_WORDS for token in v) and
+                            (len(v) > 1 or (nickname and len(v[0]) > 3 and v[0] not in NOT_NICKNAMES))]
+                # most recent first, "Orioles" should be BAL before the 1901 team that became the Yankees
+                for team_id in sorted(teams, key=lambda t: -teams[t][1]):
+                    first, last = teams[team_id]
+                    entity = Entity('team', team_id, f'{name}, {first}-{last}')
+                    for variant in variants:
+                        index.add(variant, entity)
+
+        if columns('AwardsPlayers'):
+            award_ids = [r[0] for r in conn.execute('SELECT DISTINCT awardID FROM AwardsPlayers') if r[0]]
+            for award_id in award_ids:
+                entity = Entity('award', award_id, '')
+                tokens = normalize(award_id)
+                index.add(tokens, entity)
+                if tokens[-1] == 'award' and len(tokens) > 1:
+                    index.add(tokens[:-1], entity)
+            for alias, award_id in AWARD_ALIASES.items():
+                if award_id in award_ids:
+                    index.add(alias, Entity('award', award_id, ''))
+
+        schools = columns('Schools')
+        if schools:
+            name_column = schools.get('name_full') or schools.get('schoolname')
+            if name_column:
+                for school_id, name in conn.execute(f'SELECT schoolID, "{name_column}" FROM Schools'):
+                    if not name:
+                        continue
+                    entity = Entity('school', school_id, name)
+                    tokens = normalize(name)
+                    index.add(tokens, entity)
+                    short = [t for t in tokens if t not in SCHOOL_FILLER]
+                    if short and short != tokens:
+                        index.add(short, entity)
+        return index
+
+    def _fuzzy(self, tokens):
+        name = ' '.join(tokens)
+        grams = trigrams(name)
+        counts = defaultdict(int)
+        for gram in grams:
+            postings = self._trigram_postings.get(gram, ())
+            if len(postings) > 5000:
+                continue   # too common to narrow anything down, the exact score below still counts it
+            for i in postings:
+                counts[i] += 1
+        best = []
+        for i, shared in counts.items():
+            if shared < 2:
+                continue
+            candidate, entity = self._fuzzy_names[i]
+            other = trigrams(candidate)
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= self.fuzzy_threshold:
+                best.append((score, entity))
+        best.sort(key=lambda r: -r[0])
+        return [entity for _, entity in best[:self.max_candidates]]
+
+    def during(self, entities, years):
+        """The teams among entities that played in one of these years, or all of them if none did (or no years)."""
+        if not years:
+            return entities
+        playing = [e for e in entities if e.kind != 'team' or
+                   any(self._team_years.get(e.id, (0, 0))[0] <= year <= self._team_years.get(e.id, (0, 0))[1]
+                       for year in years)]
+        return playing or entities
+
+    def resolve(self, question):
+        """Find the entities mentioned in a question. Returns a list of Mentions, longest match first at each position.
+        A team name several teams have had means the ones that played in the years the question asks about, if it
+        has any: the "Orioles" of 1901 are BLA, of 1990 BAL."""
+        words = question.split()
+        tokens, capitalized = [], []
+        for word in words:
+            for token in normalize(word):
+                tokens.append(token)
+                capitalized.append(word[:1].isupper())
+        years = [int(token) for token in tokens if token.isdigit() and int(token) in YEARS]
+        mentions = []
+        i = 0
+        while i < len(tokens):
+            node, match_end, match = self._trie, None, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    match_end, match = j + 1, node[None]
+            if match:
+                match = self.during(match, years) if len(match) > 1 else match
+                mentions.append(Mention(' '.join(tokens[i:match_end]), i, match_end, match[:self.max_candidates]))
+                i = match_end
+                continue
+            # a capitalized pair we don't know might be a misspelled player name
+            if i + 1 < len(tokens) and capitalized[i] and capitalized[i + 1] and self._fuzzy_names:
+                found = self._fuzzy(tokens[i:i + 2])
+                if found:
+                    mentions.append(Mention(' '.join(tokens[i:i + 2]), i, i + 2, found))
+                    i += 2
+                    continue
+            i += 1
+        return mentions
+
+
+def describe(mentions):
+    """The text we add to the prompt for these mentions, or '' if there aren't any."""
+    if not mentions:
+        return ''
+    lines = ['Names in this question, resolved against the database. Use these IDs in the query rather than looking up names:']
+    for mention in mentions:
+        options = ' or '.join(f"{ID_COLUMNS[e.kind]} '{e.id}'" + (f' ({e.label})' if e.label else '')
+                              for e in mention.entities)
+        lines.append(f'- "{mention.text}": {options}')
+    return '\n'.join(lines)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Store of sample (question, SQL) pairs for the prompt, with a small BM25 index over the questions so that each request
+only carries the few examples most similar to what the user asked. The prompt stays the same size however many
+examples we collect.
+
+Examples live in JSONL files, one {"question": ..., "sql": ...} per line. examples.jsonl holds the hand-written ones;
+more can be harvested from any JSONL file with question/sql fields (e.g. the output of a batch run):
+
+    python examples.py harvest results.jsonl [more.jsonl ...] --out examples_extra.jsonl [--db baseball_db.db]
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+from collections import Counter, defaultdict
+
+from query_cache import normalize_question
+
+
+def tokenize(text):
+    # crude stemming so "homers"/"homer" and "awards"/"award" match
+    return [w[:-1] if len(w) > 3 and w.endswith('s') and not w.endswith('ss') else w
+            for w in normalize_question(text).split()]
+
+
+def read_examples(path):
+    examples = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if entry.get('question') and entry.get('sql'):
+                examples.append((entry['question'], entry['sql']))
+    return examples
+
+
+class ExampleStore:
+    """(question, SQL) examples plus a BM25 index over their questions."""
+
+    def __init__(self, examples=(), k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.examples = []
+        self._seen = set()
+        self._postings = defaultdict(list)   # term -> [(example index, term frequency)]
+        self._lengths = []
+        for question, sql in examples:
+            self.add(question, sql)
+
+    @classmethod
+    def from_files(cls, paths):
+        examples = []
+        for path in paths:
+            examples.extend(read_examples(path))
+        return cls(examples)
+
+    def add(self, question, sql):
+        """Add an example, unless we already have one for the same (normalized) question. Returns True if added."""
+        key = normalize_question(question)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        index = len(self.examples)
+        self.examples.append((question, sql))
+        terms = tokenize(question)
+        self._lengths.append(len(terms))
+        for term, count in Counter(terms).items():
+            self._postings[term].append((index, count))
+        return True
+
+    def __len__(self):
+        return len(self.examples)
+
+    def top_k(self, question, k=6):
+        """The k examples whose questions are most similar to this one, best first.
+        Ties (including questions that share no words with any example) keep the order examples were added in."""
+        n = len(self.examples)
+        if n == 0 or k <= 0:
+            return []
+        average_length = sum(self._lengths) / n or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(question)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self._lengths[index] / average_length)
+                scores[index] += idf * tf * (self.k1 + 1) / norm
+        ranked = sorted(range(n), key=lambda i: (-scores.get(i, 0.0), i))
+        return [self.examples[i] for i in ranked[:k]]
+
+
+def harvest(paths, out_path, db_path=None):
+    """Collect (question, sql) pairs that ran without error from JSONL files into an examples file.
+    With db_path, only keep SQL that still compiles against that database."""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) if db_path else None
+    store = ExampleStore.from_files([out_path]) if os.path.exists(out_path) else ExampleStore()
+    added = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                question, sql = entry.get('question'), entry.get('sql')
+                if not question or not sql or entry.get('error'):
+                    continue
+                if conn is not None:
+                    try:
+                        conn.execute('EXPLAIN ' + sql)
+                    except sqlite3.Error:
+                        continue
+                if store.add(question, sql):
+                    with open(out_path, 'a', encoding='utf-8') as out:
+                        out.write(json.dumps({'question': question, 'sql': sql}) + '\n')
+                    added += 1
+    print(f'added {added} examples to {out_path}, which now has {len(store)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the sample queries used in the prompt')
+    sub = parser.add_subparsers(dest='command', required=True)
+    harvest_parser = sub.add_parser('harvest', help='add successful question/sql pairs from JSONL files to an examples file')
+    harvest_parser.add_argument('paths', nargs='+')
+    harvest_parser.add_argument('--out', default='examples_extra.jsonl')
+    harvest_parser.add_argument('--db', default=None, help='only keep SQL that compiles against this database')
+    args = parser.parse_args()
+    harvest(args.paths, args.out, args.db)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs the SQL half of each question (pipeline.run_sql) on a bounded pool of worker threads instead of the Streamlit
+script thread, so a long query doesn't freeze the session's UI and can be stopped.
+
+Scheduling is fair between sessions: every session has its own queue, at most per_session of its queries run at once,
+and a free worker takes the next query from each session in turn. A user with a burst of expensive queries waits
+behind their own queries, not everyone else's. Once max_queued queries are waiting, submit refuses new work
+(ExecutorBusy) rather than letting the queue grow without bound.
+
+Job.cancel() stops a query: a queued job is dropped, and a running one has the connections it registered with
+interruptible() interrupted (sqlite3.Connection.interrupt, or DuckDB's cursor.interrupt) and raises QueryCancelled.
+A job that runs queries on threads of its own runs each of them as a Subtask, which is stopped along with the job.
+"""
+
+import contextvars
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import tracing
+
+_current_job = contextvars.ContextVar('job', default=None)
+
+
+class ExecutorBusy(Exception):
+    """Raised by submit when the queue is full."""
+
+
+class QueryCancelled(Exception):
+    """Raised in a job that was cancelled, in place of whatever error the interrupt caused."""
+
+    def __init__(self, message='the query was stopped'):
+        super().__init__(message)
+
+
+class Job:
+
+    _ids = itertools.count(1)
+
+    def __init__(self, executor, session, fn, args, kwargs):
+        self.id = next(self._ids)
+        self.session = session
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.cancelled = False
+        self._executor = executor
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._context = contextvars.copy_context()   # so the job runs in the submitter's trace
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._interruptibles = []
+
+    def cancel(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self.cancelled = True
+            targets = list(self._interruptibles)
+        for target in targets:
+            target.interrupt()
+        self._executor._drop(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the job to finish. Returns whether it has."""
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """What the job's function returned, or raise what it raised (QueryCancelled if it was cancelled)."""
+        self._done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def _finish(self, result=None, error=None):
+        self._result, self._error = result, error
+        self._done.set()
+
+    def _run(self):
+        self.started = time.perf_counter()
+        tracing.METRICS.observe('chatbot_sql_queue_seconds', self.started - self.submitted)
+
+        def call():
+            _current_job.set(self)
+            tracing.annotate_request(queue_seconds=round(self.started - self.submitted, 6))
+            return self._fn(*self._args, **self._kwargs)
+
+        try:
+            result = self._context.run(call)
+        except Exception as e:
+            self._finish(error=e)
+        else:
+            self._finish(result=result)
+
+    def _register(self, target):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled()
+            self._interruptibles.append(target)
+
+    def _unregister(self, target):
+        with self._lock:
+            self._interruptibles.remove(target)
+
+
+class Subtask:
+    """Part of the current job that runs on another thread, like one of several candidate queries (hedging.py).
+    interruptible() inside it registers with the job as well, so cancel() stops just this part and Job.cancel() all of
+    it. Create it on the job's thread, then run(fn, ...) on the other one. Outside the executor only cancel() stops
+    it."""
+
+    def __init__(self):
+        self.job = _current_job.get()
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._interruptibles = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled or (self.job is not None and self.job.cancelled)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            targets = list(self._interruptibles)
+        for target in targets:
+            target.interrupt()
+
+    def run(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) on this thread, as part of the subtask."""
+        token = _current_job.set(self)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_job.reset(token)
+
+    def _register(self, target):
+        with self._lock:
+            if self._cancelled:
+                raise QueryCancelled()
+            self._interruptibles.append(target)
+        if self.job is not None:
+            try:
+                self.job._register(target)
+            except QueryCancelled:
+                with self._lock:
+                    self._interruptibles.remove(target)
+                raise
+
+    def _unregister(self, target):
+        if self.job is not None:
+            self.job._unregister(target)
+        with self._lock:
+            self._interruptibles.remove(target)
+
+
+def current_job():
+    """The job running on this thread, or None outside the executor."""
+    return _current_job.get()
+
+
+def check_cancelled():
+    """Raise QueryCancelled if the current job has been cancelled."""
+    job = _current_job.get()
+    if job is not None and job.cancelled:
+        raise QueryCancelled()
+
+
+@contextmanager
+def interruptible(target):
+    """Let Job.cancel() interrupt target (anything with an interrupt() method) while the block runs. The error the
+    interrupt causes comes out as QueryCancelled. Does nothing outside the executor."""
+    job = _current_job.get()
+    if job is None:
+        yield target
+        return
+    job._register(target)
+    try:
+        yield target
+    except Exception as e:
+        if job.cancelled and not isinstance(e, QueryCancelled):
+            raise QueryCancelled() from e
+        raise
+    finally:
+        job._unregister(target)
+
+
+class QueryExecutor:
+    """Worker threads that run submitted jobs, round robin between sessions. Use it as
+    `job = executor.submit(session, fn, *args)`, then `job.result()`."""
+
+    def __init__(self, workers=8, per_session=2, max_queued=64):
+        self.workers = workers
+        self.per_session = per_session
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queues = {}        # session -> deque of jobs waiting to run
+        self._order = deque()    # sessions with waiting jobs, the next one to be served first
+        self._running = {}       # session -> number of its jobs running
+        self._queued = 0
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f'sql-{i}', daemon=True).start()
+
+    def submit(self, session, fn, *args, **kwargs):
+        with self._cond:
+            if self.max_queued and self._queued >= self.max_queued:
+                tracing.count('chatbot_sql_rejected_total')
+                raise ExecutorBusy(f'{self._queued} queries are already waiting to run, try again in a moment')
+            job = Job(self, session, fn, args, kwargs)
+            if session not in self._queues:
+                self._queues[session] = deque()
+                self._order.append(session)
+            self._queues[session].append(job)
+            self._queued += 1
+            self._update_gauges()
+            self._cond.notify()
+        return job
+
+    def stats(self, session=None):
+        """How busy the executor is, and (given a session) how much of that is the session's own work."""
+        with self._cond:
+            stats = {'workers': self.workers, 'queued': self._queued, 'running': sum(self._running.values())}
+            if session is not None:
+                stats['session_queued'] = len(self._queues.get(session, ()))
+                stats['session_running'] = self._running.get(session, 0)
+        return stats
+
+    def _next(self):
+        """The next job to run: the first waiting job of the first session in turn that is under its limit."""
+        for _ in range(len(self._order)):
+            session = self._order.popleft()
+            pending = self._queues[session]
+            if self._running.get(session, 0) < self.per_session:
+                job = pending.popleft()
+                if pending:
+                    self._order.append(session)
+                else:
+                    del self._queues[session]
+                return job
+            self._order.append(session)
+        return None
+
+    def _drop(self, job):
+        """Take a cancelled job out of its queue, if it hasn't started yet."""
+        with self._cond:
+            pending = self._queues.get(job.session)
+            if pending is None or job not in pending:
+                return
+            pending.remove(job)
+            if not pending:
+                del self._queues[job.session]
+                self._order.remove(job.session)
+            self._queued -= 1
+            self._update_gauges()
+        job._finish(error=QueryCancelled())
+
+    def _update_gauges(self):
+        tracing.METRICS.set('chatbot_sql_queued', self._queued)
+        tracing.METRICS.set('chatbot_sql_running', sum(self._running.values()))
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next()
+                self._queued -= 1
+                self._running[job.session] = self._running.get(job.session, 0) + 1
+                self._update_gauges()
+            try:
+                job._run()
+            finally:
+                with self._cond:
+                    self._running[job.session] -= 1
+                    if not self._running[job.session]:
+                        del self._running[job.session]
+                    self._update_gauges()
+                    self._cond.notify_all()   # the session may have been waiting on its limit
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Query governor: keeps a single bad LLM-generated query from pinning a core or eating all our memory.
+
+Before a query runs we look at its EXPLAIN QUERY PLAN and refuse plans that nest full scans of big tables inside each
+other (the cartesian joins across Batting/Appearances/AwardsPlayers the LLM sometimes writes). While it runs, a SQLite
+progress handler enforces a wall clock and VM step budget. When it returns, only the first max_rows rows are fetched,
+into an Arrow table (see results.py).
+"""
+
+import re
+import time
+
+from results import fetch_table
+
+# words that can follow a table name in a FROM/JOIN clause but aren't an alias
+_NOT_ALIASES = {'on', 'using', 'where', 'join', 'inner', 'left', 'right', 'full', 'outer', 'cross', 'natural',
+                'group', 'order', 'limit', 'having', 'union', 'except', 'intersect', 'window', 'as'}
+_FROM_JOIN_RE = re.compile(r'\b(?:FROM|JOIN)\b', re.IGNORECASE)
+_TABLE_REF_RE = re.compile(r'\s*["`\[]?(\w+)["`\]]?(?:\s+(?:AS\s+)?(\w+))?\s*', re.IGNORECASE)
+# a result column that is a column of a table, or an aggregate of one: HR, b.HR, SUM(HR), max(DISTINCT b.HR)
+_RESULT_COLUMN_RE = re.compile(r'(?:(?:sum|total|avg|min|max)\(\s*(?:DISTINCT\s+)?)?(?:\w+\.)?(\w+)\s*\)?', re.IGNORECASE)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when the governor refuses or stops a query. Distinct from the sqlite3 errors a bad query raises."""
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind   # 'plan', 'time' or 'steps'
+
+
+def table_aliases(query):
+    """Map every table name and alias used in a FROM/JOIN clause to the (lower case) table name."""
+    aliases = {}
+    for keyword in _FROM_JOIN_RE.finditer(query):
+        pos = keyword.end()
+        while True:
+            ref = _TABLE_REF_RE.match(query, pos)   # a subquery in parentheses doesn't match, which is what we want
+            if ref is None:
+                break
+            table, alias = ref.groups()
+            aliases[table.lower()] = table.lower()
+            if alias and alias.lower() not in _NOT_ALIASES:
+                aliases[alias.lower()] = table.lower()
+            if not query.startswith(',', ref.end()):   # old style comma join, "FROM Batting b, Appearances a"
+                break
+            pos = ref.end() + 1
+    return aliases
+
+
+class QueryGovernor:
+
+    def __init__(self, max_seconds=10.0, max_vm_steps=200_000_000, max_rows=1000,
+                 large_table_rows=20_000, check_every=10_000):
+        self.max_seconds = max_seconds
+        self.max_vm_steps = max_vm_steps
+        self.max_rows = max_rows
+        self.large_table_rows = large_table_rows
+        self.check_every = check_every   # VM instructions between progress handler calls
+        self._table_rows = None
+        self._large_tables = None
+        self._column_types = None
+
+    def table_rows(self, conn):
+        """{table name (lower case): row count}. Counted once, the database is read only."""
+        if self._table_rows is None:
+            names = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+            self._table_rows = {name.lower(): conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+        return self._table_rows
+
+    def large_tables(self, conn):
+        """Names (lower case) of the tables with at least large_table_rows rows."""
+        if self._large_tables is None:
+            self._large_tables = {name for name, rows in self.table_rows(conn).items() if rows >= self.large_table_rows}
+        return self._large_tables
+
+    def column_types(self, conn):
+        """{table name (lower case): {column name (lower case): declared type}}. Read once, like table_rows."""
+        if self._column_types is None:
+            self._column_types = {name: {r[1].lower(): r[2] for r in conn.execute(f'PRAGMA table_info("{name}")')}
+                                  for name in self.table_rows(conn)}
+        return self._column_types
+
+    def declared_types(self, conn, query, names):
+        """The declared type of each result column that is a column of one of the query's tables, or an aggregate of
+        one, by name, and None for the rest. sqlite3 doesn't give us SQLite's own column_decltype, which has no type
+        for SUM(HR) anyway."""
+        tables = self.column_types(conn)
+        columns = [tables.get(table, {}) for table in sorted(set(table_aliases(query).values()))]
+        types = []
+        for name in names:
+            match = _RESULT_COLUMN_RE.fullmatch(name.strip())
+            column = match.group(1).lower() if match else None
+            types.append(next((found[column] for found in columns if column in found), None))
+        return types
+
+    def check_plan(self, conn, query, params=()):
+        """Raise QueryBudgetExceeded if the plan nests two or more full scans of large tables in the same loop."""
+        large = self.large_tables(conn)
+        aliases = table_aliases(query)
+        scans = {}   # parent plan node -> large tables scanned directly under it
+        for node_id, parent, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + query, params):
+            if not detail.startswith('SCAN '):
+                continue
+            name = detail.split()[1].lower()
+            table = aliases.get(name, name)
+            if table in large:
+                scans.setdefault(parent, []).append(table)
+        for tables in scans.values():
+            if len(tables) > 1:
+                raise QueryBudgetExceeded('plan', 'the query would join full scans of ' + ' x '.join(tables) +
+                                          ' without an index. Try adding a join condition on playerID/yearID/teamID.')
+
+    def execute(self, conn, query, max_rows=None, params=()):
+        """Run a query (with params bound to its ? placeholders) under the governor's budgets. Returns
+        (table, truncated), a pyarrow Table of at most max_rows (by default self.max_rows) rows."""
+        self.check_plan(conn, query, params)
+        max_rows = max_rows or self.max_rows
+
+        started = time.monotonic()
+        state = {'steps': 0, 'violation': None}
+
+        def progress():
+            state['steps'] += self.check_every
+            if self.max_vm_steps and state['steps'] > self.max_vm_steps:
+                state['violation'] = QueryBudgetExceeded('steps', f'the query did more than {self.max_vm_steps:,} steps of work and was stopped')
+                return 1
+            if self.max_seconds and time.monotonic() - started > self.max_seconds:
+                state['violation'] = QueryBudgetExceeded('time', f'the query ran longer than {self.max_seconds} seconds and was stopped')
+                return 1
+            return 0
+
+        conn.set_progress_handler(progress, self.check_every)
+        try:
+            cursor = conn.execute(query, params)
+            names = [d[0] for d in cursor.description or ()]
+            table, truncated = fetch_table(cursor, max_rows, declared_types=self.declared_types(conn, query, names))
+            cursor.close()
+        except Exception:
+            if state['violation'] is not None:
+                raise state['violation'] from None
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        return table, truncated
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Container readiness check, used by the Dockerfile HEALTHCHECK: the streamlit server process has built its resources
+(resources.warm_resources writes READY_FILE) and streamlit's own health endpoint answers. Only uses the standard library so it's cheap to run.
+"""
+
+import os
+import sys
+import urllib.request
+
+from config import READY_FILE, HEALTH_URL
+
+
+def main():
+    if not os.path.exists(READY_FILE):
+        print(f'not ready: {READY_FILE} does not exist yet, warmup has not finished')
+        return 1
+    try:
+        with urllib.request.urlopen(HEALTH_URL, timeout=5) as response:
+            if response.status != 200:
+                print(f'not ready: {HEALTH_URL} returned {response.status}')
+                return 1
+    except OSError as e:
+        print(f'not ready: {HEALTH_URL} failed: {e}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hedged SQL generation. One request to OpenAI writes one query, and when the request is slow, or its query doesn't
+compile, fails or returns nothing, the question takes as long again. With HEDGE on, a question that goes to OpenAI gets
+up to `candidates` queries instead:
+
+    requests    the first request goes out at once, and each of the others delay_seconds after the one before it,
+                or as soon as every request so far has come back without a query that works (a delay of 0 sends them
+                all at once). The extra requests sample at `temperature` with a seed each, so they aren't coalesced
+                with the first one (llm.py) and don't all write the same query.
+    running     pipeline.run_sql runs each query as it arrives, on a connection of its own from the pool, while the
+                others are still being written or run.
+    winner      the first query that runs without error and returns rows is the answer. The queries still running are
+                interrupted and the requests not sent yet never are. A request already sent can't be called back,
+                its query is dropped when it arrives.
+
+The extra requests are capped by tokens_per_minute (of estimated tokens, see llm.estimate_tokens): a request that
+doesn't fit isn't sent, and the question makes do with the queries it has. If none of them works, the first one to
+arrive goes through the usual repair and escalation.
+"""
+
+import contextvars
+import threading
+import time
+
+import tracing
+from executor import Subtask, check_cancelled
+from llm import TokenBucket, estimate_tokens
+
+
+class Candidate:
+    """One query the model wrote for the question."""
+
+    def __init__(self, index, sql):
+        self.index = index   # which request wrote it, 0 is the first one
+        self.sql = sql
+        self.task = None     # the Subtask running it
+        self.outcome = None  # what running it returned
+        self.error = None    # or the exception it raised
+        self.done = False
+
+
+class Hedge:
+    """The requests and candidate queries of one question. Hedger.start() makes one and sends its first request."""
+
+    def __init__(self, hedger, ask, tokens):
+        self._hedger = hedger
+        self._ask = ask
+        self._tokens = tokens
+        self._cond = threading.Condition()
+        self.candidates = []   # in the order they arrived
+        self.winner = None
+        self.sent = 0
+        self._returned = 0
+        self._running = 0
+        self._errors = {}      # request index -> the exception it raised
+        self._exhausted = False
+        self._stopped = False
+        self._recorded = False
+        context = contextvars.copy_context()   # so the requests count their tokens in the question's trace
+        threading.Thread(target=context.run, args=(self._send,), name='hedge', daemon=True).start()
+
+    def _idle(self):
+        """Every request sent has come back, and none of the queries they wrote is left to try."""
+        return self._returned == self.sent and all(candidate.done for candidate in self.candidates)
+
+    def _done(self):
+        """A candidate has won, or we've given up on this question's candidates."""
+        return self._stopped or self.winner is not None
+
+    def _finished(self):
+        return self._exhausted and self._returned == self.sent
+
+    def _send(self):
+        hedger = self._hedger
+        for index in range(hedger.candidates):
+            with self._cond:
+                if index:
+                    deadline = time.monotonic() + hedger.delay_seconds
+                    while not self._done() and not self._idle() and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                    if self._done():
+                        break
+                    if not hedger.allow(self._tokens):
+                        tracing.count('chatbot_hedge_requests_total', outcome='skipped')
+                        break
+                    tracing.count('chatbot_hedge_requests_total', outcome='sent')
+                self.sent += 1
+            threading.Thread(target=contextvars.copy_context().run, args=(self._request, index),
+                             name=f'hedge-{index}', daemon=True).start()
+        with self._cond:
+            self._exhausted = True
+            self._cond.notify_all()
+
+    def _request(self, index):
+        options = {'temperature': self._hedger.temperature, 'seed': index} if index else {}
+        sql, error = None, None
+        try:
+            sql = self._ask(index, **options)
+        except Exception as e:
+            tracing.count('chatbot_hedge_requests_total', outcome='error')
+            tracing.annotate(**{f'hedge_error_{index}': str(e)})
+            error = e
+        with self._cond:
+            self._returned += 1
+            if error is not None:
+                self._errors[index] = error
+            seen = {' '.join(candidate.sql.split()) for candidate in self.candidates}
+            if sql and not self._stopped and ' '.join(sql.split()) not in seen:
+                self.candidates.append(Candidate(index, sql))
+            self._cond.notify_all()
+
+    def first(self):
+        """The first candidate to arrive, waiting for it, or None if no request wrote a query. Raises what the first
+        request raised if that failed and no other request wrote a query either."""
+        with self._cond:
+            while not self.candidates and not self._finished():
+                self._cond.wait()
+            if self.candidates:
+                return self.candidates[0]
+        self.stop()
+        if 0 in self._errors:
+            raise self._errors[0]
+        return None
+
+    def race(self, run, accept):
+        """Run each candidate with run(sql), on a thread of its own as a Subtask of the current job, as it arrives,
+        until accept(outcome) is true for one of them. Returns that Candidate, or None if none was accepted.
+        Raises QueryCancelled if the job is cancelled meanwhile."""
+        started = 0
+        try:
+            with self._cond:
+                while self.winner is None:
+                    for candidate in self.candidates[started:]:
+                        self._start(candidate, run, accept)
+                    started = len(self.candidates)
+                    if self._finished() and self._running == 0:
+                        break
+                    self._cond.wait(0.2)
+                    check_cancelled()
+        finally:
+            self.stop()
+        check_cancelled()
+        return self.winner
+
+    def _start(self, candidate, run, accept):
+        candidate.task = Subtask()
+        self._running += 1
+        threading.Thread(target=contextvars.copy_context().run, args=(self._run, candidate, run, accept),
+                         name=f'hedge-run-{candidate.index}', daemon=True).start()
+
+    def _run(self, candidate, run, accept):
+        outcome, error = None, None
+        try:
+            outcome = candidate.task.run(run, candidate.sql)
+        except Exception as e:
+            error = e
+        with self._cond:
+            self._running -= 1
+            candidate.outcome, candidate.error, candidate.done = outcome, error, True
+            if error is None and self.winner is None and not self._stopped and accept(outcome):
+                self.winner = candidate
+            self._cond.notify_all()
+
+    def stop(self):
+        """Send no more requests and interrupt the candidates still running (all but the winner)."""
+        with self._cond:
+            self._stopped = True
+            running = [candidate for candidate in self.candidates
+                       if candidate.task is not None and not candidate.done and candidate is not self.winner]
+            record = not self._recorded
+            self._recorded = True
+            self._cond.notify_all()
+        for candidate in running:
+            candidate.task.cancel()
+        if record:
+            self._hedger.record(self)
+
+
+class Hedger:
+    """Starts a Hedge for each question, and keeps the cost ceiling and the stats of all of them."""
+
+    def __init__(self, candidates=2, delay_seconds=3.0, temperature=0.7, tokens_per_minute=0):
+        self.candidates = max(1, candidates)
+        self.delay_seconds = delay_seconds
+        self.temperature = temperature
+        self._budget = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self._stats = {'questions': 0, 'requests': 0, 'wins': {}}
+
+    def start(self, ask, prompt, tools):
+        """Start asking for the question's queries: ask(index, **options) sends one request (options are extra
+        arguments for chat.completions.create) and returns its query, or None if the model didn't write one."""
+        tokens = estimate_tokens({'messages': [{'role': 'user', 'content': prompt}], 'tools': tools})
+        return Hedge(self, ask, tokens)
+
+    def allow(self, tokens):
+        """Whether an extra request of this many tokens fits under the cost ceiling now (and if so, take them)."""
+        if self._budget is None:
+            return True
+        with self._lock:
+            if self._budget.wait_for(tokens) > 0:
+                return False
+            self._budget.take(tokens)
+        return True
+
+    def record(self, hedge):
+        winner = str(hedge.winner.index) if hedge.winner is not None else 'none'
+        tracing.count('chatbot_hedge_wins_total', candidate=winner)
+        tracing.annotate_request(hedge_requests=hedge.sent, hedge_winner=winner)
+        with self._lock:
+            self._stats['questions'] += 1
+            self._stats['requests'] += hedge.sent
+            self._stats['wins'][winner] = self._stats['wins'].get(winner, 0) + 1
+
+    def stats(self):
+        """Questions hedged, the requests they sent, and which candidate won how often ('none' if none did)."""
+        with self._lock:
+            return {'questions': self._stats['questions'], 'requests': self._stats['requests'],
+                    'wins': dict(self._stats['wins'])}
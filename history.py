@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chat history for a session, kept small: each message is a Record of its text, SQL, row count and a preview of the
+first few rows. Full results stay in memory only while the session's results fit in max_bytes; past that the oldest
+are spilled to a SpillStore on local disk (Arrow IPC files, memory mapped back one page at a time when they're shown),
+and only the last max_messages messages are kept at all. The app renders only the most recent messages, with a button
+for earlier ones. So memory per session, and per replica, is bounded however long people chat.
+
+SpillStore is shared by every session in the process. It has its own size cap (the oldest files go first), and a
+session's files are deleted when Streamlit drops the session. A spilled result that was evicted is shown as its
+preview, with the SQL to re-run it.
+"""
+
+import os
+import threading
+import uuid
+import weakref
+
+import pyarrow as pa
+
+import tracing
+
+_histories = weakref.WeakSet()   # every live SessionHistory, for the replica wide memory gauge
+_histories_lock = threading.Lock()
+
+
+class SpillStore:
+    """Directory of Arrow IPC files, one per spilled result, at most max_bytes in all."""
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = {}   # key -> size, oldest first
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):   # left over from a previous process, whose sessions are gone
+            if name.endswith('.arrow'):
+                os.remove(os.path.join(path, name))
+
+    def _file(self, key):
+        return os.path.join(self.path, f'{key}.arrow')
+
+    def put(self, table):
+        """Write a table to disk. Returns its key."""
+        key = uuid.uuid4().hex
+        tmp = self._file(key) + '.tmp'
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, self._file(key))
+        with self._lock:
+            self._files[key] = os.path.getsize(self._file(key))
+            self._evict()
+            tracing.METRICS.set('chatbot_history_spilled_bytes', sum(self._files.values()))
+        return key
+
+    def get(self, key):
+        """The table, memory mapped (only the pages that are read come off the disk), or None if it was evicted."""
+        try:
+            return pa.ipc.open_file(pa.memory_map(self._file(key))).read_all()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                if self._files.pop(key, None) is not None:
+                    self._remove(key)
+            tracing.METRICS.set('chatbot_history_spilled_bytes', sum(self._files.values()))
+
+    def _remove(self, key):
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        total = sum(self._files.values())
+        while total > self.max_bytes and len(self._files) > 1:
+            key = next(iter(self._files))
+            total -= self._files.pop(key)
+            self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {'files': len(self._files), 'bytes': sum(self._files.values())}
+
+
+def table_bytes(table):
+    return table.get_total_buffer_size() if table is not None else 0
+
+
+def copy_rows(table, rows):
+    """The first rows of a table in buffers of their own, so keeping it doesn't keep the whole table alive."""
+    return pa.Table.from_pylist(table.slice(0, rows).to_pylist(), schema=table.schema)
+
+
+class Record:
+    """One chat message. result is the full table while it's in memory, result_key where it was spilled to."""
+
+    def __init__(self, id, role, content, sql=None, result=None, preview_rows=10):
+        self.id = id         # unique in the session, for widget keys
+        self.role = role
+        self.content = content
+        self.sql = sql
+        self.row_count = result.num_rows if result is not None else None
+        self.preview = copy_rows(result, preview_rows) if result is not None else None
+        self.result = result
+        self.result_key = None
+
+    def nbytes(self):
+        text = len(self.content or '') + len(self.sql or '')
+        return text + table_bytes(self.preview) + table_bytes(self.result)
+
+
+class SessionHistory:
+
+    def __init__(self, store=None, max_bytes=16 * 1024 * 1024, max_messages=200, preview_rows=10):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.preview_rows = preview_rows
+        self.records = []
+        self.added = 0
+        self.dropped = 0    # messages forgotten because of max_messages
+        self._spilled = set()
+        if store is not None:
+            # the session's files go when the session does
+            weakref.finalize(self, store.delete, self._spilled)
+        with _histories_lock:
+            _histories.add(self)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, role, content, sql=None, result=None):
+        record = Record(self.added, role, content, sql, result, self.preview_rows)
+        self.added += 1
+        self.records.append(record)
+        if len(self.records) > self.max_messages:
+            forgotten = self.records[:-self.max_messages]
+            self.records = self.records[-self.max_messages:]
+            self.dropped += len(forgotten)
+            keys = [r.result_key for r in forgotten if r.result_key is not None]
+            if keys and self.store is not None:
+                self.store.delete(keys)
+                self._spilled.difference_update(keys)
+        self._fit()
+        update_gauges()
+        return record
+
+    def _fit(self):
+        """Spill the oldest in-memory results (or drop them, without a store) until the session fits in max_bytes."""
+        for record in self.records:
+            if self.nbytes() <= self.max_bytes:
+                break
+            if record.result is None:
+                continue
+            if self.store is not None:
+                record.result_key = self.store.put(record.result)
+                self._spilled.add(record.result_key)
+            record.result = None
+
+    def table(self, record):
+        """The record's full result: from memory, from the spill store, or None (only the preview is left)."""
+        if record.result is not None:
+            return record.result
+        if record.result_key is not None and self.store is not None:
+            return self.store.get(record.result_key)
+        return None
+
+    def recent(self, count):
+        """The last count messages, oldest first."""
+        return self.records[-count:] if count > 0 else []
+
+    def nbytes(self):
+        return sum(record.nbytes() for record in self.records)
+
+    def memory(self):
+        """What this session is holding: messages, bytes in memory and results in memory and on disk."""
+        return {
+            'messages': len(self.records),
+            'dropped_messages': self.dropped,
+            'bytes': self.nbytes(),
+            'results_in_memory': sum(1 for r in self.records if r.result is not None),
+            'results_spilled': sum(1 for r in self.records if r.result_key is not None),
+        }
+
+
+def update_gauges():
+    with _histories_lock:
+        histories = list(_histories)
+    tracing.METRICS.set('chatbot_history_sessions', len(histories))
+    tracing.METRICS.set('chatbot_history_bytes', sum(h.nbytes() for h in histories))
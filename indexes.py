@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexes for the baseball database.
+
+    python indexes.py build  [--db baseball_db.db]
+        creates our curated set of indexes on the Lahman tables and runs ANALYZE. Run this whenever you ship a new
+        .db file (the Dockerfile does it for you).
+
+    python indexes.py advise --log query_log.jsonl [--db baseball_db.db] [--apply]
+        replays the SQL that ask_database actually executed (set QUERY_LOG_PATH to record it) through
+        EXPLAIN QUERY PLAN, and recommends indexes for the tables it had to scan. --apply creates them.
+
+The build and --apply open the database read-write, so run them offline, not against the database the app is serving.
+"""
+
+import argparse
+import re
+import sqlite3
+from collections import defaultdict
+
+from governor import table_aliases
+from query_log import read_query_log
+
+# (table, columns). Nearly every generated query joins on playerID/yearID/teamID and filters on awardID, round or
+# player names, so that's what these cover. Trailing columns make some of them covering for the common aggregates.
+INDEXES = [
+    ('People', ['playerID']),
+    ('People', ['nameLast', 'nameFirst']),
+    ('People', ['birthCountry']),
+    ('Batting', ['playerID', 'yearID', 'teamID']),
+    ('Batting', ['teamID', 'yearID']),
+    ('Batting', ['yearID', 'lgID']),
+    ('Pitching', ['playerID', 'yearID', 'teamID']),
+    ('Pitching', ['teamID', 'yearID']),
+    ('Pitching', ['yearID', 'lgID', 'SO']),
+    ('Fielding', ['playerID', 'Pos', 'G']),
+    ('Fielding', ['teamID', 'yearID']),
+    ('Appearances', ['playerID', 'yearID', 'teamID']),
+    ('Appearances', ['teamID', 'yearID', 'playerID']),
+    ('AwardsPlayers', ['awardID', 'playerID', 'yearID']),
+    ('AwardsPlayers', ['playerID', 'awardID', 'yearID']),
+    ('AwardsSharePlayers', ['playerID', 'awardID', 'yearID']),
+    ('AwardsManagers', ['playerID', 'awardID']),
+    ('BattingPost', ['playerID', 'yearID', 'round']),
+    ('BattingPost', ['round', 'playerID', 'HR']),
+    ('PitchingPost', ['playerID', 'yearID', 'round']),
+    ('FieldingPost', ['playerID', 'yearID', 'round']),
+    ('Teams', ['teamID', 'yearID']),
+    ('Teams', ['yearID', 'lgID']),
+    ('Teams', ['franchID', 'yearID']),
+    ('TeamsFranchises', ['franchID']),
+    ('Managers', ['playerID', 'yearID']),
+    ('Managers', ['teamID', 'yearID']),
+    ('AllStarFull', ['playerID', 'yearID']),
+    ('HallofFame', ['playerID', 'inducted']),
+    ('CollegePlaying', ['playerID', 'schoolID']),
+    ('CollegePlaying', ['schoolID', 'playerID']),
+    ('Schools', ['schoolID']),
+    ('Salaries', ['playerID', 'yearID', 'salary']),
+    ('SeriesPost', ['yearID', 'round']),
+]
+
+_AUTOMATIC_INDEX_RE = re.compile(r'^SEARCH (\w+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)')
+
+
+def index_name(table, columns):
+    return 'idx_' + '_'.join([table] + columns).lower()
+
+
+def table_columns(conn, table):
+    """Lower case column name -> real column name, or {} if there's no such table."""
+    return {r[1].lower(): r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+
+def table_names(conn):
+    """Lower case table name -> real table name."""
+    return {r[0].lower(): r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def existing_index_columns(conn, table):
+    """Column lists (lower case) of the indexes that already exist on a table."""
+    result = []
+    for index in conn.execute(f'PRAGMA index_list("{table}")'):
+        result.append([r[2].lower() for r in conn.execute(f'PRAGMA index_info("{index[1]}")') if r[2]])
+    return result
+
+
+def is_covered(existing, columns):
+    """True if some existing index starts with these columns (in this order)."""
+    columns = [c.lower() for c in columns]
+    return any(cols[:len(columns)] == columns for cols in existing)
+
+
+def create_indexes(conn, indexes):
+    """Create the (table, columns) indexes that apply to this database. Returns the names of the ones created."""
+    created = []
+    tables = table_names(conn)
+    for table, columns in indexes:
+        real_table = tables.get(table.lower())
+        known = table_columns(conn, real_table) if real_table else {}
+        missing = [c for c in columns if c.lower() not in known]
+        if real_table is None or missing:
+            print(f'skipping index on {table}({", ".join(columns)}): no such table/column {missing or table}')
+            continue
+        real_columns = [known[c.lower()] for c in columns]
+        if is_covered(existing_index_columns(conn, real_table), real_columns):
+            continue
+        name = index_name(real_table, real_columns)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{real_table}" (' + ', '.join(f'"{c}"' for c in real_columns) + ')')
+        created.append(name)
+    conn.execute('ANALYZE')
+    conn.commit()
+    return created
+
+
+def build(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        created = create_indexes(conn, INDEXES)
+    finally:
+        conn.close()
+    print(f'created {len(created)} indexes and ran ANALYZE on {db_path}')
+
+
+def predicate_columns(query, aliases, table, columns):
+    """Columns of `table` that the query filters or joins on, equality predicates first, then ranges."""
+    names = [a for a, t in aliases.items() if t == table.lower()]
+    equality, ranges = [], []
+
+    def add(qualifier, column, is_equality):
+        if qualifier and qualifier.lower() not in names:
+            return
+        real = columns.get(column.lower())
+        if real and real not in equality and real not in ranges:
+            (equality if is_equality else ranges).append(real)
+
+    # column on the left of a comparison: "b.yearID BETWEEN ...", "awardID = 'Gold Glove'"
+    for qualifier, column, op in re.findall(r'(?:\b(\w+)\.)?"?\b(\w+)\b"?\s*(=|\bIN\b|\bBETWEEN\b|>=|<=|>|<)', query, re.IGNORECASE):
+        add(qualifier, column, op == '=' or op.upper() == 'IN')
+    # column on the right of a join condition: "ON p.playerID = b.playerID"
+    for qualifier, column in re.findall(r'=\s*(?:\b(\w+)\.)"?\b(\w+)\b', query):
+        add(qualifier, column, True)
+    return (equality + ranges)[:3]
+
+
+def recommend(conn, queries):
+    """Replay queries through EXPLAIN QUERY PLAN. Returns [((table, columns), number of queries, seconds)] best first."""
+    tables = table_names(conn)
+    counts = defaultdict(int)
+    seconds = defaultdict(float)
+    for query, elapsed in queries:
+        aliases = table_aliases(query)
+        try:
+            plan = [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + query)]
+        except sqlite3.Error:
+            continue
+        wanted = set()
+        for detail in plan:
+            automatic = _AUTOMATIC_INDEX_RE.match(detail)
+            if automatic:
+                # SQLite built a throwaway index for this join on every execution, build it for real instead
+                table = tables.get(aliases.get(automatic.group(1).lower(), automatic.group(1).lower()))
+                columns = re.findall(r'(\w+)[=<>]', automatic.group(2))
+            elif detail.startswith('SCAN '):
+                table = tables.get(aliases.get(detail.split()[1].lower(), detail.split()[1].lower()))
+                columns = predicate_columns(query, aliases, table, table_columns(conn, table)) if table else []
+            else:
+                continue
+            if table and columns and not is_covered(existing_index_columns(conn, table), columns):
+                wanted.add((table, tuple(columns)))
+        for key in wanted:
+            counts[key] += 1
+            seconds[key] += elapsed
+    return sorted(((key, counts[key], seconds[key]) for key in counts), key=lambda r: (-r[2], -r[1]))
+
+
+def advise(db_path, log_path, apply=False):
+    entries = {}
+    for entry in read_query_log(log_path):
+        sql = entry.get('sql')
+        if sql:
+            entries[sql] = max(entries.get(sql, 0.0), entry.get('seconds', 0.0))
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True) if not apply else sqlite3.connect(db_path)
+    try:
+        recommendations = recommend(conn, entries.items())
+        if not recommendations:
+            print(f'no missing indexes found in {len(entries)} distinct queries')
+            return
+        for (table, columns), count, elapsed in recommendations:
+            print(f'CREATE INDEX "{index_name(table, list(columns))}" ON "{table}" ({", ".join(columns)});'
+                  f'   -- helps {count} queries, {elapsed:.3f}s of logged execution time')
+        if apply:
+            created = create_indexes(conn, [(table, list(columns)) for (table, columns), _, _ in recommendations])
+            print(f'created {len(created)} indexes and ran ANALYZE on {db_path}')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or recommend indexes for the baseball database')
+    parser.add_argument('command', choices=['build', 'advise'])
+    parser.add_argument('--db', default='baseball_db.db')
+    parser.add_argument('--log', default='query_log.jsonl', help='query log to replay (advise only)')
+    parser.add_argument('--apply', action='store_true', help='create the recommended indexes (advise only)')
+    args = parser.parse_args()
+    if args.command == 'build':
+        build(args.db)
+    else:
+        advise(args.db, args.log, apply=args.apply)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Answers the most common kinds of question with SQL we wrote ourselves, without asking OpenAI:
+
+    leaders         "top 10 career home run leaders", "who hit the most home runs in a single season",
+                    "top 5 Red Sox home run hitters of all time", "most saves between 1990 and 1999"
+    player_stat     "how many home runs did Hank Aaron hit in his career", "what was Rod Carew's hits in 1977",
+                    "how many home runs did Reggie Jackson hit while he was a member of the New York Yankees"
+    team_stat       "how many saves did Yankees pitchers have in 1998"
+    team_record     "how many games did the Blue Jays win in 1992"
+    college         "where did Tony Gwynn play college baseball"
+
+The question is read word by word: names come from the entity index (entities.py), stats from STATS (only the ones
+whose columns the database has), years and "top N" from the numbers, and every other word has to be one the intent
+expects. A word we don't know, an ambiguous name or stat ("strikeouts", by a pitcher or a batter?), or a number we
+can't place means we're not sure what's being asked, and the question goes to OpenAI as usual. So does any question
+about a league ("in the National League"), and any name made only of words the intents read as something else.
+"""
+
+import re
+
+from entities import GENERIC_WORDS, normalize
+from query_cache import STOP_WORDS
+from templates import sql_literal
+
+# (phrases, Batting column, Pitching column, the table when the question doesn't say)
+STATS = [
+    (['home runs', 'home run', 'homers', 'homer', 'hr', 'hrs'], 'HR', 'HR', 'batting'),
+    (['runs batted in', 'rbi', 'rbis'], 'RBI', None, 'batting'),
+    (['hits'], 'H', 'H', 'batting'),
+    (['doubles'], '2B', None, 'batting'),
+    (['triples'], '3B', None, 'batting'),
+    (['stolen bases', 'stolen base', 'steals'], 'SB', None, 'batting'),
+    (['runs scored', 'runs'], 'R', 'R', 'batting'),
+    (['walks', 'bases on balls'], 'BB', 'BB', 'batting'),
+    (['at bats'], 'AB', None, 'batting'),
+    (['strikeouts', 'strikeout'], 'SO', 'SO', None),
+    (['wins', 'victories'], None, 'W', 'pitching'),
+    (['losses'], None, 'L', 'pitching'),
+    (['saves'], None, 'SV', 'pitching'),
+    (['shutouts'], None, 'SHO', 'pitching'),
+    (['complete games'], None, 'CG', 'pitching'),
+]
+
+PITCHING_WORDS = {'pitcher', 'pitchers', 'pitched', 'pitching', 'threw', 'thrown', 'staff'}
+BATTING_WORDS = {'hitter', 'hitters', 'batter', 'batters', 'batting', 'hit'}
+
+# words that don't change what each intent means, beyond the stop words
+SCOPE_WORDS = {'career', 'all', 'time', 'ever', 'history', 'lifetime', 'total', 'totals', 'mlb', 'major', 'league',
+               'baseball', 'his', 'her', 'their', 'during'}
+TEAM_WORDS = {'with', 'while', 'he', 'she', 'member', 'playing', 'played', 'as'}
+STAT_VERBS = {'hit', 'had', 'have', 'has', 'get', 'got', 'stole', 'steal', 'won', 'win', 'threw', 'recorded',
+              'collected'}
+LEADER_WORDS = {'top', 'most', 'leaders', 'leader', 'players', 'player', 'among', 'by', 'single', 'season', 'one',
+                'best'} | PITCHING_WORDS | BATTING_WORDS
+LOOKUP_WORDS = {'how', 'many', 'season'} | PITCHING_WORDS | BATTING_WORDS
+RECORD_WORDS = {'how', 'many', 'games', 'win', 'won', 'lose', 'lost', 'season'}
+COLLEGE_WORDS = {'where', 'college', 'school', 'university', 'play', 'played', 'go', 'went', 'attend', 'attended',
+                 'baseball', 'he', 'she'}
+
+# a name next to one of these is part of a league's name ("National League", "American Association"), and we don't
+# answer league questions ourselves
+LEAGUE_WORDS = {'league', 'leagues', 'association', 'al', 'nl'}
+VOCABULARY = (SCOPE_WORDS | TEAM_WORDS | STAT_VERBS | LEADER_WORDS | LOOKUP_WORDS | RECORD_WORDS | COLLEGE_WORDS |
+              {token for phrases, _, _, _ in STATS for phrase in phrases for token in normalize(phrase)})
+
+YEARS = range(1871, 2100)
+MAX_TOP = 100
+
+
+class Unsure(Exception):
+    """The question doesn't quite fit, leave it to OpenAI."""
+
+
+class Parsed:
+    """A question read for the intents: its plain words, and the names, stats and years found in it."""
+
+    def __init__(self):
+        self.words = []
+        self.players = []   # playerIDs
+        self.teams = []     # [(teamID, first year, last year)] per team named
+        self.others = 0     # names of other kinds (awards, schools)
+        self.stats = []     # indexes into STATS
+        self.top = None
+        self.start = None   # years, inclusive
+        self.end = None
+
+
+class IntentMatcher:
+
+    def __init__(self, stats=None, career_tables=(), school_name=None, max_candidates=3, franchises=None):
+        self.stats = stats if stats is not None else STATS
+        self.career_tables = set(career_tables)   # CareerBatting, CareerPitching, if the database has them
+        self.school_name = school_name            # the name column of Schools, if there is one
+        self.franchises = franchises or {}        # teamID -> franchID
+        self.max_candidates = max_candidates      # a name with this many matches may have had more cut off
+        phrases = [(normalize(phrase), index) for index, (words, _, _, _) in enumerate(self.stats) for phrase in words]
+        self._phrases = sorted(phrases, key=lambda p: -len(p[0]))   # longest first, "home runs" before "runs"
+
+    @classmethod
+    def from_database(cls, conn, max_candidates=3):
+        columns = lambda table: {r[1].lower(): r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+        batting, pitching = columns('Batting'), columns('Pitching')
+        stats = []
+        for phrases, batting_column, pitching_column, default in STATS:
+            batting_column = batting_column if batting_column and batting_column.lower() in batting else None
+            pitching_column = pitching_column if pitching_column and pitching_column.lower() in pitching else None
+            if batting_column or pitching_column:
+                stats.append((phrases, batting_column, pitching_column, default))
+        career_tables = [table for table in ('CareerBatting', 'CareerPitching') if columns(table)]
+        schools = columns('Schools')
+        school_name = (schools.get('name_full') or schools.get('schoolname')) if columns('CollegePlaying') else None
+        franchises = dict(conn.execute('SELECT DISTINCT teamID, franchID FROM Teams')) if columns('Teams') else {}
+        return cls(stats, career_tables, school_name, max_candidates, franchises)
+
+    def parse(self, question, mentions):
+        tokens = [token for word in question.split() for token in normalize(word)]
+        starts = {mention.start: mention for mention in mentions}
+        parsed = Parsed()
+        numbers = []   # (number, the word before it)
+        for position, token in enumerate(tokens):
+            if token in LEAGUE_WORDS and not (token == 'league' and position and tokens[position - 1] == 'major'):
+                raise Unsure('a question about a league')
+        i = 0
+        while i < len(tokens):
+            mention = starts.get(i)
+            if mention is not None:
+                # a name made of words that mean something else here is probably that something else
+                if all(token in GENERIC_WORDS or token in VOCABULARY for token in tokens[mention.start:mention.end]):
+                    raise Unsure(f'"{mention.text}" may not be a name')
+                kinds = {entity.kind for entity in mention.entities}
+                if kinds == {'player'}:
+                    if len(mention.entities) > 1:
+                        raise Unsure(f'"{mention.text}" is more than one player')
+                    parsed.players.append(mention.entities[0].id)
+                elif kinds == {'team'}:
+                    if len(mention.entities) >= self.max_candidates:
+                        raise Unsure(f'"{mention.text}" may be more teams than we were told about')
+                    parsed.teams.append([(e.id,) + team_years(e.label) for e in mention.entities])
+                else:
+                    parsed.others += 1
+                i = mention.end
+                continue
+            for phrase, index in self._phrases:
+                if tokens[i:i + len(phrase)] == phrase:
+                    parsed.stats.append(index)
+                    i += len(phrase)
+                    break
+            else:
+                token = tokens[i]
+                decade = re.fullmatch(r'(1[89]\d0|20\d0)s', token)
+                if token.isdigit():
+                    numbers.append((int(token), parsed.words[-1] if parsed.words else None))
+                elif decade:
+                    numbers.append((int(decade.group(1)), 'decade'))
+                elif token not in STOP_WORDS:
+                    parsed.words.append(token)
+                i += 1
+        self._place_numbers(parsed, numbers)
+        return parsed
+
+    @staticmethod
+    def _place_numbers(parsed, numbers):
+        """Work out which numbers are years (and of what range) and which is the N of "top N"."""
+        pending = None   # 'between' or 'from': the next number ends the range
+        for number, before in numbers:
+            if pending is not None:
+                if number not in YEARS or number < parsed.start:
+                    raise Unsure(f'{number} does not end a range of years')
+                parsed.end, pending = number, None
+                continue
+            if before == 'top' and parsed.top is None:
+                if not 0 < number <= MAX_TOP:
+                    raise Unsure(f'top {number}?')
+                parsed.top = number
+                continue
+            if number not in YEARS or parsed.start is not None:
+                raise Unsure(f'not sure what {number} is')
+            if before == 'decade':
+                parsed.start, parsed.end = number, number + 9
+            elif before in ('between', 'from'):
+                parsed.start, pending = number, before
+            elif before in ('since', 'after'):
+                parsed.start = number + (before == 'after')
+            elif before in ('before', 'until', 'through'):
+                parsed.end = number - (before == 'before')
+                parsed.start = YEARS.start
+            else:
+                parsed.start = parsed.end = number
+        if pending is not None:
+            raise Unsure(f'{pending} {parsed.start} and when?')
+        for word in ('top', 'between', 'from', 'since', 'after', 'before', 'until', 'through'):
+            if word in parsed.words:
+                parsed.words.remove(word)   # used up with their numbers
+
+    def match(self, question, mentions):
+        """(intent, sql) for the question, or None if it isn't one we can answer ourselves."""
+        try:
+            parsed = self.parse(question, mentions)
+            if parsed.others:
+                return None
+            words = set(parsed.words)
+            if parsed.players and not parsed.stats and words & {'college', 'school', 'university'}:
+                return 'college', self.college(parsed, words)
+            if parsed.teams and not parsed.players and not parsed.stats and 'games' in words:
+                return 'team_record', self.team_record(parsed, words)
+            if not parsed.stats:
+                return None
+            if 'most' in words or parsed.top is not None:
+                return 'leaders', self.leaders(parsed, words)
+            if parsed.players:
+                return 'player_stat', self.player_stat(parsed, words)
+            if parsed.teams:
+                return 'team_stat', self.team_stat(parsed, words)
+        except Unsure:
+            return None
+        return None
+
+    def stat(self, parsed, words):
+        """(table, column) of the one stat in the question."""
+        if len(parsed.stats) != 1:
+            raise Unsure('more than one stat')
+        _, batting, pitching, default = self.stats[parsed.stats[0]]
+        pitching_cue, batting_cue = words & PITCHING_WORDS, words & BATTING_WORDS
+        if pitching_cue and batting_cue:
+            raise Unsure('pitching or batting?')
+        kind = 'pitching' if pitching_cue else 'batting' if batting_cue else default
+        if default is not None and kind != default:
+            # "home runs by a pitcher" are still Batting.HR, Pitching.HR is the ones he gave up
+            raise Unsure(f'{kind} with a {default} stat')
+        column = batting if kind == 'batting' else pitching if kind == 'pitching' else None
+        if column is None:
+            raise Unsure('no such stat for that kind of player')
+        return ('Batting' if kind == 'batting' else 'Pitching'), column
+
+    @staticmethod
+    def expect(words, allowed):
+        unknown = words - allowed
+        if unknown:
+            raise Unsure('did not expect ' + ', '.join(sorted(unknown)))
+
+    def team_ids(self, parsed):
+        """The teamIDs of the one team named, narrowed to the ones that played in the question's years. More than one
+        is only kept if they are one franchise's teamIDs one after the other (the Brooklyn and Los Angeles Dodgers):
+        a nickname two franchises used (the Orioles of 1901 became the Yankees) or two teams used at the same time
+        isn't one team, and adding them up would be wrong."""
+        if len(parsed.teams) > 1:
+            raise Unsure('more than one team')
+        if not parsed.teams:
+            return None
+        teams = parsed.teams[0]
+        if parsed.start is not None:
+            end = parsed.end if parsed.end is not None else YEARS.stop
+            teams = [t for t in teams if t[1] is None or (t[1] <= end and t[2] >= parsed.start)]
+            if not teams:
+                raise Unsure('that team did not play then')
+        if len({t[0] for t in teams}) > 1:
+            if len({self.franchises.get(t[0], t[0]) for t in teams}) > 1:
+                raise Unsure('more than one franchise by that name')
+            if any(t[1] is None for t in teams):
+                raise Unsure('teams by that name, but not when they played')
+            spans = {}   # teamID -> (first year, last year), over all its names
+            for team_id, first, last in teams:
+                known = spans.get(team_id, (first, last))
+                spans[team_id] = (min(first, known[0]), max(last, known[1]))
+            ordered = sorted(spans.values())
+            if any(last >= first for (_, last), (first, _) in zip(ordered, ordered[1:])):
+                raise Unsure('teams by that name played at the same time')
+        return [t[0] for t in teams]
+
+    @staticmethod
+    def filters(parsed, team_ids, alias=''):
+        conditions = []
+        if team_ids is not None:
+            conditions.append(f'{alias}teamID IN (' + ', '.join(sql_literal(t) for t in team_ids) + ')')
+        if parsed.start is not None and parsed.start == parsed.end:
+            conditions.append(f'{alias}yearID = {parsed.start}')
+        elif parsed.start is not None and parsed.end is not None:
+            conditions.append(f'{alias}yearID BETWEEN {parsed.start} AND {parsed.end}')
+        elif parsed.start is not None:
+            conditions.append(f'{alias}yearID >= {parsed.start}')
+        return conditions
+
+    def leaders(self, parsed, words):
+        self.expect(words, LEADER_WORDS | SCOPE_WORDS | TEAM_WORDS | STAT_VERBS)
+        if parsed.players:
+            raise Unsure('a leaderboard with a player in it')
+        table, column = self.stat(parsed, words)
+        team_ids = self.team_ids(parsed)
+        top = parsed.top or 1
+        seasons = 'season' in words and (parsed.start is None or parsed.start != parsed.end)   # "in a single season"
+        conditions = self.filters(parsed, team_ids)
+        career = f'Career{table}'
+        if not conditions and not seasons and career in self.career_tables:
+            totals = f'SELECT playerID, "{column}" AS total FROM {career}'
+        else:
+            group = 'playerID, yearID' if seasons else 'playerID'
+            where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+            totals = f'SELECT {group}, SUM("{column}") AS total FROM {table}{where} GROUP BY {group}'
+        year = 't.yearID, ' if seasons else ''
+        return (f"SELECT rank, player, {'yearID, ' if seasons else ''}\"{column}\" FROM ("
+                f"SELECT RANK() OVER (ORDER BY t.total DESC) AS rank, p.nameFirst || ' ' || p.nameLast AS player, "
+                f"{year}t.total AS \"{column}\" FROM ({totals}) t JOIN People p ON p.playerID = t.playerID "
+                f"WHERE t.total > 0) WHERE rank <= {top} ORDER BY rank, player")
+
+    def player_stat(self, parsed, words):
+        self.expect(words, LOOKUP_WORDS | SCOPE_WORDS | TEAM_WORDS | STAT_VERBS)
+        if len(parsed.players) != 1 or parsed.top is not None:
+            raise Unsure('not one player')
+        table, column = self.stat(parsed, words)
+        conditions = [f'playerID = {sql_literal(parsed.players[0])}'] + self.filters(parsed, self.team_ids(parsed))
+        return f'SELECT SUM("{column}") AS "{column}" FROM {table} WHERE ' + ' AND '.join(conditions)
+
+    def team_stat(self, parsed, words):
+        self.expect(words, LOOKUP_WORDS | SCOPE_WORDS | STAT_VERBS)
+        if parsed.top is not None or parsed.start is None:
+            raise Unsure('a team total needs its years')
+        table, column = self.stat(parsed, words)
+        conditions = self.filters(parsed, self.team_ids(parsed))
+        return f'SELECT SUM("{column}") AS "{column}" FROM {table} WHERE ' + ' AND '.join(conditions)
+
+    def team_record(self, parsed, words):
+        self.expect(words, RECORD_WORDS)
+        if 'how' not in words or parsed.top is not None or parsed.start is None or parsed.start != parsed.end:
+            raise Unsure('a team record is for one season')
+        won, lost = words & {'win', 'won'}, words & {'lose', 'lost'}
+        if bool(won) == bool(lost):
+            raise Unsure('won or lost?')
+        column = 'W' if won else 'L'
+        conditions = self.filters(parsed, self.team_ids(parsed))
+        return f'SELECT {column} FROM Teams WHERE ' + ' AND '.join(conditions)
+
+    def college(self, parsed, words):
+        self.expect(words, COLLEGE_WORDS)
+        if self.school_name is None or len(parsed.players) != 1 or parsed.teams or parsed.start is not None:
+            raise Unsure('not one player')
+        return (f'SELECT s."{self.school_name}" AS school, MIN(c.yearID) AS firstYear, MAX(c.yearID) AS lastYear '
+                f'FROM CollegePlaying c JOIN Schools s ON s.schoolID = c.schoolID '
+                f'WHERE c.playerID = {sql_literal(parsed.players[0])} GROUP BY s.schoolID ORDER BY firstYear')
+
+
+def team_years(label):
+    """(first year, last year) from a team entity's label, 'Toronto Blue Jays, 1977-2023'."""
+    found = re.search(r'(\d{4})-(\d{4})$', label)
+    return (int(found.group(1)), int(found.group(2))) if found else (None, None)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The one way the app talks to OpenAI. GovernedClient wraps the OpenAI client and has the same
+client.chat.completions.create(...) method, with:
+
+    coalescing      identical requests in flight at the same time (the same question from several sessions) make one
+                    call to OpenAI and share its response. Streamed requests can't be shared and always go out.
+    rate limiting   token buckets for requests and tokens per minute, the limits of our OpenAI tier. Each request
+                    reserves its place up front, so a spike is spread out in arrival order instead of hitting 429s, and
+                    a request that would have to wait longer than max_wait fails at once (LLMBusy) instead.
+    timeouts        every call gets timeout seconds unless the caller passes its own.
+    retries         429 and 5xx responses are retried up to max_retries times, with exponential backoff and full jitter
+                    (or the server's Retry-After). Anything else, a bad request or a timeout, fails straight away.
+
+The token count of a request is estimated from the size of its messages and tools before it is sent, and corrected
+with the usage OpenAI reports once it's back. A streamed request is corrected when its last chunk goes by, if it asked
+for usage (stream_options={'include_usage': True}) and was read to the end, and otherwise keeps the estimate.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import tracing
+
+CHARS_PER_TOKEN = 4             # close enough for English and SQL
+COMPLETION_TOKEN_ESTIMATE = 256  # when the request doesn't set max_tokens
+
+
+class LLMBusy(Exception):
+    """Raised when a request would wait longer than max_wait for the rate limiter."""
+
+
+def estimate_tokens(kwargs):
+    """Rough prompt + completion tokens for a chat.completions.create call."""
+    prompt = json.dumps(kwargs.get('messages', []), default=str) + json.dumps(kwargs.get('tools') or [], default=str)
+    return len(prompt) // CHARS_PER_TOKEN + (kwargs.get('max_tokens') or COMPLETION_TOKEN_ESTIMATE)
+
+
+def retryable(error):
+    """429s and server errors, the failures that are worth trying again."""
+    status = getattr(error, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it did."""
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """per_minute units a minute, with bursts of up to capacity. The level can go negative: reserve() takes the units
+    now and returns how long the caller has to wait for them, so waiting callers are served in order."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = float(self.capacity)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_for(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)   # a request bigger than the bucket waits for a full one, not forever
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """Requests and tokens per minute (either can be 0 for no limit)."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_wait=30.0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Wait for room for one request of this many tokens. Returns the seconds waited."""
+        buckets = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens)) if bucket]
+        with self._lock:
+            wait = max([bucket.wait_for(amount) for bucket, amount in buckets], default=0.0)
+            if self.max_wait and wait > self.max_wait:
+                raise LLMBusy(f'OpenAI rate limit: the request would have to wait {wait:.0f} seconds')
+            for bucket, amount in buckets:
+                bucket.take(amount)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def correct(self, estimated, actual):
+        """Give back (or take) the difference between the estimated and actual tokens of a request."""
+        if self.tokens is not None and actual is not None:
+            with self._lock:
+                self.tokens.give(estimated - actual)
+
+
+class _Stream:
+    """A streamed response that calls settle(usage) when the chunk with the request's usage goes by."""
+
+    def __init__(self, stream, settle):
+        self._stream = stream
+        self._chunks = iter(stream)
+        self._settle = settle
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        usage = getattr(chunk, 'usage', None)
+        if usage is not None:
+            self._settle(usage)
+        return chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class GovernedClient:
+    """An OpenAI client whose chat.completions.create is coalesced, rate limited, timed out and retried."""
+
+    def __init__(self, client, requests_per_minute=0, tokens_per_minute=0, timeout=30.0, max_retries=3,
+                 max_wait=30.0, backoff=1.0, max_backoff=20.0):
+        self._client = client
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute, max_wait)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._in_flight = {}   # request key -> _Flight
+        self._waiting = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if kwargs.get('stream'):
+            return self._call(kwargs)
+        key = hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+        if not leader:
+            tracing.count('chatbot_llm_coalesced_total')
+            tracing.annotate(coalesced=True)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # the leader counts the tokens, so the follower's copy has no usage
+            return flight.response.model_copy(update={'usage': None}) if hasattr(flight.response, 'model_copy') else flight.response
+        try:
+            flight.response = self._call(kwargs)
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def _call(self, kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        estimated = estimate_tokens(kwargs)
+        attempt = 0
+        while True:
+            self._queued(1)
+            try:
+                waited = self.limiter.acquire(estimated)
+            except LLMBusy:
+                tracing.count('chatbot_llm_requests_total', outcome='rejected')
+                raise
+            finally:
+                self._queued(-1)
+            tracing.METRICS.observe('chatbot_llm_queue_seconds', waited)
+            if waited:
+                tracing.annotate(llm_queue_seconds=round(waited, 6))
+            try:
+                response = self._client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.max_retries:
+                    tracing.count('chatbot_llm_requests_total', outcome='error')
+                    raise
+                attempt += 1
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                tracing.count('chatbot_llm_retries_total', status=str(e.status_code))
+                tracing.annotate(llm_retries=attempt)
+                time.sleep(delay)
+                continue
+            tracing.count('chatbot_llm_requests_total', outcome='ok')
+            if kwargs.get('stream'):
+                return _Stream(response, lambda usage: self.limiter.correct(estimated, getattr(usage, 'total_tokens', None)))
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                self.limiter.correct(estimated, getattr(usage, 'total_tokens', None))
+            return response
+
+    def _queued(self, change):
+        with self._lock:
+            self._waiting += change
+            tracing.METRICS.set('chatbot_llm_waiting', self._waiting)
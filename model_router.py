@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sends each question to the fast, cheap model (FAST_MODEL) or the strong one (STRONG_MODEL), judged from things we
+know locally before asking anyone:
+
+    length      questions of more than max_words words
+    tables      questions whose keywords point at more than max_tables tables (see schema_selector.score_tables)
+    names       names in the question that match more than one player or team (see entities.py)
+    analysis    words like "average", "per" or "consecutive" that usually mean window functions or ratios
+
+Any of these sends the question to the strong model; otherwise it goes to the fast one. A fast answer escalates to the
+strong model (pipeline.escalate) when the fast model doesn't write a query, its SQL doesn't compile, or the query
+returns no rows. The router keeps per-tier latency and the escalation rate, in stats() and the Prometheus metrics.
+"""
+
+import re
+import threading
+
+import tracing
+from schema_selector import score_tables
+
+ANALYSIS_WORDS = re.compile(r'\b(average|averages|ratio|percent|percentage|per|rank|ranked|compare|compared|'
+                            r'consecutive|streak|streaks|median|correlation)\b', re.IGNORECASE)
+
+
+class ModelRouter:
+
+    def __init__(self, fast_model, strong_model, max_words=20, max_tables=2, max_ambiguous=0):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.max_words = max_words
+        self.max_tables = max_tables
+        self.max_ambiguous = max_ambiguous
+        self._lock = threading.Lock()
+        self._stats = {tier: {'questions': 0, 'requests': 0, 'seconds': 0.0} for tier in ('fast', 'strong')}
+        self._escalations = {}   # reason -> count
+
+    @property
+    def cache_key(self):
+        """Stands in for the model name in question cache keys: the SQL came from this pair of models."""
+        return f'{self.fast_model}>{self.strong_model}'
+
+    def model(self, tier):
+        return self.fast_model if tier == 'fast' else self.strong_model
+
+    def reasons(self, question, mentions=()):
+        """Why this question needs the strong model. An empty list means the fast one will do."""
+        reasons = []
+        words = len(question.split())
+        if words > self.max_words:
+            reasons.append(f'{words} words')
+        tables = len(score_tables(question))
+        if tables > self.max_tables:
+            reasons.append(f'{tables} tables')
+        ambiguous = sum(1 for mention in mentions if len(mention.entities) > 1)
+        if ambiguous > self.max_ambiguous:
+            reasons.append(f'{ambiguous} ambiguous names')
+        analysis = ANALYSIS_WORDS.search(question)
+        if analysis:
+            reasons.append(f'"{analysis.group(1).lower()}"')
+        return reasons
+
+    def choose(self, question, mentions=()):
+        """(tier, model) for a question."""
+        reasons = self.reasons(question, mentions)
+        tier = 'strong' if reasons else 'fast'
+        tracing.annotate_request(tier=tier, tier_reasons=reasons)
+        tracing.count('chatbot_tier_total', tier=tier)
+        with self._lock:
+            self._stats[tier]['questions'] += 1
+        return tier, self.model(tier)
+
+    def record(self, tier, seconds):
+        """One request to a tier's model took this long."""
+        tracing.METRICS.observe('chatbot_tier_llm_seconds', seconds, tier=tier)
+        with self._lock:
+            self._stats[tier]['requests'] += 1
+            self._stats[tier]['seconds'] += seconds
+
+    def escalated(self, reason):
+        tracing.count('chatbot_escalations_total', reason=reason)
+        with self._lock:
+            self._escalations[reason] = self._escalations.get(reason, 0) + 1
+
+    def stats(self):
+        """Per tier questions routed to it, requests and their mean latency, and escalations by reason."""
+        with self._lock:
+            tiers = {tier: dict(stats, mean_seconds=stats['seconds'] / stats['requests'] if stats['requests'] else None)
+                     for tier, stats in self._stats.items()}
+            escalations = dict(self._escalations)
+        fast = tiers['fast']['questions']
+        return {'tiers': tiers, 'escalations': escalations,
+                'escalation_rate': sum(escalations.values()) / fast if fast else None}
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The question -> SQL -> answer pipeline behind the chat box. It lives outside app.py so it can run without a browser:
+batch.py answers whole files of questions with it, and bench/run.py times every stage of it against a stub OpenAI
+server. answer_question is write_sql followed by run_sql, which batch.py runs on separate thread pools.
+
+The stages, in the order answer_question runs them (each one's time ends up in Answer.timings, and is a span of the
+request's trace, see tracing.py):
+    prompt      pick the table docs and examples for the question, resolve the names in it
+    cache       look the question up in the question cache, match it against the intents we answer ourselves,
+                then look its shape up in the template cache
+    llm         ask OpenAI for the SQL (skipped on a cache hit), the fast or strong model as model_router.py decides,
+                or with HEDGE on for several candidate queries and wait for the first one (hedging.py)
+    parse       decode the tool call's JSON arguments (part of llm when streaming or hedging)
+    validate    compile the SQL: escalate the fast model's to the strong model, or ask OpenAI to repair it, if it
+                doesn't compile
+    execute     run the SQL (or fetch its rows from the result cache), each hedged candidate as it arrives until
+                one returns rows
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+import tracing
+
+from config import (GPT_MODEL, SCHEMA_PRUNING, SCHEMA_MIN_SCORE, STREAM_RESPONSES, EXAMPLES_TOP_K,
+                    REPAIR_MAX_ATTEMPTS, REPAIR_BUDGET_SECONDS, QUERY_MAX_ROWS, EXPORT_MAX_ROWS)
+from entities import describe
+from executor import QueryCancelled, check_cancelled, interruptible
+from governor import QueryBudgetExceeded
+from prompt import compiled_tools
+from results import fetch_table, table_rows, to_csv
+from resources import (get_db_pool, get_query_governor, get_backend_router, get_query_log, get_example_store,
+                       get_entity_index, get_model_router, get_question_cache, get_result_cache, get_template_cache,
+                       get_intent_matcher, get_hedger)
+from schema_selector import select_tables
+from streaming import stream_question_openai
+from templates import parameterize
+from validation import repair_loop, repair_sql, validate
+
+STAGES = ('prompt', 'cache', 'llm', 'parse', 'validate', 'execute')
+
+# what escalate puts back when the strong model's request fails
+FAST_ANSWER = ('function_name', 'sql', 'result', 'truncated', 'error', 'response', 'candidate', 'tier', 'model')
+
+
+class Answer:
+    """Everything answer_question found out about one question."""
+
+    def __init__(self, question):
+        self.question = question
+        self.function_name = None
+        self.sql = None
+        self.result = None         # a pyarrow Table, see results.py
+        self.truncated = False
+        self.response = None       # the text shown in the chat
+        self.error = None
+        self.from_cache = False    # the SQL came from the question cache
+        self.from_template = False # the SQL came from the template of a question like it, see templates.py
+        self.intent = None         # the kind of question, when we wrote the SQL ourselves, see intents.py
+        self.mentions = []         # the names in the question, see entities.py
+        self.llm_attempts = 0
+        self.model = None
+        self.tier = None           # 'fast' or 'strong' when the model router picked the model
+        self.escalated = None      # why the fast model's answer went to the strong model, if it did
+        self.hedge = None          # the candidate queries still in play when they're hedged, see hedging.py
+        self.candidate = None      # which of them is the answer, 0 for the first request's
+        self.prompt = None         # the question as sent to OpenAI, with the resolved names
+        self.tools = None
+        self.tools_fingerprint = None
+        self.cache_model = None
+        self.timings = {}          # stage -> seconds, for the stages that ran
+
+    @property
+    def rows(self):
+        """The result as a list of tuples."""
+        return table_rows(self.result) if self.result is not None else None
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def ask_question_openai(question,tools,client,model=GPT_MODEL,**options):
+    openai_messages = [{
+    "role":"user",
+    "content": question}]
+
+    response = client.chat.completions.create(
+    model=model,
+    messages=openai_messages,
+    tools= tools,
+    tool_choice="auto",
+    **options
+    )
+
+    tracing.record_usage(response.usage)
+
+    # Append the message to messages list
+    response_message = response.choices[0].message
+    openai_messages.append(response_message)
+
+    return response_message
+
+
+def run_query(conn, query, cache=None, governor=None, query_log=None, question=None, llm_attempts=None, router=None):
+    """Run a query (or fetch its result from the result cache). Returns (table, truncated).
+    With a router the query may run on the columnar backend instead of conn, see backends.py. The query runs with its
+    literals as bound parameters (templates.parameterize), so queries that differ only in them share a compiled
+    statement."""
+    truncated = False
+    table = cache.get(query) if cache is not None else None
+    if cache is not None:
+        tracing.count('chatbot_cache_total', cache='result', result='miss' if table is None else 'hit')
+        tracing.annotate(result_cache='miss' if table is None else 'hit')
+    if table is None:
+        started = time.perf_counter()
+        statement, params = parameterize(query)
+        if router is not None:
+            table, truncated = router.execute(conn, statement, params)
+        elif governor is not None:
+            table, truncated = governor.execute(conn, statement, params=params)
+        else:
+            table, truncated = fetch_table(conn.execute(statement, params), QUERY_MAX_ROWS)
+        if query_log is not None:
+            query_log.record(query, time.perf_counter() - started, table.num_rows, question=question,
+                             llm_attempts=llm_attempts)
+        if cache is not None and not truncated:
+            cache.put(query, table)
+    elif governor is not None and table.num_rows > governor.max_rows:
+        table, truncated = table.slice(0, governor.max_rows), True
+    return table, truncated
+
+
+def format_rows(table, truncated, governor=None):
+    """What the chat says about a result; the rows themselves are shown as a table."""
+    results = '1 row' if table.num_rows == 1 else f'{table.num_rows} rows'
+    if truncated:
+        results += f" (only the first {governor.max_rows} rows are shown, export the query for all of them)"
+    return results
+
+
+def ask_database(conn, query, cache=None, governor=None, query_log=None, question=None, llm_attempts=None, router=None):
+    """Function to query SQLite database with a provided SQL query."""
+    try:
+        table, truncated = run_query(conn, query, cache, governor, query_log, question, llm_attempts, router)
+        results = to_csv(table).decode('utf-8')
+        if truncated:
+            results += f"\n(only the first {governor.max_rows} rows are shown)"
+    except QueryBudgetExceeded as e:
+        results = f"query stopped by the query governor: {e}"
+    except Exception as e:
+        results = f"query failed with error: {e}"
+    return results
+
+
+def export_csv(query, max_rows=EXPORT_MAX_ROWS):
+    """The full result of a query (up to max_rows rows, under the governor's time and work budgets) as CSV bytes.
+    Only run when someone asks for the export, the chat keeps just the first QUERY_MAX_ROWS rows."""
+    with tracing.span('export'):
+        with get_db_pool().connection() as conn:
+            statement, params = parameterize(query)
+            table, truncated = get_query_governor().execute(conn, statement, max_rows=max_rows, params=params)
+        tracing.annotate(rows=table.num_rows, truncated=truncated)
+    return to_csv(table)
+
+
+def answer_question(question, client, model=None, stream=STREAM_RESPONSES, on_sql=None, use_cache=True):
+    """Turn a question into SQL and run it. on_sql(partial_sql) is called as streamed SQL arrives. Without a model
+    the model router picks one (see model_router.py), or GPT_MODEL if MODEL_ROUTING is off.
+    With use_cache=False the SQL always comes from OpenAI: the question and template caches are neither read nor
+    written and the intents aren't tried (the result cache is still used, if configured)."""
+    with tracing.request(question):
+        answer = write_sql(question, client, model, stream, on_sql, use_cache)
+        run_sql(answer, client, use_cache)
+        annotate_outcome(answer)
+        return answer
+
+
+def annotate_outcome(answer):
+    outcome = 'no_query' if answer.sql is None else 'error' if answer.error is not None else 'ok'
+    tracing.annotate_request(outcome=outcome, sql=answer.sql, llm_attempts=answer.llm_attempts,
+                             from_cache=answer.from_cache, from_template=answer.from_template, intent=answer.intent,
+                             error=answer.error, model=answer.model,
+                             escalated=answer.escalated, candidate=answer.candidate)
+
+
+def tools_for_question(question):
+    """The tools (with the prompt) to send OpenAI for this question, and their fingerprint for the question cache."""
+    # only send OpenAI the documentation for the tables this question needs (or all of it, if we can't tell)
+    tables = select_tables(question, min_score=SCHEMA_MIN_SCORE) if SCHEMA_PRUNING else None
+    examples = get_example_store().top_k(question, EXAMPLES_TOP_K)
+    return compiled_tools(tables, tuple(examples))
+
+
+def question_cache_model(model=None):
+    """What question cache entries are keyed on instead of a model name when the router picks the model: the SQL may
+    have come from either tier."""
+    router = get_model_router()
+    return model or (router.cache_key if router is not None else GPT_MODEL)
+
+
+def write_sql(question, client, model=None, stream=STREAM_RESPONSES, on_sql=None, use_cache=True):
+    """The first half of answer_question: the prompt, cache, llm and parse stages. Returns an Answer with its sql set,
+    unless the model didn't write a query."""
+    answer = Answer(question)
+
+    with answer.stage('prompt'):
+        answer.tools, answer.tools_fingerprint = tools_for_question(question)
+        # tell OpenAI the IDs of the players, teams, awards and schools the question names, so it doesn't have to guess them
+        entity_index = get_entity_index()
+        answer.mentions = mentions = entity_index.resolve(question) if entity_index is not None else []
+        entity_context = describe(mentions)
+        answer.prompt = f"{question}\n\n{entity_context}" if entity_context else question
+        router = get_model_router() if model is None else None
+        if router is not None:
+            answer.tier, answer.model = router.choose(question, mentions)
+        else:
+            answer.model = model or GPT_MODEL
+        answer.cache_model = question_cache_model(model)
+
+    # if we've seen this question before (for this model and this version of the prompt) reuse its SQL and skip OpenAI.
+    # Failing that, if it's one of the common kinds of question write the SQL ourselves, or if we've seen one like it
+    # with other names or numbers, fill those into its SQL
+    template_cache = get_template_cache()
+    intent_matcher = get_intent_matcher()
+    if use_cache:
+        with answer.stage('cache'):
+            answer.sql = get_question_cache().get(question, answer.cache_model, answer.tools_fingerprint)
+            tracing.count('chatbot_cache_total', cache='question', result='miss' if answer.sql is None else 'hit')
+            answer.from_cache = answer.sql is not None
+            if answer.sql is None and intent_matcher is not None:
+                answer.intent, answer.sql = intent_matcher.match(question, mentions) or (None, None)
+                tracing.count('chatbot_intent_total', intent=answer.intent or 'none')
+            if answer.sql is None and template_cache is not None:
+                answer.sql = template_cache.match(question, mentions, answer.cache_model)
+                tracing.count('chatbot_cache_total', cache='template', result='miss' if answer.sql is None else 'hit')
+                answer.from_template = answer.sql is not None
+    if answer.sql is not None:
+        answer.function_name = 'ask_database'
+        answer.tier = None   # SQL that already worked once, nothing to escalate
+        return answer
+
+    hedger = get_hedger()
+    if hedger is not None:
+        hedge_model(answer, client, hedger, on_sql)
+    else:
+        ask_model(answer, client, stream, on_sql)
+    if answer.sql is None and answer.tier == 'fast':
+        escalate(answer, client, 'no_query', stream, on_sql)
+    return answer
+
+
+def ask_model(answer, client, stream=False, on_sql=None):
+    """The llm and parse stages: ask answer.model for the SQL."""
+    answer.llm_attempts += 1
+    started = time.perf_counter()
+    tool_calls = None
+    with answer.stage('llm'):
+        if stream:
+            # show the SQL while the model is still writing it, and run it the moment it's complete
+            answer.function_name, arguments = stream_question_openai(answer.prompt, answer.tools, client, answer.model,
+                                                                     on_sql=on_sql)
+            if arguments is not None:
+                answer.sql = arguments['query']
+        else:
+            tool_calls = ask_question_openai(answer.prompt, answer.tools, client, answer.model).tool_calls
+    if answer.tier is not None:
+        get_model_router().record(answer.tier, time.perf_counter() - started)
+    if tool_calls:
+        # If true the model will return the name of the tool / function to call and the argument(s)
+        answer.function_name = tool_calls[-1].function.name
+        with answer.stage('parse'):
+            answer.sql = json.loads(tool_calls[-1].function.arguments)['query']
+
+
+def hedge_model(answer, client, hedger, on_sql=None):
+    """The llm stage, hedged: start asking for candidate queries (not streamed) and wait for the first one. The
+    others keep coming for run_sql to race, see hedging.py."""
+    router = get_model_router()
+
+    def ask(index, **options):
+        started = time.perf_counter()
+        tool_calls = ask_question_openai(answer.prompt, answer.tools, client, answer.model, **options).tool_calls
+        if answer.tier is not None:
+            router.record(answer.tier, time.perf_counter() - started)
+        if not tool_calls or tool_calls[-1].function.name != 'ask_database':
+            return None
+        return json.loads(tool_calls[-1].function.arguments)['query']
+
+    with answer.stage('llm'):
+        answer.hedge = hedger.start(ask, answer.prompt, answer.tools)
+        try:
+            candidate = answer.hedge.first()
+        except Exception:
+            answer.llm_attempts += answer.hedge.sent
+            answer.hedge = None
+            raise
+    if candidate is None:
+        answer.llm_attempts += answer.hedge.sent
+        answer.hedge = None
+        return
+    answer.function_name = 'ask_database'
+    answer.sql = candidate.sql
+    answer.candidate = candidate.index
+    if on_sql is not None:
+        on_sql(answer.sql)
+
+
+def race_candidates(answer, governor):
+    """Run the hedged candidate queries as they arrive, each on its own connection, until one returns rows. Returns
+    whether one did, and if so answer has its SQL and result."""
+    hedge, answer.hedge = answer.hedge, None
+
+    def run(sql):
+        with get_db_pool().connection() as conn, interruptible(conn):
+            error = validate(conn, sql)
+            if error is not None:
+                raise ValueError(error)
+            return run_query(conn, sql, get_result_cache(), governor, get_query_log(), answer.question,
+                             hedge.sent, get_backend_router())
+
+    try:
+        with answer.stage('execute'):
+            winner = hedge.race(run, lambda outcome: outcome[0].num_rows > 0)
+            if winner is not None:
+                tracing.annotate(rows=winner.outcome[0].num_rows, truncated=winner.outcome[1], candidate=winner.index)
+    finally:
+        answer.llm_attempts += hedge.sent
+    if winner is None:
+        return False
+    answer.sql, answer.candidate = winner.sql, winner.index
+    answer.result, answer.truncated = winner.outcome
+    tracing.count('chatbot_rows_total', answer.result.num_rows)
+    answer.response = format_rows(answer.result, answer.truncated, governor)
+    return True
+
+
+def escalate(answer, client, reason, stream=False, on_sql=None):
+    """Start again with the strong model, because the fast model's answer didn't work out: it wrote no query
+    ('no_query'), SQL that doesn't compile ('invalid_sql') or a query that returned nothing ('empty_result').
+    Returns whether the strong model answered. If its request fails (an OpenAI error, a timeout, LLMBusy) the fast
+    model's answer is put back as it was and it returns False."""
+    check_cancelled()
+    router = get_model_router()
+    router.escalated(reason)
+    fast = {name: getattr(answer, name) for name in FAST_ANSWER}
+    answer.tier, answer.model, answer.escalated = 'strong', router.strong_model, reason
+    answer.function_name = answer.sql = answer.result = answer.error = answer.response = answer.candidate = None
+    answer.truncated = False
+    try:
+        ask_model(answer, client, stream, on_sql)
+    except QueryCancelled:
+        raise
+    except Exception as e:
+        tracing.count('chatbot_escalations_failed_total', reason=reason)
+        tracing.annotate(escalation_error=str(e))
+        for name, value in fast.items():
+            setattr(answer, name, value)
+        return False
+    return True
+
+
+def run_sql(answer, client, use_cache=True):
+    """The second half of answer_question: the validate and execute stages, for an Answer from write_sql, escalating
+    a fast model's SQL that doesn't compile or returns no rows to the strong model. Hedged candidates (hedging.py)
+    race each other first, and only if none of them returns rows does the first one to arrive go on this way. The app
+    runs it on the query executor, where Job.cancel() interrupts the connection and the answer comes back "Query
+    stopped."."""
+    if answer.sql is None or answer.function_name != 'ask_database':
+        return answer
+
+    governor = get_query_governor()
+
+    def repair(sql, error):
+        check_cancelled()   # a stopped query's "interrupted" error isn't something for OpenAI to fix
+        return repair_sql(client, answer.model, sql, error)
+
+    try:
+        # hedged candidates race each other first, if none of them returns rows the first one goes on as usual
+        won = answer.hedge is not None and race_candidates(answer, governor)
+        if not won:
+            with get_db_pool().connection() as conn, interruptible(conn):
+                while True:
+                    can_escalate = answer.tier == 'fast'
+                    with answer.stage('validate'):
+                        # compile the SQL before running it. If it doesn't compile, escalate the fast model's SQL to
+                        # the strong model, and ask the strong model (or the only one) to fix its own
+                        attempts = 0 if can_escalate else REPAIR_MAX_ATTEMPTS
+                        answer.sql, error, repairs = repair_loop(conn, answer.sql, repair, max_attempts=attempts,
+                                                                 budget_seconds=REPAIR_BUDGET_SECONDS)
+                    answer.llm_attempts += repairs
+                    if error is not None and can_escalate:
+                        if not escalate(answer, client, 'invalid_sql'):
+                            answer.error = error   # the fast model's SQL, and why it doesn't compile
+                            answer.response = f"query failed with error: {error}"
+                            return answer
+                        if answer.sql is None:
+                            return answer
+                        continue
+                    if error is not None:
+                        answer.error = error
+                        answer.response = f"query failed with error: {error}"
+                        return answer
+                    try:
+                        with answer.stage('execute'):
+                            answer.result, answer.truncated = run_query(conn, answer.sql, get_result_cache(),
+                                                                        governor, get_query_log(), answer.question,
+                                                                        answer.llm_attempts, get_backend_router())
+                            tracing.annotate(rows=answer.result.num_rows, truncated=answer.truncated)
+                        tracing.count('chatbot_rows_total', answer.result.num_rows)
+                        answer.response = format_rows(answer.result, answer.truncated, governor)
+                    except QueryCancelled:
+                        raise
+                    except QueryBudgetExceeded as e:
+                        answer.error = str(e)
+                        answer.response = f"query stopped by the query governor: {e}"
+                    except Exception as e:
+                        answer.error = str(e)
+                        answer.response = f"query failed with error: {e}"
+                    if can_escalate and answer.error is None and answer.result.num_rows == 0:
+                        empty = (answer.sql, answer.result, answer.response)
+                        if not escalate(answer, client, 'empty_result') or answer.sql is None:
+                            # the strong model failed or had nothing better, the empty result stands
+                            answer.function_name = 'ask_database'
+                            answer.sql, answer.result, answer.response = empty
+                            break
+                        continue
+                    break
+    except QueryCancelled as e:
+        # stopped from the UI (executor.py), not worth caching either way
+        answer.error = str(e)
+        answer.response = "Query stopped."
+        return answer
+
+    if use_cache and answer.error is None:
+        get_question_cache().put(answer.question, answer.cache_model, answer.tools_fingerprint, answer.sql)
+        template_cache = get_template_cache()
+        if template_cache is not None and not answer.from_template and answer.intent is None:
+            template_cache.learn(answer.question, answer.mentions, answer.cache_model, answer.sql)
+    return answer
+
+
+def prime_question_cache(paths, model=None):
+    """Put the question -> SQL pairs that ran without error in JSONL files (e.g. batch.py output) into the question
+    cache, and their templates into the template cache, so those questions (and ones like them) are answered without
+    asking OpenAI. Returns how many were added."""
+    question_cache = get_question_cache()
+    template_cache = get_template_cache()
+    entity_index = get_entity_index()
+    cache_model = question_cache_model(model)
+    added = 0
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not entry.get('question') or not entry.get('sql') or entry.get('error'):
+                    continue
+                _, fingerprint = tools_for_question(entry['question'])
+                question_cache.put(entry['question'], cache_model, fingerprint, entry['sql'])
+                if template_cache is not None and entity_index is not None:
+                    template_cache.learn(entry['question'], entity_index.resolve(entry['question']), cache_model,
+                                         entry['sql'])
+                added += 1
+    return added
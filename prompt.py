@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The prompt we send to OpenAI: the ask_database tool, whose description holds our instructions, sample queries and the
+documentation of the database tables.
+
+The table documentation is kept one section per table so that build_tools can send only the tables a question needs.
+The sample queries come from the example store (examples.py), which picks the ones most similar to the question.
+"""
+
+from functools import lru_cache
+
+from aggregates import SCHEMA_DOCS as SUMMARY_TABLE_DOCS
+from query_cache import prompt_fingerprint
+
+INSTRUCTIONS = """
+                                SQL query extracting information from the database to answer the user's question.
+                                SQL query should be provided as text, not JSON. Use the following database design.
+{summary_tables}
+Here are some sample correct queries in the format user (input, query)
+
+"""
+
+# only when the summary tables are documented in the prompt
+SUMMARY_INSTRUCTIONS = """                                For career totals, totals for a player with one team, post-season totals by round and season league leaders,
+                                prefer the precomputed summary tables described at the end (CareerBatting, CareerPitching, PlayerTeamBatting,
+                                PlayerTeamPitching, CareerBattingPost, SeasonLeaders) over SUM(...) GROUP BY on Batting, Pitching or BattingPost.
+"""
+
+# how the tables fit together. Always sent, it's what tells the LLM how to join on playerID/yearID/teamID
+SCHEMA_OVERVIEW = """The database design follows these general principles.  Each player is assigned a unique number (playerID).  All of the information relating to that player
+is tagged with his playerID.  The playerIDs are linked to names and birthdates in the People table.
+
+The database is comprised of the following main tables:
+
+  People                 Player names and biographical information
+  Teams                  Yearly stats and standings 
+  TeamsFranchises        Franchise information
+  Parks                  List of major league ballparks
+  Batting                Batting statistics
+  Pitching               Pitching statistics
+  Fielding               Fielding statistics
+  FieldingOF             Outfield position data for years where LF/CF/RF fielding data is available
+  FieldingOFsplit        LF/CF/RF game played splits for all years, including those where LF/CF/RF fielding data is not available
+  Appearances            Details on the positions a player appeared at
+  Managers               Managerial statistics
+
+It is supplemented by these tables:
+
+  AllStarFull            All-Star appearances
+  BattingPost            Post-season batting statistics
+  PitchingPost           Post-season pitching statistics
+  FieldingPost           Post-season fielding data
+  SeriesPost             Post-season series information
+  HomeGames              Number of home games played by each team in each ballpark
+  ManagersHalf           Split season data for managers
+  TeamsHalf              Split season data for teams
+  AwardsManagers         Awards won by managers 
+  AwardsPlayers          Awards won by players
+  AwardsShareManagers    Award voting data for manager awards
+  AwardsSharePlayers     Award voting data for player awards
+  HallofFame             Hall of Fame voting data
+  CollegePlaying         List of players and the colleges they attended (last updated 2014)
+  Salaries               Player salary data (last updated 2016)
+  Schools                List of colleges that players attended (last updated 2014)
+
+"""
+
+# table name -> documentation of its columns
+TABLE_DOCS = {
+    'People': """--------------------------------------------------------------------------------------------------------------------------------------------
+PEOPLE TABLE
+
+
+playerID       A unique code assigned to each player.  The playerID links the data in this file with records in the other files.
+birthYear      Year player was born
+birthMonth     Month player was born
+birthDay       Day player was born
+birthCountry   Country where player was born
+birthState     State where player was born
+birthCity      City where player was born
+deathYear      Year player died
+deathMonth     Month player died
+deathDay       Day player died
+deathCountry   Country where player died
+deathState     State where player died
+deathCity      City where player died
+nameFirst      Player's first name
+nameLast       Player's last name
+nameGiven      Player's given name (typically first and middle)
+weight         Player's weight in pounds
+height         Player's height in inches
+bats           Player's batting hand (left, right, or both)         
+throws         Player's throwing hand (left or right)
+debut          Date that player made first major league appearance
+finalGame      Date that player made first major league appearance (includes date of last played game even if still active)
+retroID        ID used by Retrosheet
+bbrefID        ID used by Baseball Reference website
+
+""",
+    'Teams': """---------------------------------------------------------------------
+TEAMS TABLE
+
+yearID         Year
+lgID           League
+teamID         Team
+franchID       Franchise (links to TeamsFranchise table)
+divID          Team's division
+Rank           Position in final standings
+G              Games played
+GHome          Games played at home
+W              Wins
+L              Losses
+DivWin         Division Winner (Y or N)
+WCWin          Wild Card Winner (Y or N)
+LgWin          League Champion(Y or N)
+WSWin          World Series Winner (Y or N)
+R              Runs scored
+AB             At bats
+H              Hits by batters
+2B             Doubles
+3B             Triples
+HR             Homeruns by batters
+BB             Walks by batters
+SO             Strikeouts by batters
+SB             Stolen bases
+CS             Caught stealing
+HBP            Batters hit by pitch
+SF             Sacrifice flies
+RA             Opponents runs scored
+ER             Earned runs allowed
+ERA            Earned run average
+CG             Complete games
+SHO            Shutouts
+SV             Saves
+IPOuts         Outs Pitched (innings pitched x 3)
+HA             Hits allowed
+HRA            Homeruns allowed
+BBA            Walks allowed
+SOA            Strikeouts by pitchers
+E              Errors
+DP             Double Plays
+FP             Fielding  percentage
+name           Team's full name
+park           Name of team's home ballpark
+attendance     Home attendance total
+BPF            Three-year park factor for batters
+PPF            Three-year park factor for pitchers
+teamIDBR       Team ID used by Baseball Reference website
+teamIDlahman45 Team ID used in Lahman database version 4.5
+teamIDretro    Team ID used by Retrosheet
+
+""",
+    'TeamsFranchises': """--------------------------------------------------------------------------------------------------------------------------------------------
+TEAMSFRANCHISES TABLE
+
+franchID       Franchise ID
+franchName     Franchise name
+active         Whether team is currently active or not (Y or N)
+NAassoc        ID of National Association team franchise played as
+
+""",
+    'Parks': """--------------------------------------------------------------------------------------------------------------------------------------------
+PARKS TABLE
+
+parkkey        Ballpark ID code
+parkname       Name of ballpark
+parkalias      Alternate names of ballpark, separated by semicolon
+city           City
+state          State 
+country        Country
+
+""",
+    'Batting': """--------------------------------------------------------------------------------------------------------------------------------------------
+BATTING TABLE
+
+playerID       Player ID code
+yearID         Year
+stint          player's stint (order of appearances within a season)
+teamID         Team
+lgID           League
+G              Games
+AB             At Bats
+R              Runs
+H              Hits
+2B             Doubles
+3B             Triples
+HR             Homeruns
+RBI            Runs Batted In
+SB             Stolen Bases
+CS             Caught Stealing
+BB             Base on Balls
+SO             Strikeouts
+IBB            Intentional walks
+HBP            Hit by pitch
+SH             Sacrifice hits
+SF             Sacrifice flies
+GIDP           Grounded into double plays
+
+""",
+    'Pitching': """--------------------------------------------------------------------------------------------------------------------------------------------
+PITCHING TABLE
+
+playerID       Player ID code
+yearID         Year
+stint          player's stint (order of appearances within a season)
+teamID         Team
+lgID           League
+W              Wins
+L              Losses
+G              Games
+GS             Games Started
+CG             Complete Games 
+SHO            Shutouts
+SV             Saves
+IPOuts         Outs Pitched (innings pitched x 3)
+H              Hits
+ER             Earned Runs
+HR             Homeruns
+BB             Walks
+SO             Strikeouts
+BAOpp          Opponent's Batting Average
+ERA            Earned Run Average
+IBB            Intentional Walks
+WP             Wild Pitches
+HBP            Batters Hit By Pitch
+BK             Balks
+BFP            Batters faced by Pitcher
+GF             Games Finished
+R              Runs Allowed
+SH             Sacrifices by opposing batters
+SF             Sacrifice flies by opposing batters
+GIDP           Grounded into double plays by opposing batter
+
+""",
+    'Fielding': """--------------------------------------------------------------------------------------------------------------------------------------------
+FIELDING TABLE
+
+playerID       Player ID code
+yearID         Year
+stint          player's stint (order of appearances within a season)
+teamID         Team
+lgID           League
+Pos            Position
+G              Games 
+GS             Games Started
+InnOuts        Time played in the field expressed as outs 
+PO             Putouts
+A              Assists
+E              Errors
+DP             Double Plays
+PB             Passed Balls (by catchers)
+WP             Wild Pitches (by catchers)
+SB             Opponent Stolen Bases (by catchers)
+CS             Opponents Caught Stealing (by catchers)
+ZR             Zone Rating
+
+""",
+    'FieldingOF': """--------------------------------------------------------------------------------------------------------------------------------------------
+FIELDINGOF TABLE
+
+playerID       Player ID code
+yearID         Year
+stint          Player's stint (order of appearances within a season)
+Glf            Games played in left field
+Gcf            Games played in center field
+Grf            Games played in right field
+
+""",
+    'FieldingOFsplit': """--------------------------------------------------------------------------------------------------------------------------------------------
+FIELDINGOFSPLIT TABLE
+
+playerID       Player ID code
+yearID         Year
+stint          Player's stint (order of appearances within a season)
+teamID         Team
+lgID           League
+Pos            Position
+G              Games 
+GS             Games Started
+InnOuts        Time played in the field expressed as outs 
+PO             Putouts
+A              Assists
+E              Errors
+DP             Double Plays
+
+""",
+    'Appearances': """--------------------------------------------------------------------------------------------------------------------------------------------
+APPEARANCES TABLE
+
+yearID         Year
+teamID         Team
+lgID           League
+playerID       Player ID code
+G_all          Total games played
+GS             Games started
+G_batting      Games in which player batted
+G_defense      Games in which player appeared on defense
+G_p            Games as pitcher
+G_c            Games as catcher
+G_1b           Games as first baseman
+G_2b           Games as second baseman
+G_3b           Games as third baseman
+G_ss           Games as shortstop
+G_lf           Games as left fielder
+G_cf           Games as center fielder
+G_rf           Games as right fielder
+G_of           Games as outfielder
+G_dh           Games as designated hitter
+G_ph           Games as pinch hitter
+G_pr           Games as pinch runner
+
+""",
+    'Managers': """--------------------------------------------------------------------------------------------------------------------------------------------
+MANAGERS TABLE
+ 
+playerID       Player ID Number
+yearID         Year
+teamID         Team
+lgID           League
+inseason       Managerial order, in order of appearance during the year.  One if the individual managed the team the entire year. 
+G              Games managed
+W              Wins
+L              Losses
+rank           Team's final position in standings that year
+plyrMgr        Player Manager (denoted by 'Y')
+
+""",
+    'AllStarFull': """--------------------------------------------------------------------------------------------------------------------------------------------
+ALLSTARFULL TABLE
+
+playerID       Player ID code
+YearID         Year
+gameNum        Game number (zero if only one All-Star game played that season)
+gameID         Retrosheet ID for the game idea
+teamID         Team
+lgID           League
+GP             1 if Played in the game
+startingPos    If player was game starter, the position played
+
+""",
+    'BattingPost': """--------------------------------------------------------------------------------------------------------------------------------------------
+BATTINGPOST TABLE
+
+yearID         Year
+round          Level of playoffs 
+playerID       Player ID code
+teamID         Team
+lgID           League
+G              Games
+AB             At Bats
+R              Runs
+H              Hits
+2B             Doubles
+3B             Triples
+HR             Homeruns
+RBI            Runs Batted In
+SB             Stolen Bases
+CS             Caught stealing
+BB             Base on Balls
+SO             Strikeouts
+IBB            Intentional walks
+HBP            Hit by pitch
+SH             Sacrifices
+SF             Sacrifice flies
+GIDP           Grounded into double plays
+
+""",
+    'PitchingPost': """--------------------------------------------------------------------------------------------------------------------------------------------
+PITCHINGPOST TABLE
+
+playerID       Player ID code
+yearID         Year
+round          Level of playoffs 
+teamID         Team
+lgID           League
+W              Wins
+L              Losses
+G              Games
+GS             Games Started
+CG             Complete Games
+SHO            Shutouts 
+SV             Saves
+IPOuts         Outs Pitched (innings pitched x 3)
+H              Hits
+ER             Earned Runs
+HR             Homeruns
+BB             Walks
+SO             Strikeouts
+BAOpp          Opponents' batting average
+ERA            Earned Run Average
+IBB            Intentional Walks
+WP             Wild Pitches
+HBP            Batters Hit By Pitch
+BK             Balks
+BFP            Batters faced by Pitcher
+GF             Games Finished
+R              Runs Allowed
+SH             Sacrifice Hits allowed
+SF             Sacrifice Flies allowed
+GIDP           Grounded into Double Plays
+
+""",
+    'FieldingPost': """--------------------------------------------------------------------------------------------------------------------------------------------
+FIELDINGPOST TABLE
+
+playerID       Player ID code
+yearID         Year
+teamID         Team
+lgID           League
+round          Level of playoffs 
+Pos            Position
+G              Games 
+GS             Games Started
+InnOuts        Time played in the field expressed as outs 
+PO             Putouts
+A              Assists
+E              Errors
+DP             Double Plays
+TP             Triple Plays
+PB             Passed Balls
+SB             Stolen Bases allowed (by catcher)
+CS             Caught Stealing (by catcher)
+
+""",
+    'SeriesPost': """--------------------------------------------------------------------------------------------------------------------------------------------
+SERIESPOST TABLE
+
+yearID         Year
+round          Level of playoffs 
+teamIDwinner   Team ID of the team that won the series
+lgIDwinner     League ID of the team that won the series
+teamIDloser    Team ID of the team that lost the series
+lgIDloser      League ID of the team that lost the series 
+wins           Wins by team that won the series
+losses         Losses by team that won the series
+ties           Tie games
+
+""",
+    'HomeGames': """--------------------------------------------------------------------------------------------------------------------------------------------
+HOMEGAMES TABLE
+
+yearkey        Year
+leaguekey      League
+teamkey        Team ID
+parkkey        Ballpark ID
+spanfirst      Date of first game played
+spanlast       Date of last game played
+games          Total number of games
+openings       Total number of paid dates played (games with attendance)
+attendance     Total attendance
+
+""",
+    'ManagersHalf': """--------------------------------------------------------------------------------------------------------------------------------------------
+MANAGERSHALF TABLE
+
+playerID       Manager ID code
+yearID         Year
+teamID         Team
+lgID           League
+inseason       Managerial order, in order of appearance during the year.  One if the individual managed the team the entire year. 
+half           First or second half of season
+G              Games managed
+W              Wins
+L              Losses
+rank           Team's position in standings for the half
+
+""",
+    'TeamsHalf': """--------------------------------------------------------------------------------------------------------------------------------------------
+TEAMSHALF TABLE
+
+yearID         Year
+lgID           League
+teamID         Team
+half           First or second half of season
+divID          Division
+DivWin         Won Division (Y or N)
+rank           Team's position in standings for the half
+G              Games played
+W              Wins
+L              Losses
+
+""",
+    'AwardsManagers': """--------------------------------------------------------------------------------------------------------------------------------------------
+AWARDSMANAGERS TABLE
+
+playerID       Manager ID code
+awardID        Name of award won
+yearID         Year
+lgID           League
+tie            Award was a tie (Y or N)
+notes          Notes about the award
+
+""",
+    'AwardsPlayers': """--------------------------------------------------------------------------------------------------------------------------------------------
+AWARDSPLAYERS TABLE
+
+playerID       Player ID code
+awardID        Name of award won
+yearID         Year
+lgID           League
+tie            Award was a tie (Y or N)
+notes          Notes about the award
+
+""",
+    'AwardsShareManagers': """--------------------------------------------------------------------------------------------------------------------------------------------
+AWARDSSHAREMANAGERS TABLE
+
+awardID        Name of award votes were received for
+yearID         Year
+lgID           League
+playerID       Manager ID code
+pointsWon      Number of points received
+pointsMax      Maximum number of points possible
+votesFirst     Number of first place votes
+
+""",
+    'AwardsSharePlayers': """--------------------------------------------------------------------------------------------------------------------------------------------
+AWARDSSHAREPLAYERS TABLE
+
+awardID        Name of award votes were received for
+yearID         Year
+lgID           League
+playerID       Player ID code
+pointsWon      Number of points received
+pointsMax      Maximum number of points possible
+votesFirst     Number of first place votes
+
+""",
+    'HallofFame': """--------------------------------------------------------------------------------------------------------------------------------------------
+HALLOFFAME TABLE
+
+playerID       Player ID code
+yearID         Year of ballot
+votedBy        Method by which player was voted upon
+ballots        Total ballots cast in that year
+needed         Number of votes needed for selection in that year
+votes          Total votes received
+inducted       Whether player was inducted by that vote or not (Y or N)
+category       Category in which candidate was honored
+needed_note    Explanation of qualifiers for special elections, revised in 2023 to include important notes about the record.
+
+""",
+    'CollegePlaying': """--------------------------------------------------------------------------------------------------------------------------------------------
+COLLEGEPLAYING TABLE
+
+playerid       Player ID code
+schoolID       School ID code
+year           Year
+
+""",
+    'Salaries': """--------------------------------------------------------------------------------------------------------------------------------------------
+SALARIES TABLE
+
+yearID         Year
+teamID         Team
+lgID           League
+playerID       Player ID code
+salary         Salary
+
+""",
+    'Schools': """--------------------------------------------------------------------------------------------------------------------------------------------
+SCHOOLS TABLE
+
+schoolID       School ID code
+schoolName     School name
+schoolCity     City where school is located
+schoolState    State where school's city is located
+schoolNick     Nickname for school's baseball team
+""",
+}
+
+# the precomputed summary tables are built from these
+SUMMARY_SOURCE_TABLES = {'Batting', 'Pitching', 'BattingPost'}
+
+CLOSING = '\n                                '
+
+
+def format_examples(examples):
+    return ''.join(f'("{question}","{sql}")\n' for question, sql in examples) + '\n'
+
+
+def query_description(tables=None, examples=()):
+    """Description of the ask_database query parameter, with these (question, sql) examples.
+    Documents only `tables` if given, otherwise every table."""
+    names = list(TABLE_DOCS) if tables is None else [name for name in TABLE_DOCS if name in tables]
+    summaries = tables is None or bool(SUMMARY_SOURCE_TABLES & set(names))
+    description = (INSTRUCTIONS.format(summary_tables=SUMMARY_INSTRUCTIONS if summaries else '') + format_examples(examples) +
+                   SCHEMA_OVERVIEW + ''.join(TABLE_DOCS[name] for name in names) + CLOSING)
+    if summaries:
+        description += SUMMARY_TABLE_DOCS
+    return description
+
+
+def build_tools(tables=None, examples=()):
+    # Open AI's tools feature lets us force OpenAI's output to be an input to another module. In this case we'll force it to be a SQL query
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": "ask_database",
+                "description": "Use this function to answer user questions about baseball. Input should be a fully formed SQL query.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": query_description(tables, examples),
+                        }
+                    },
+                    "required": ["query"],
+                },
+            }
+        }
+    ]
+
+
+@lru_cache(maxsize=1024)
+def compiled_tools(tables=None, examples=()):
+    """(tools, fingerprint) for these tables and examples, built once and reused. Don't modify the returned tools.
+    `tables` must be a frozenset (or None) and `examples` a tuple, so they can be cache keys."""
+    tools = build_tools(tables, examples)
+    return tools, prompt_fingerprint(tools)
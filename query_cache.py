@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache that maps a (normalized) user question to the SQL that OpenAI generated for it,
+so that asking the same thing twice doesn't cost a second round trip to the LLM.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# words that don't change the meaning of a question for our purposes. Be careful adding to this list:
+# words like "not", "never", "no", "most", "top" and all numbers change the SQL and must stay in the key
+STOP_WORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'at', 'for', 'to', 'and',
+    'is', 'are', 'was', 'were', 'be', 'been', 'do', 'does', 'did',
+    'please', 'can', 'could', 'would', 'you', 'me', 'tell', 'show', 'give', 'list',
+    'what', 'who', 'which', 'whom',
+}
+
+
+def normalize_question(question):
+    """Reduce a question to a canonical form: lower case, no punctuation, no stop words, single spaces."""
+    text = question.lower()
+    text = re.sub(r"'s\b", '', text)            # "Carew's" -> "carew"
+    text = re.sub(r'[^a-z0-9]+', ' ', text)
+    words = [w for w in text.split() if w not in STOP_WORDS]
+    return ' '.join(words)
+
+
+def prompt_fingerprint(tools, prompt=''):
+    """Short hash of the prompt/tools text. Any edit to the prompt changes this, which invalidates old cache entries."""
+    payload = json.dumps(tools, sort_keys=True) + prompt
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class QuestionCache:
+    """Thread safe LRU cache, with a time to live, of question -> generated SQL."""
+
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> (expires_at, sql)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question, model, fingerprint):
+        return (model, fingerprint, normalize_question(question))
+
+    def get(self, question, model, fingerprint):
+        """Return the cached SQL for this question, or None if we don't have a live entry."""
+        key = self.make_key(question, model, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, question, model, fingerprint, sql):
+        key = self.make_key(question, model, fingerprint)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, sql)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)   # evict the least recently used entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
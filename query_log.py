@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Append-only JSONL log of the SQL that ask_database actually executes, with how long each query took and how many
+OpenAI requests it took to get it. The index advisor (indexes.py advise) replays it to find indexes we're missing.
+"""
+
+import json
+import threading
+import time
+
+
+class QueryLog:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, query, seconds, row_count, question=None, llm_attempts=None):
+        entry = {'ts': round(time.time(), 3), 'sql': query, 'seconds': round(seconds, 6), 'rows': row_count}
+        if question is not None:
+            entry['question'] = question
+        if llm_attempts is not None:
+            entry['llm_attempts'] = llm_attempts   # 0 when the SQL came from the question cache, +1 per repair
+        line = json.dumps(entry)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def read_query_log(path):
+    """Yield the entries of a query log, skipping any line that isn't valid JSON (e.g. a partially written last line)."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Everything the app needs that's expensive to build: the OpenAI client, the database connection pool, the query
+executor, the example index, the entity index, the intent matcher, the model router, the hedger, the caches and the compiled prompt. Streamlit re-runs app.py from the
+top on every interaction, so each of these is an st.cache_resource, built once per process and shared by every session
+and every rerun.
+
+warm_resources() builds them all, reads the database file into the OS page cache and writes a startup time report to
+READY_FILE. In the container serve.py calls it in the streamlit server's own process before the server starts, so
+the first page load finds everything built, and healthcheck.py reports the container ready only once that file
+exists. Run with plain `streamlit run app.py` it happens on the first page load instead.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from openai import OpenAI
+
+from config import (DB_PATH, DB_POOL_SIZE, DB_MMAP_SIZE, DB_CACHE_SIZE_KB, DB_PREFETCH, QUERY_MAX_SECONDS,
+                    QUERY_MAX_VM_STEPS, QUERY_MAX_ROWS, LARGE_TABLE_ROWS, QUERY_LOG_PATH, EXAMPLE_PATHS, EXAMPLES_TOP_K,
+                    QUESTION_CACHE_SIZE, QUESTION_CACHE_TTL, TEMPLATE_CACHE, TEMPLATE_CACHE_SIZE, INTENTS,
+                    DB_STATEMENT_CACHE, RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, READY_FILE,
+                    ENTITY_RESOLUTION, ENTITY_MAX_CANDIDATES, ENTITY_FUZZY_THRESHOLD, TRACE_LOG, METRICS_PORT,
+                    COLUMNAR_BACKEND, COLUMNAR_PATH, COLUMNAR_MIN_SCAN_ROWS, COLUMNAR_COMPARE,
+                    QUESTION_CACHE_PRIME_PATHS, SQL_WORKERS, SQL_SESSION_CONCURRENCY, SQL_MAX_QUEUED,
+                    MODEL_ROUTING, FAST_MODEL, STRONG_MODEL, ROUTE_MAX_WORDS, ROUTE_MAX_TABLES, ROUTE_MAX_AMBIGUOUS,
+                    HEDGE, HEDGE_CANDIDATES, HEDGE_DELAY_SECONDS, HEDGE_TEMPERATURE, HEDGE_TOKENS_PER_MINUTE,
+                    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_TIMEOUT_SECONDS, LLM_MAX_RETRIES,
+                    LLM_MAX_QUEUE_SECONDS, HISTORY_SPILL_PATH, HISTORY_SPILL_MAX_BYTES)
+from backends import BackendRouter, BackendUnavailable, DuckDBBackend, SQLiteBackend
+from db import ConnectionPool
+from entities import EntityIndex
+from examples import ExampleStore
+from executor import QueryExecutor
+from governor import QueryGovernor
+from hedging import Hedger
+from intents import IntentMatcher
+from history import SpillStore
+from llm import GovernedClient
+from model_router import ModelRouter
+from prompt import compiled_tools
+from query_cache import QuestionCache
+from query_log import QueryLog
+from result_cache import ResultCache, database_fingerprint
+from templates import TemplateCache
+import tracing
+
+STARTUP_TIMINGS = {}   # resource -> seconds it took to build, in the order they were built
+
+
+@contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = time.perf_counter() - started
+
+
+@st.cache_resource
+def get_client():
+    """The OpenAI client, behind the rate limiter, retries and request coalescing of llm.py (which does the retrying,
+    so the SDK's own retries are off)."""
+    with timed('openai_client'):
+        client = OpenAI(api_key=os.environ['OPENAI_API_KEY'], max_retries=0)   # you need to put your Open AI key in an environment variable in your OS
+        return GovernedClient(client, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                              timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES, max_wait=LLM_MAX_QUEUE_SECONDS)
+
+
+@st.cache_resource
+def get_db_pool():
+    with timed('db_pool'):
+        pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE, mmap_size=DB_MMAP_SIZE, cache_size_kb=DB_CACHE_SIZE_KB,
+                              cached_statements=DB_STATEMENT_CACHE)
+        pool.warmup()
+    print('Opened database successfully')
+    return pool
+
+
+@st.cache_resource
+def get_query_governor():
+    with timed('query_governor'):
+        governor = QueryGovernor(max_seconds=QUERY_MAX_SECONDS, max_vm_steps=QUERY_MAX_VM_STEPS, max_rows=QUERY_MAX_ROWS,
+                                 large_table_rows=LARGE_TABLE_ROWS)
+        with get_db_pool().connection() as conn:
+            governor.large_tables(conn)   # counts the rows in every table, do it now rather than on the first question
+            governor.column_types(conn)
+        return governor
+
+
+@st.cache_resource
+def get_sql_executor():
+    """The worker threads the app runs queries on, so they can be stopped and are shared fairly between sessions."""
+    with timed('sql_executor'):
+        return QueryExecutor(workers=SQL_WORKERS, per_session=SQL_SESSION_CONCURRENCY, max_queued=SQL_MAX_QUEUED)
+
+
+@st.cache_resource
+def get_spill_store():
+    """Where sessions' older results go when their history outgrows HISTORY_MAX_BYTES."""
+    with timed('spill_store'):
+        return SpillStore(HISTORY_SPILL_PATH, max_bytes=HISTORY_SPILL_MAX_BYTES)
+
+
+@st.cache_resource
+def get_backend_router():
+    columnar = None
+    if COLUMNAR_BACKEND:
+        try:
+            with timed('columnar_backend'):
+                columnar = DuckDBBackend.load(COLUMNAR_PATH, DB_PATH, max_rows=QUERY_MAX_ROWS, max_seconds=QUERY_MAX_SECONDS)
+        except BackendUnavailable as e:
+            print(f'Columnar backend not used: {e}')
+    return BackendRouter(SQLiteBackend(get_query_governor()), columnar, min_scan_rows=COLUMNAR_MIN_SCAN_ROWS,
+                         compare=COLUMNAR_COMPARE)
+
+
+@st.cache_resource
+def get_query_log():
+    return QueryLog(QUERY_LOG_PATH) if QUERY_LOG_PATH else None
+
+
+@st.cache_resource
+def get_example_store():
+    with timed('example_index'):
+        return ExampleStore.from_files([path for path in EXAMPLE_PATHS if path])
+
+
+@st.cache_resource
+def get_entity_index():
+    if not ENTITY_RESOLUTION:
+        return None
+    with timed('entity_index'):
+        with get_db_pool().connection() as conn:
+            return EntityIndex.from_database(conn, max_candidates=ENTITY_MAX_CANDIDATES,
+                                             fuzzy_threshold=ENTITY_FUZZY_THRESHOLD)
+
+
+@st.cache_resource
+def get_intent_matcher():
+    if not INTENTS:
+        return None
+    with timed('intents'):
+        with get_db_pool().connection() as conn:
+            return IntentMatcher.from_database(conn, max_candidates=ENTITY_MAX_CANDIDATES)
+
+
+@st.cache_resource
+def get_model_router():
+    if not MODEL_ROUTING:
+        return None
+    return ModelRouter(FAST_MODEL, STRONG_MODEL, max_words=ROUTE_MAX_WORDS, max_tables=ROUTE_MAX_TABLES,
+                       max_ambiguous=ROUTE_MAX_AMBIGUOUS)
+
+
+@st.cache_resource
+def get_hedger():
+    if not HEDGE:
+        return None
+    return Hedger(candidates=HEDGE_CANDIDATES, delay_seconds=HEDGE_DELAY_SECONDS, temperature=HEDGE_TEMPERATURE,
+                  tokens_per_minute=HEDGE_TOKENS_PER_MINUTE)
+
+
+@st.cache_resource
+def get_question_cache():
+    return QuestionCache(max_entries=QUESTION_CACHE_SIZE, ttl_seconds=QUESTION_CACHE_TTL)
+
+
+@st.cache_resource
+def get_template_cache():
+    if not TEMPLATE_CACHE:
+        return None
+    return TemplateCache(max_entries=TEMPLATE_CACHE_SIZE, ttl_seconds=QUESTION_CACHE_TTL)
+
+
+@st.cache_resource
+def get_result_cache():
+    if not RESULT_CACHE_PATH:
+        return None
+    with timed('result_cache'):
+        return ResultCache(RESULT_CACHE_PATH, database_fingerprint(DB_PATH), max_bytes=RESULT_CACHE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_metrics_server():
+    """Starts writing request traces to TRACE_LOG, and serving /metrics on METRICS_PORT if it's set."""
+    tracing.configure(log_path=TRACE_LOG)
+    if not METRICS_PORT:
+        return None
+    with timed('metrics_server'):
+        return tracing.serve_metrics(METRICS_PORT)
+
+
+def prefetch_database(path, chunk_size=4 * 1024 * 1024):
+    """Read the whole database file once so its pages are in the OS page cache before the first query."""
+    with timed('db_prefetch'):
+        with open(path, 'rb') as f:
+            while f.read(chunk_size):
+                pass
+
+
+def warmup(prefetch=DB_PREFETCH, client=True, metrics=True):
+    """Build every resource now instead of on the first question. Returns {resource: seconds}."""
+    if prefetch:
+        prefetch_database(DB_PATH)
+    get_db_pool()
+    get_query_governor()
+    get_backend_router()
+    store = get_example_store()
+    get_entity_index()
+    get_intent_matcher()
+    get_model_router()
+    get_hedger()
+    with timed('prompt'):
+        compiled_tools(None, tuple(store.top_k('', EXAMPLES_TOP_K)))   # the full schema prompt, the one we fall back to
+    get_question_cache()
+    get_template_cache()
+    get_result_cache()
+    get_query_log()
+    get_sql_executor()
+    get_spill_store()
+    if metrics:
+        get_metrics_server()
+    if client:
+        get_client()
+    return dict(STARTUP_TIMINGS)
+
+
+@st.cache_resource
+def warm_resources():
+    """warmup() once per process, then prime the question cache and write the startup report to READY_FILE."""
+    from pipeline import prime_question_cache   # pipeline imports this module
+    if os.path.exists(READY_FILE):
+        os.remove(READY_FILE)   # not ready until this warmup succeeds
+    started = time.perf_counter()
+    timings = warmup(client=False)
+    if QUESTION_CACHE_PRIME_PATHS:
+        with timed('question_prime'):
+            primed = prime_question_cache(QUESTION_CACHE_PRIME_PATHS)
+        timings['question_prime'] = STARTUP_TIMINGS['question_prime']
+        print(f'Primed the question cache with {primed} questions')
+    total = time.perf_counter() - started
+    print(startup_report(timings, total))
+    with open(READY_FILE, 'w') as f:
+        json.dump({'ready_at': time.time(), 'total_seconds': total, 'timings': timings}, f, indent=2)
+    return timings
+
+
+def startup_report(timings, total=None):
+    lines = ['startup time report:']
+    for name, seconds in timings.items():
+        lines.append(f'  {name:<16} {seconds * 1000:9.1f} ms')
+    if total is not None:
+        lines.append(f'  {"total":<16} {total * 1000:9.1f} ms')
+    return '\n'.join(lines)
+
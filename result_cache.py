@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of SQL query results.
+
+The baseball database is read-only reference data, so the result of a query only changes when we ship a new .db file.
+Results are stored as compressed Arrow IPC (column names and types included) in a small SQLite file of their own. Point RESULT_CACHE_PATH at a shared volume and every
+replica (and every restart of the app) shares the same warm cache.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from results import from_ipc, to_ipc
+
+FORMAT_VERSION = 2   # bump this if the stored payload format changes, it's part of every key
+
+_TOKEN_RE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|(\s+)""")
+
+
+def canonicalize_sql(query):
+    """Collapse whitespace outside of quoted strings/identifiers and drop trailing semicolons, so trivially
+    different spellings of the same statement share a cache entry."""
+    def replace(match):
+        return match.group(1) if match.group(1) else ' '
+    return _TOKEN_RE.sub(replace, query).strip().rstrip(';').strip()
+
+
+def database_fingerprint(db_path):
+    """Cheap fingerprint of the database file: its size, modification time and 100 byte SQLite header
+    (which holds the file change counter). Shipping a new .db file changes the fingerprint."""
+    st = os.stat(db_path)
+    with open(db_path, 'rb') as f:
+        header = f.read(100)
+    h = hashlib.sha256()
+    h.update(f'{st.st_size}:{st.st_mtime_ns}:'.encode())
+    h.update(header)
+    return h.hexdigest()[:16]
+
+
+class ResultCache:
+    """Size bounded on-disk cache of query -> result table, keyed on the canonical SQL text and the database fingerprint."""
+
+    def __init__(self, path, db_fingerprint, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.db_fingerprint = db_fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # timeout makes writers from other processes/replicas wait for each other instead of failing
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                  key TEXT PRIMARY KEY,
+                                  payload BLOB NOT NULL,
+                                  size INTEGER NOT NULL,
+                                  created REAL NOT NULL,
+                                  last_used REAL NOT NULL,
+                                  hits INTEGER NOT NULL DEFAULT 0)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+
+    def make_key(self, query):
+        text = f'{FORMAT_VERSION}:{self.db_fingerprint}:{canonicalize_sql(query)}'
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, query):
+        """Return the cached result (a pyarrow Table) for this query, or None."""
+        key = self.make_key(query)
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return from_ipc(zlib.decompress(row[0]))
+
+    def put(self, query, table):
+        payload = zlib.compress(to_ipc(table))
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results (key, payload, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                               (self.make_key(query), payload, len(payload), now, now))
+            self._evict()
+
+    def _evict(self):
+        # drop least recently used entries until we're back under 90% of the size limit
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {'entries': entries, 'bytes': size, 'hits': self.hits, 'misses': self.misses}
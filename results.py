@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Query results as Arrow tables: typed columns with their names, instead of a list of tuples turned into one string.
+
+fetch_table pulls a cursor's rows fetchmany(batch_size) at a time into per-column lists, stopping one row past the
+row cap, and builds the table once at the end. SQLite doesn't enforce column types, so each column's type comes from
+its values (column_array), or when they are all NULL from its declared type, if the caller knows it. The app shows a table one page at a time (page), and only writes the whole result out
+when someone asks for the CSV (to_csv). pyarrow comes with streamlit.
+"""
+
+import io
+import re
+
+import pyarrow as pa
+import pyarrow.csv
+
+FETCH_BATCH_ROWS = 500
+
+
+def column_array(values, declared_type=None):
+    """A pyarrow array for one SQLite column. SQLite doesn't enforce column types, so the type comes from the values:
+    whole numbers become int64, numbers float64 and anything else a string. Empty strings in a numeric column (the
+    Lahman CSV imports leave them for missing stats) become NULLs."""
+    present = [v for v in values if v is not None and v != '']
+    if present and all(isinstance(v, int) for v in present):
+        return pa.array([v if v != '' else None for v in values], type=pa.int64())
+    if present and all(isinstance(v, (int, float)) for v in present):
+        return pa.array([float(v) if v not in (None, '') else None for v in values], type=pa.float64())
+    if present and all(isinstance(v, bytes) for v in present):
+        return pa.array(values, type=pa.binary())
+    if not present and re.search(r'INT|REAL|FLOA|DOUB|NUM', declared_type or '', re.IGNORECASE):
+        return pa.array([None] * len(values), type=pa.float64())
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def unique_names(names):
+    """Column names with repeats numbered (SELECT a.yearID, b.yearID gives yearID and yearID_2)."""
+    seen = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f'{name}_{seen[name]}')
+    return unique
+
+
+def make_table(names, columns, declared_types=None):
+    """A table from column names and a list of values per column, and optionally each column's declared type (None
+    where it has none), which decides the type of a column that is all NULL."""
+    declared_types = declared_types or [None] * len(names)
+    return pa.table([column_array(values, declared) for values, declared in zip(columns, declared_types)],
+                    names=unique_names(names))
+
+
+def fetch_table(cursor, max_rows, batch_size=FETCH_BATCH_ROWS, declared_types=None):
+    """Read at most max_rows rows of an executed cursor into a table, with the columns' declared_types if known (see
+    make_table). Returns (table, truncated)."""
+    names = [d[0] for d in cursor.description or ()]
+    columns = [[] for _ in names]
+    fetched = 0
+    while fetched <= max_rows:
+        batch = cursor.fetchmany(min(batch_size, max_rows + 1 - fetched))
+        if not batch:
+            break
+        for column, values in zip(columns, zip(*batch)):
+            column.extend(values)
+        fetched += len(batch)
+    truncated = fetched > max_rows
+    if truncated:
+        columns = [column[:max_rows] for column in columns]
+    return make_table(names, columns, declared_types), truncated
+
+
+def table_rows(table):
+    """The rows of a table as a list of tuples."""
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+def page(table, number, page_size):
+    """Rows [number * page_size, (number + 1) * page_size) of the table, without copying it."""
+    return table.slice(number * page_size, page_size)
+
+
+def page_count(table, page_size):
+    return max(1, -(-table.num_rows // page_size))
+
+
+def to_csv(table):
+    """The table as CSV bytes."""
+    out = io.BytesIO()
+    pyarrow.csv.write_csv(table, out)
+    return out.getvalue()
+
+
+def to_ipc(table):
+    """The table in the Arrow IPC stream format, for the result cache."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_ipc(data):
+    return pa.ipc.open_stream(data).read_all()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Picks the tables a question is likely to need, so we only send OpenAI the documentation for those tables instead of
+all 27 of them. Scoring is plain keyword/synonym matching, it runs locally in microseconds.
+When we can't tell what a question is about we return None, and the caller sends the full schema.
+"""
+
+import re
+
+# table -> words and phrases in a question that suggest we need it
+TABLE_KEYWORDS = {
+    'People': ['born', 'birth', 'birthplace', 'birthday', 'died', 'death', 'height', 'tall', 'weight', 'weigh',
+               'left handed', 'right handed', 'switch hitter', 'debut', 'debuted', 'final game', 'first name',
+               'last name', 'given name', 'nickname'],
+    'Batting': ['batting', 'bat', 'bats', 'batted', 'batter', 'batters', 'hitter', 'hitters', 'hit', 'hits', 'home run',
+                'home runs', 'homer', 'homers', 'homered', 'hr', 'hrs', 'rbi', 'rbis', 'runs batted in', 'average', 'avg',
+                'double', 'doubles', 'triple', 'triples', 'extra base', 'stolen base', 'stolen bases', 'steals', 'stole',
+                'walk', 'walks', 'bases on balls', 'strikeouts', 'struck out', 'at bats', 'at bat', 'slugging', 'on base',
+                'runs scored', 'sacrifice', 'grounded into'],
+    'Pitching': ['pitching', 'pitcher', 'pitchers', 'pitched', 'win', 'wins', 'winner', 'winners', 'winning', 'loss',
+                 'losses', 'save', 'saves', 'era', 'earned run', 'earned runs', 'strikeout', 'strikeouts', 'struck out',
+                 'shutout', 'shutouts', 'complete game', 'complete games', 'innings', 'no hitter', 'starter', 'starters',
+                 'reliever', 'relievers', 'closer', 'closers', 'balk', 'balks', 'wild pitch', 'wild pitches'],
+    'Fielding': ['fielding', 'fielder', 'position', 'positions', 'putout', 'putouts', 'assist', 'assists', 'error',
+                 'errors', 'double play', 'double plays', 'catcher', 'catchers', 'shortstop', 'shortstops',
+                 'first base', 'first baseman', 'second base', 'second baseman', 'third base', 'third baseman',
+                 'passed ball', 'passed balls', 'zone rating', 'defense', 'defensive'],
+    'FieldingOF': ['left field', 'center field', 'right field', 'left fielder', 'center fielder', 'right fielder'],
+    'FieldingOFsplit': ['left field', 'center field', 'right field', 'left fielder', 'center fielder', 'right fielder'],
+    'Appearances': ['appearance', 'appearances', 'appeared', 'games played', 'played for', 'played with', 'played on',
+                    'played in', 'roster', 'designated hitter', 'dh', 'pinch hitter', 'pinch runner', 'outfielder',
+                    'outfielders', 'only years', 'years when'],
+    'Teams': ['team', 'teams', 'standings', 'record', 'pennant', 'pennants', 'division', 'divisions', 'wild card',
+              'attendance', 'won the world series', 'world series winner', 'world series champion', 'champions',
+              'league champion', 'park factor', 'franchise', 'franchises'],
+    'TeamsFranchises': ['franchise', 'franchises', 'active', 'relocated', 'national association'],
+    'Parks': ['park', 'parks', 'ballpark', 'ballparks', 'stadium', 'stadiums'],
+    'HomeGames': ['home games', 'home game', 'ballpark', 'ballparks', 'stadium', 'stadiums', 'openings'],
+    'Managers': ['manager', 'managers', 'managed', 'managing', 'skipper', 'player manager', 'player managers'],
+    'ManagersHalf': ['split season', 'first half', 'second half'],
+    'TeamsHalf': ['split season', 'first half', 'second half'],
+    'AllStarFull': ['all star', 'all stars', 'allstar', 'allstars', 'mid summer classic'],
+    'BattingPost': ['postseason', 'post season', 'playoff', 'playoffs', 'world series', 'alcs', 'nlcs', 'alds', 'nlds',
+                    'division series', 'championship series', 'wild card game', 'october'],
+    'PitchingPost': ['postseason', 'post season', 'playoff', 'playoffs', 'world series', 'alcs', 'nlcs', 'alds',
+                     'nlds', 'division series', 'championship series', 'wild card game', 'october'],
+    'FieldingPost': ['postseason fielding', 'post season fielding', 'playoff fielding', 'world series fielding'],
+    'SeriesPost': ['series', 'won the world series', 'lost the world series', 'swept', 'sweep', 'pennant', 'champion',
+                   'champions', 'championship'],
+    'AwardsManagers': ['manager of the year'],
+    'AwardsPlayers': ['award', 'awards', 'mvp', 'mvps', 'most valuable', 'cy young', 'cy youngs', 'gold glove',
+                      'gold gloves', 'golden glove', 'golden gloves', 'silver slugger', 'silver sluggers', 'rookie of the year',
+                      'triple crown', 'reliever of the year', 'hank aaron award', 'roberto clemente'],
+    'AwardsShareManagers': ['manager of the year voting', 'manager of the year votes'],
+    'AwardsSharePlayers': ['vote', 'votes', 'voting', 'voted', 'points', 'first place votes', 'runner up', 'finished second'],
+    'HallofFame': ['hall of fame', 'hall of famer', 'hall of famers', 'hof', 'inducted', 'induction', 'cooperstown',
+                   'ballot', 'ballots'],
+    'CollegePlaying': ['college', 'colleges', 'university', 'universities', 'school', 'schools', 'ncaa', 'attended',
+                       'alma mater'],
+    'Schools': ['college', 'colleges', 'university', 'universities', 'school', 'schools', 'ncaa', 'attended', 'alma mater'],
+    'Salaries': ['salary', 'salaries', 'paid', 'pay', 'payroll', 'money', 'contract', 'dollars', 'earned the most'],
+}
+
+# tables whose docs we always send: People resolves player names, which nearly every question has
+ALWAYS_INCLUDE = {'People'}
+
+# if we pick the key, we also need these to make sense of it
+RELATED_TABLES = {
+    'CollegePlaying': {'Schools'},
+    'Schools': {'CollegePlaying'},
+    'AwardsSharePlayers': {'AwardsPlayers'},
+    'AwardsShareManagers': {'AwardsManagers', 'Managers'},
+    'AwardsManagers': {'Managers'},
+    'HomeGames': {'Parks'},
+    'ManagersHalf': {'Managers'},
+    'TeamsHalf': {'Teams'},
+    'SeriesPost': {'Teams'},
+    'FieldingOFsplit': {'Fielding'},
+}
+
+_KEYWORD_PATTERNS = {table: [re.compile(r'\b' + re.escape(k) + r'\b') for k in keywords]
+                     for table, keywords in TABLE_KEYWORDS.items()}
+
+
+def _clean(question):
+    text = question.lower().replace("'s ", ' ')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+
+def score_tables(question):
+    """table -> number of its keywords that appear in the question (only tables that scored)"""
+    text = _clean(question)
+    scores = {}
+    for table, patterns in _KEYWORD_PATTERNS.items():
+        score = sum(1 for p in patterns if p.search(text))
+        if score:
+            scores[table] = score
+    return scores
+
+
+def select_tables(question, min_score=1, max_tables=12):
+    """The set of tables to document for this question, or None if we aren't confident and should send everything."""
+    scores = score_tables(question)
+    if sum(scores.values()) < min_score:
+        return None
+    tables = set(ALWAYS_INCLUDE) | set(scores)
+    for table in scores:
+        tables |= RELATED_TABLES.get(table, set())
+    if len(tables) > max_tables:
+        return None   # touches so much of the schema that pruning wouldn't save much, and might drop something needed
+    return frozenset(tables)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Starts the app: builds every resource (resources.warm_resources, which writes READY_FILE when it's done) and then runs
+the streamlit server in this same process. st.cache_resource is per process, so the first page load finds everything
+built, and READY_FILE means this server is warm.
+
+    python serve.py [streamlit run options, e.g. --server.port=8501]
+"""
+
+import sys
+
+from streamlit.web import cli as stcli
+
+from resources import warm_resources
+
+if __name__ == '__main__':
+    warm_resources()
+    sys.argv = ['streamlit', 'run', 'app.py'] + sys.argv[1:]
+    sys.exit(stcli.main())
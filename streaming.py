@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming version of ask_question_openai. The SQL is handed to a callback while the model is still writing it, and we
+return the finished query the moment its arguments JSON closes, without waiting for the rest of the response. The rest
+is read on another thread for the token usage in its last chunk.
+"""
+
+import contextvars
+import json
+import threading
+import time
+
+import tracing
+
+
+class ToolArguments:
+    """Accumulates the JSON arguments of a tool call as they stream in, one fragment at a time."""
+
+    def __init__(self):
+        self.text = ''
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self.complete = False
+
+    def feed(self, fragment):
+        """Add a fragment of the arguments. Returns True once the top level JSON object has closed."""
+        for ch in fragment:
+            if self.complete:
+                break
+            self.text += ch
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+                self._started = True
+            elif ch in '}]':
+                self._depth -= 1
+                if self._started and self._depth == 0:
+                    self.complete = True
+        return self.complete
+
+    def partial_value(self, key):
+        """Best effort decode of the (possibly unfinished) string value of `key` received so far, or None."""
+        marker = self.text.find(f'"{key}"')
+        if marker < 0:
+            return None
+        start = self.text.find('"', self.text.find(':', marker + len(key) + 2) + 1)
+        if start < 0:
+            return None
+        raw, i = [], start + 1
+        while i < len(self.text):
+            ch = self.text[i]
+            if ch == '\\':
+                if i + 1 >= len(self.text):
+                    break   # escape sequence split across fragments, wait for the rest
+                if self.text[i + 1] == 'u' and i + 6 > len(self.text):
+                    break
+                step = 6 if self.text[i + 1] == 'u' else 2
+                raw.append(self.text[i:i + step])
+                i += step
+                continue
+            if ch == '"':
+                break
+            raw.append(ch)
+            i += 1
+        try:
+            return json.loads('"' + ''.join(raw) + '"')
+        except ValueError:
+            return None
+
+
+def drain(stream, chunks):
+    """Read the rest of a stream for its usage, then close it."""
+    try:
+        for chunk in chunks:
+            tracing.record_usage(getattr(chunk, 'usage', None))
+    except Exception:
+        pass   # the query is already on its way, only the token count is lost
+    finally:
+        stream.close()
+
+
+def stream_question_openai(question, tools, client, model, on_sql=None, min_interval=0.05):
+    """Ask OpenAI for a query, streaming. Calls on_sql(partial_sql) as the query arrives (at most every min_interval
+    seconds, plus once with the finished query). Returns (function_name, arguments) as soon as a tool call's arguments
+    are complete, or (None, None) if the model didn't call a tool."""
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": question}],
+        tools=tools,
+        tool_choice="auto",
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    chunks = iter(stream)
+    calls = {}   # tool call index -> [function name, ToolArguments]
+    last_render = 0.0
+    try:
+        for chunk in chunks:
+            tracing.record_usage(getattr(chunk, 'usage', None))   # only the last chunk has it
+            if not chunk.choices:
+                continue
+            for delta in chunk.choices[0].delta.tool_calls or []:
+                name, arguments = calls.setdefault(delta.index, [None, ToolArguments()])
+                if delta.function is None:
+                    continue
+                if delta.function.name:
+                    calls[delta.index][0] = name = delta.function.name
+                if not delta.function.arguments:
+                    continue
+                if arguments.feed(delta.function.arguments):
+                    parsed = json.loads(arguments.text)
+                    if on_sql is not None:
+                        on_sql(parsed.get('query', ''))
+                    # don't wait for the usage, read it in the background
+                    threading.Thread(target=contextvars.copy_context().run, args=(drain, stream, chunks),
+                                     name='stream-usage', daemon=True).start()
+                    stream = None
+                    return name, parsed
+                if on_sql is not None and time.monotonic() - last_render >= min_interval:
+                    partial = arguments.partial_value('query')
+                    if partial:
+                        on_sql(partial)
+                        last_render = time.monotonic()
+    finally:
+        if stream is not None:
+            stream.close()
+    return None, None
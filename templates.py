@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL templates: many questions differ only in a name or a number. "career batting average of Rod Carew" and "career
+batting average of Tony Gwynn" get the same SQL with a different playerID, so once OpenAI has written it for one of
+them we can write it for the other ourselves.
+
+parameterize(sql) turns a statement into its template, with a ? for each literal, and the values to bind to them.
+Every query is run that way (pipeline.run_query), so queries of the same shape share one compiled statement in
+sqlite3's per-connection statement cache. Only literals in value positions are parameters: compared to something, in
+an IN list, a BETWEEN or a LIMIT/OFFSET. Literals anywhere else (ORDER BY 2, HR * 1.0, substr(debut, 1, 4), ROWS
+BETWEEN 2 PRECEDING, nameFirst || ' ' || nameLast) mean something as they are and stay in the statement, and so does
+the whole select list, where a literal may be an alias (SUM(HR) 'homers') and the text of an expression without one is
+its column's name.
+
+TemplateCache learns a template from each question whose SQL ran: the question's shape is its words with the names
+(resolved by entities.py) and numbers in it replaced by <player>, <team>, <number> and so on, and each of those slots
+is bound to the parameters whose value came from it (the playerID, nameFirst/nameLast, the year). A later question of
+the same shape gets the SQL with its own names and numbers bound instead, without asking OpenAI. We only learn a
+template when every slot was found in the SQL and nothing else in it looks like it came from the question: a player's
+name in a LIKE pattern, or a year we can't account for ("the season after 1992"). Questions with an ambiguous name
+are never templated either way.
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from entities import normalize
+from query_cache import STOP_WORDS
+
+_TOKEN_RE = re.compile(r"""
+      (?P<string>'(?:[^']|'')*')
+    | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<word>[A-Za-z_][\w$]*)
+    | (?P<number>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?(?![\w.]))
+    | (?P<other>\w+)
+    | (?P<param>\?\d*|[:@$][A-Za-z_]\w*)
+    | (?P<space>\s+)
+    | (?P<op><=|>=|<>|!=|==|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+COMPARISONS = {'=', '==', '<', '>', '<=', '>=', '<>', '!=', 'is', 'like', 'glob', 'limit', 'offset'}
+FRAME_UNITS = {'rows', 'range', 'groups'}   # ROWS BETWEEN 2 PRECEDING takes constants, not parameters
+SELECT_LIST_ENDS = {'from', 'where', 'group', 'having', 'order', 'limit', 'window', 'union', 'intersect', 'except'}
+
+# a number in the SQL that isn't one from the question but looks like a year probably came from one in it
+YEARS = range(1850, 2100)
+
+
+def parameterize(sql):
+    """(statement, params): sql with the literals in value positions replaced by ? and their values. A statement that
+    already has parameters is returned as it is."""
+    out, params = [], []
+    prev = None
+    takes_value = False   # the next literal is a value (after =, IN (, BETWEEN ... AND, LIMIT)
+    between = False       # in a BETWEEN, before its AND
+    lists = []            # for each open parenthesis, whether it's an IN list
+    selecting = [False]   # for each open parenthesis (and the statement), whether we're in a select list
+    for match in _TOKEN_RE.finditer(sql):
+        kind, text = match.lastgroup, match.group()
+        if kind == 'param':
+            return sql, []
+        if kind in ('space', 'comment'):
+            out.append(text)
+            continue
+        lower = text.lower()
+        value = None
+        # the select list names the result's columns ('homers', nameFirst || ' ' || nameLast), so it stays as it is
+        if kind in ('string', 'number') and takes_value and not any(selecting):
+            value = text[1:-1].replace("''", "'") if kind == 'string' else \
+                float(text) if re.search(r'[.eE]', text) else int(text)
+        if value is None:
+            out.append(text)
+        else:
+            out.append('?')
+            params.append(value)
+
+        if lower == '(':
+            lists.append(prev == 'in')
+            selecting.append(False)
+        elif lower == ')' and lists:
+            lists.pop()
+            selecting.pop()
+        elif lower == 'select':
+            selecting[-1] = True
+        elif lower in SELECT_LIST_ENDS:
+            selecting[-1] = False
+        if lower == 'between':
+            between = prev not in FRAME_UNITS
+            takes_value = between
+        elif lower == 'and' and between:
+            between = False
+            takes_value = True
+        else:
+            takes_value = lower in COMPARISONS or (lower in ('(', ',') and bool(lists) and lists[-1])
+        prev = lower
+    return ''.join(out), params
+
+
+def sql_literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def render(statement, params):
+    """The statement with its parameters written back in as literals, the SQL we show and cache."""
+    values = iter(params)
+    return ''.join(sql_literal(next(values)) if match.lastgroup == 'param' else match.group()
+                   for match in _TOKEN_RE.finditer(statement))
+
+
+def entity_values(entity):
+    """The literals a query could use for an entity: its ID, and its name (for players, first and last too)."""
+    values = {'id': entity.id}
+    name = entity.label.rsplit(', ', 1)[0] if entity.kind in ('player', 'team') else entity.label
+    if name:
+        values['name'] = name
+    if entity.kind == 'player' and ' ' in name:
+        values['first'], values['last'] = name.rsplit(' ', 1)
+    return values
+
+
+def question_shape(question, mentions):
+    """(shape, slots) for a question, or None if a name in it is ambiguous. slots are the values of each
+    <kind> in the shape, in order: a dict of role -> value (see entity_values), {'number': n} for a number."""
+    tokens = [token for word in question.split() for token in normalize(word)]
+    starts = {mention.start: mention for mention in mentions}
+    words, slots = [], []
+    i = 0
+    while i < len(tokens):
+        mention = starts.get(i)
+        if mention is not None:
+            if len(mention.entities) != 1:
+                return None
+            entity = mention.entities[0]
+            words.append(f'<{entity.kind}>')
+            slots.append(entity_values(entity))
+            i = mention.end
+            continue
+        if tokens[i].isdigit():
+            words.append('<number>')
+            slots.append({'number': int(tokens[i])})
+        elif tokens[i] not in STOP_WORDS:
+            words.append(tokens[i])
+        i += 1
+    return ' '.join(words), slots
+
+
+def bind(value, slots):
+    """[(slot, role)] for the slots a parameter's value could have come from."""
+    found = []
+    for index, slot in enumerate(slots):
+        for role, slot_value in slot.items():
+            if role == 'number':
+                if value == slot_value or value == str(slot_value):
+                    found.append((index, role))
+            elif isinstance(value, str) and value == slot_value:
+                found.append((index, role))
+    return found
+
+
+def from_question(value, slots):
+    """Whether a parameter nobody's slot accounts for looks like it came from the question anyway."""
+    if isinstance(value, str):
+        lower, words = value.lower(), set(normalize(value))
+        for slot in slots:
+            for role, slot_value in slot.items():
+                if role == 'number':
+                    if str(slot_value) in lower:
+                        return True
+                elif slot_value.lower() in lower or words & set(normalize(slot_value)):
+                    return True
+        return False
+    return isinstance(value, int) and value in YEARS and any('number' in slot for slot in slots)
+
+
+class Template:
+
+    def __init__(self, statement, params, bindings):
+        self.statement = statement
+        self.params = params       # the parameters as learned, the constants among them stay
+        self.bindings = bindings   # parameter index -> (slot, role)
+
+    def fill(self, slots):
+        """The SQL for a question of the same shape with these slots, or None if one of them hasn't got a value the
+        template needs (a team has no first name)."""
+        params = list(self.params)
+        for index, (slot, role) in self.bindings.items():
+            value = slots[slot].get(role)
+            if value is None:
+                return None
+            params[index] = str(value) if isinstance(self.params[index], str) else value
+        return render(self.statement, params)
+
+
+def make_template(sql, slots):
+    """The Template for a question's SQL, or None if it can't safely be reused for other values."""
+    statement, params = parameterize(sql)
+    bindings, bound = {}, set()
+    for index, value in enumerate(params):
+        found = bind(value, slots)
+        if len(found) > 1 and len({slot for slot, _ in found}) > 1:
+            return None   # two slots with the same value, we can't tell which one this is
+        if found:
+            bindings[index] = found[0]
+            bound.add(found[0][0])
+        elif from_question(value, slots):
+            return None
+    if len(bound) != len(slots):
+        return None   # part of the question changed the SQL in a way we can't follow
+    return Template(statement, params, bindings)
+
+
+class TemplateCache:
+    """Thread safe LRU cache, with a time to live, of (model, question shape) -> Template. Unlike the question cache it
+    isn't keyed on the prompt fingerprint: the examples in the prompt change with the names in a question."""
+
+    def __init__(self, max_entries=1000, ttl_seconds=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # (model, shape) -> (expires_at, Template)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, question, mentions, model):
+        """SQL for the question from a template learned from another question of its shape, or None."""
+        shape = question_shape(question, mentions)
+        template = None
+        if shape is not None:
+            key = (model, shape[0])
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] < time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    template = entry[1]
+        sql = template.fill(shape[1]) if template is not None else None
+        with self._lock:
+            if sql is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return sql
+
+    def learn(self, question, mentions, model, sql):
+        """Remember the template of a question's SQL (which ran without error). Returns whether it could."""
+        shape = question_shape(question, mentions)
+        if shape is None or not shape[1]:
+            return False   # nothing to substitute, the question cache has it
+        template = make_template(sql, shape[1])
+        if template is None:
+            return False
+        key = (model, shape[0])
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, template)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (teamID, franchID, lgID, name, first year, last year): a few real team histories, with the names that trip up
+# entity resolution (renamed teams, one nickname on several teams, league names)
+TEAMS = [
+    ('BLA', 'NYY', 'AL', 'Baltimore Orioles', 1901, 1902),
+    ('NYA', 'NYY', 'AL', 'New York Highlanders', 1903, 1912),
+    ('NYA', 'NYY', 'AL', 'New York Yankees', 1913, 2010),
+    ('BAL', 'BAL', 'AL', 'Baltimore Orioles', 1954, 2010),
+    ('BRO', 'LAD', 'NL', 'Brooklyn Robins', 1914, 1931),
+    ('BRO', 'LAD', 'NL', 'Brooklyn Dodgers', 1932, 1957),
+    ('LAN', 'LAD', 'NL', 'Los Angeles Dodgers', 1958, 2010),
+    ('BOS', 'BOS', 'AL', 'Boston Americans', 1901, 1907),
+    ('BOS', 'BOS', 'AL', 'Boston Red Sox', 1908, 2010),
+    ('MON', 'WSN', 'NL', 'Montreal Expos', 1969, 2004),
+    ('WAS', 'WSN', 'NL', 'Washington Nationals', 2005, 2010),
+    ('CHU', 'CPU', 'UA', 'Chicago/Pittsburgh (Union League)', 1884, 1884),
+    ('PIT', 'PIT', 'NL', 'Pittsburgh Pirates', 1891, 2010),
+    ('TOR', 'TOR', 'AL', 'Toronto Blue Jays', 1977, 2010),
+    ('CIN', 'CIN', 'NL', 'Cincinnati Reds', 1890, 2010),
+    ('BSP', 'BRS', 'PL', 'Boston Reds', 1890, 1890),
+]
+
+FRANCHISES = [('NYY', 'New York Yankees'), ('BAL', 'Baltimore Orioles'), ('LAD', 'Los Angeles Dodgers'),
+              ('BOS', 'Boston Red Sox'), ('WSN', 'Washington Nationals'), ('CPU', 'Chicago/Pittsburgh (Union League)'),
+              ('PIT', 'Pittsburgh Pirates'), ('TOR', 'Toronto Blue Jays'), ('CIN', 'Cincinnati Reds'),
+              ('BRS', 'Boston Reds')]
+
+PEOPLE = [
+    ('aaronha01', 'Hank', 'Aaron', '1954-04-13', '1976-10-03'),
+    ('jacksre01', 'Reggie', 'Jackson', '1967-06-09', '1987-10-04'),
+    ('dunnad01', 'Adam', 'Dunn', '2001-07-20', '2014-09-28'),
+    ('zimmery01', 'Ryan', 'Zimmerman', '2005-09-01', '2019-09-29'),
+    ('pujolal01', 'Albert', 'Pujols', '2001-04-02', '2022-10-05'),
+    ('smithjo01', 'John', 'Smith', '1901-04-01', '1910-10-01'),
+    ('smithjo02', 'John', 'Smith', '1950-04-01', '1952-10-01'),
+]
+
+# (playerID, yearID, teamID, lgID, HR, H)
+BATTING = [
+    ('zimmery01', 2010, 'WAS', 'NL', 25, 170),
+    ('dunnad01', 2010, 'WAS', 'NL', 38, 145),
+    ('pujolal01', 2010, 'SLN', 'NL', 42, 183),
+    ('jacksre01', 1977, 'NYA', 'AL', 32, 150),
+    ('aaronha01', 1957, 'ML1', 'NL', 44, 198),
+]
+
+
+def make_database():
+    """A small in-memory database laid out like the Lahman one."""
+    conn = sqlite3.connect(':memory:')
+    conn.executescript('''
+        CREATE TABLE People (playerID TEXT, nameFirst TEXT, nameLast TEXT, debut TEXT, finalGame TEXT);
+        CREATE TABLE Teams (yearID INTEGER, lgID TEXT, teamID TEXT, franchID TEXT, name TEXT, W INTEGER, L INTEGER);
+        CREATE TABLE TeamsFranchises (franchID TEXT, franchName TEXT);
+        CREATE TABLE Batting (playerID TEXT, yearID INTEGER, stint INTEGER, teamID TEXT, lgID TEXT, HR INTEGER,
+                              H INTEGER);
+        CREATE TABLE Pitching (playerID TEXT, yearID INTEGER, stint INTEGER, teamID TEXT, lgID TEXT, W INTEGER,
+                               SV INTEGER);
+    ''')
+    conn.executemany('INSERT INTO People VALUES (?, ?, ?, ?, ?)', PEOPLE)
+    for team_id, franch_id, league, name, first, last in TEAMS:
+        # the first and last season are enough for the name's years
+        conn.executemany('INSERT INTO Teams VALUES (?, ?, ?, ?, ?, 81, 81)',
+                         {(year, league, team_id, franch_id, name) for year in (first, last)})
+    conn.executemany('INSERT INTO TeamsFranchises VALUES (?, ?)', FRANCHISES)
+    conn.executemany('INSERT INTO Batting VALUES (?, ?, 1, ?, ?, ?, ?)', BATTING)
+    return conn
+
+
+@pytest.fixture
+def database():
+    conn = make_database()
+    yield conn
+    conn.close()
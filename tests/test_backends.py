@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from backends import BackendRouter, SQLiteBackend
+from governor import QueryBudgetExceeded, QueryGovernor
+from results import table_rows
+
+
+class Columnar:
+    """Stands in for DuckDBBackend: takes every query, and records the ones it runs."""
+
+    name = 'duckdb'
+
+    def __init__(self):
+        self.ran = []
+
+    def incompatible(self, query, params=()):
+        return None
+
+    def execute(self, conn, query, max_rows=None, params=()):
+        self.ran.append(query)
+        return SQLiteBackend(QueryGovernor()).execute(conn, query, max_rows, params)
+
+
+def router(min_scan_rows=0, compare=False):
+    # every table of the test database but Pitching counts as large
+    return BackendRouter(SQLiteBackend(QueryGovernor(large_table_rows=3)), Columnar(), min_scan_rows, compare)
+
+
+def test_cartesian_plans_are_refused_before_routing(database):
+    backends = router()
+    with pytest.raises(QueryBudgetExceeded) as e:
+        backends.execute(database, 'SELECT count(*) FROM Batting, People')
+    assert e.value.kind == 'plan'
+    assert backends.columnar.ran == []
+
+
+def test_routed_queries_run_on_the_columnar_backend(database):
+    backends = router()
+    table, _ = backends.execute(database, 'SELECT sum(HR) FROM Batting WHERE yearID = ?', (2010,))
+    assert table.column(0).to_pylist() == [105]
+    assert len(backends.columnar.ran) == 1
+
+
+def test_compare_runs_only_routed_queries_on_both(database):
+    backends = router(min_scan_rows=1_000, compare=True)
+    backends.execute(database, 'SELECT sum(HR) FROM Batting')
+    assert backends.columnar.ran == []
+    backends.min_scan_rows = 0
+    backends.execute(database, 'SELECT sum(HR) FROM Batting')
+    assert len(backends.columnar.ran) == 1
+
+
+@pytest.fixture
+def engines(database, tmp_path):
+    """The real SQLite and DuckDB backends on copies of the test database, routing every query it can to DuckDB."""
+    pytest.importorskip('duckdb')
+    from backends import DuckDBBackend, export_parquet
+    path = str(tmp_path / 'baseball.db')
+    copy = sqlite3.connect(path)
+    database.backup(copy)
+    export_parquet(path, str(tmp_path / 'columnar'))
+    yield BackendRouter(SQLiteBackend(QueryGovernor()), DuckDBBackend.load(str(tmp_path / 'columnar'), path),
+                        min_scan_rows=0), copy
+    copy.close()
+
+
+def rows(result):
+    table, _ = result
+    return table_rows(table)
+
+
+@pytest.mark.parametrize('query', [
+    'WITH t(a, b) AS (VALUES (1, 3), (NULL, 1), (3, 1)) SELECT a, b FROM Batting, t WHERE playerID = ? ORDER BY a LIMIT 2',
+    'WITH t(a, b) AS (VALUES (1, 3), (NULL, 1), (3, 1)) SELECT a, b FROM Batting, t WHERE playerID = ? ORDER BY a DESC',
+])
+def test_nulls_sort_the_same_on_both_engines(engines, query):
+    backends, conn = engines
+    assert backends.choose(conn, query, ('dunnad01',))[0] is backends.columnar
+    assert rows(backends.columnar.execute(conn, query, params=('dunnad01',))) == \
+        rows(backends.sqlite.execute(conn, query, params=('dunnad01',)))
+
+
+@pytest.mark.parametrize('query', [
+    'SELECT CAST(HR * 1.07 AS INTEGER) FROM Batting WHERE playerID = ?',
+    'SELECT ROUND(HR / 2.0) FROM Batting WHERE playerID = ?',
+])
+def test_queries_duckdb_reads_differently_stay_on_sqlite(engines, query):
+    backends, conn = engines
+    assert backends.choose(conn, query, ('dunnad01',))[0] is backends.sqlite
+    # they do give different answers: 40.66 rounds to 41 in DuckDB, SQLite truncates it to 40; 19.0 is a decimal
+    assert rows(backends.columnar.execute(conn, query, params=('dunnad01',))) != \
+        rows(backends.sqlite.execute(conn, query, params=('dunnad01',)))
+    assert rows(backends.execute(conn, query, ('dunnad01',))) == \
+        rows(backends.sqlite.execute(conn, query, params=('dunnad01',)))
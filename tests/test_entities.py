@@ -0,0 +1,55 @@
+import pytest
+
+from entities import EntityIndex
+
+
+@pytest.fixture
+def index(database):
+    return EntityIndex.from_database(database)
+
+
+def teams(index, question):
+    """{mention text: [teamIDs]} for the team names found in a question."""
+    return {m.text: [e.id for e in m.entities] for m in index.resolve(question)
+            if all(e.kind == 'team' for e in m.entities)}
+
+
+@pytest.mark.parametrize('question', [
+    'who hit the most home runs in the National League in 2010',
+    'which American League team won the most games in 1990',
+    'who led the Union League in hits',
+    'how many teams were in the Federal League',
+])
+def test_league_names_are_not_teams(index, question):
+    assert teams(index, question) == {}
+
+
+def test_a_city_is_not_a_nickname(index):
+    # "Chicago/Pittsburgh (Union League)" ends in Pittsburgh, but Pittsburgh is the Pirates' city
+    assert teams(index, 'how many games did Pittsburgh win in 1884') == {}
+
+
+def test_every_name_a_team_played_under(index):
+    assert teams(index, 'Boston Americans home runs in 1903') == {'boston americans': ['BOS']}
+    assert teams(index, 'Brooklyn Dodgers wins in 1955') == {'brooklyn dodgers': ['BRO']}
+    assert teams(index, 'Brooklyn Robins wins in 1920') == {'brooklyn robins': ['BRO']}
+
+
+def test_yankees_are_one_team(index):
+    assert teams(index, 'how many saves did Yankees pitchers have in 1998') == {'yankees': ['NYA']}
+    assert teams(index, 'who hit the most home runs for the Yankees') == {'yankees': ['NYA']}
+
+
+def test_nicknames_resolve_to_the_team_of_the_year_asked(index):
+    assert teams(index, 'Orioles home runs in 1901') == {'orioles': ['BLA']}
+    assert teams(index, 'Orioles home runs in 1990') == {'orioles': ['BAL']}
+    assert teams(index, 'Dodgers wins in 1955') == {'dodgers': ['BRO']}
+    assert teams(index, 'Dodgers wins in 1988') == {'dodgers': ['LAN']}
+    # without a year both are still candidates, the most recent first
+    assert teams(index, 'Orioles home run leaders') == {'orioles': ['BAL', 'BLA']}
+
+
+def test_nickname_variants(index):
+    assert teams(index, 'Blue Jays wins in 1992') == {'blue jays': ['TOR']}
+    assert teams(index, 'Jays wins in 1992') == {'jays': ['TOR']}
+    assert teams(index, 'Nationals home runs in 2010') == {'nationals': ['WAS']}
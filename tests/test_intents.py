@@ -0,0 +1,93 @@
+import pytest
+
+from entities import Entity, EntityIndex
+from intents import IntentMatcher, Parsed, Unsure
+
+
+@pytest.fixture
+def index(database):
+    return EntityIndex.from_database(database)
+
+
+@pytest.fixture
+def matcher(database):
+    return IntentMatcher.from_database(database)
+
+
+def match(matcher, index, question):
+    return matcher.match(question, index.resolve(question))
+
+
+@pytest.mark.parametrize('question', [
+    'who hit the most home runs in the National League in 2010',
+    'who hit the most home runs in the american league in 2010',
+    'top 5 NL home run hitters in 2010',
+    'most hits in the AL in 1977',
+    'who hit the most home runs in the Union League',
+    'most home runs in the American Association',
+])
+def test_league_questions_go_to_the_model(matcher, index, question):
+    assert match(matcher, index, question) is None
+
+
+def test_league_questions_refused_even_if_a_league_word_resolves_to_a_team(matcher, database):
+    # the entity index used to resolve "national" to the Nationals, the intents mustn't trust that
+    index = EntityIndex.from_database(database)
+    index.add('national', Entity('team', 'WAS', 'Washington Nationals, 2005-2010'))
+    question = 'who hit the most home runs in the National League in 2010'
+    assert any(m.text == 'national' for m in index.resolve(question))
+    assert match(matcher, index, question) is None
+
+
+def test_generic_word_names_are_refused(matcher, database):
+    index = EntityIndex.from_database(database)
+    index.add('homers', Entity('team', 'WAS', 'Washington Nationals, 2005-2010'))
+    assert match(matcher, index, 'who hit the most homers in 2010') is None
+
+
+def test_team_leaderboard(matcher, index, database):
+    intent, sql = match(matcher, index, 'who hit the most home runs for the Nationals in 2010')
+    assert intent == 'leaders'
+    assert "teamID IN ('WAS')" in sql
+    assert database.execute(sql).fetchall() == [(1, 'Adam Dunn', 38)]
+
+
+def test_major_league_is_not_a_league_question(matcher, index):
+    intent, sql = match(matcher, index, 'most home runs in major league history')
+    assert intent == 'leaders'
+
+
+def test_nickname_of_two_franchises_goes_to_the_model(matcher, index):
+    # "Orioles" is BAL, or BLA, which became the Yankees: an all time Orioles leaderboard would mix the two
+    assert match(matcher, index, 'top 5 Orioles home run hitters of all time') is None
+    intent, sql = match(matcher, index, 'top 5 Orioles home run hitters since 1990')
+    assert "teamID IN ('BAL')" in sql
+
+
+@pytest.mark.parametrize('question', [
+    'how many home runs did the Reds hit in 1890',
+    'how many games did the Reds win in 1890',
+])
+def test_two_teams_by_one_name_in_the_same_year_go_to_the_model(matcher, index, question):
+    # the Cincinnati Reds and the Players' League Boston Reds both played in 1890
+    assert sorted(e.id for m in index.resolve(question) for e in m.entities) == ['BSP', 'CIN']
+    assert match(matcher, index, question) is None
+
+
+def test_successive_teams_of_one_franchise_stay_together(matcher, index):
+    intent, sql = match(matcher, index, 'top 5 Dodgers home run hitters of all time')
+    assert intent == 'leaders'
+    assert "'BRO'" in sql and "'LAN'" in sql
+
+
+def test_teams_of_one_franchise_at_the_same_time_are_refused():
+    parsed = Parsed()
+    parsed.teams = [[('AAA', 1900, 1910), ('BBB', 1905, 1915)]]
+    with pytest.raises(Unsure):
+        IntentMatcher(franchises={'AAA': 'XXX', 'BBB': 'XXX'}).team_ids(parsed)
+
+
+def test_team_of_the_year_asked(matcher, index):
+    intent, sql = match(matcher, index, 'how many saves did Yankees pitchers have in 1998')
+    assert intent == 'team_stat'
+    assert "teamID IN ('NYA')" in sql and 'yearID = 1998' in sql
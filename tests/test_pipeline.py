@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import pipeline
+from governor import QueryGovernor
+from llm import LLMBusy
+from model_router import ModelRouter
+
+
+class Pool:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+class BusyOpenAI:
+    """Every request fails, like the strong model's request when we're over the rate limit."""
+
+    def __init__(self):
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.models.append(kwargs['model'])
+        raise LLMBusy('OpenAI rate limit: the request would have to wait 60 seconds')
+
+
+@pytest.fixture
+def resources(database, monkeypatch):
+    for name, value in {'get_db_pool': Pool(database), 'get_query_governor': QueryGovernor(),
+                        'get_model_router': ModelRouter('fast-model', 'strong-model'), 'get_result_cache': None,
+                        'get_query_log': None, 'get_backend_router': None}.items():
+        monkeypatch.setattr(pipeline, name, lambda value=value: value)
+
+
+def fast_answer(sql):
+    answer = pipeline.Answer('what is the first name of the player called zzz')
+    answer.function_name, answer.sql, answer.tier, answer.model = 'ask_database', sql, 'fast', 'fast-model'
+    answer.prompt, answer.tools = answer.question, []
+    return answer
+
+
+def test_failed_escalation_of_invalid_sql_reports_the_compile_error(resources):
+    client = BusyOpenAI()
+    answer = pipeline.run_sql(fast_answer('SELECT nope FROM People'), client, use_cache=False)
+    assert client.models == ['strong-model']
+    assert answer.escalated == 'invalid_sql'
+    assert answer.sql == 'SELECT nope FROM People'
+    assert 'no such column: nope' in answer.error
+    assert answer.response.startswith('query failed with error')
+
+
+def test_failed_escalation_of_an_empty_result_keeps_it(resources):
+    sql = "SELECT nameFirst FROM People WHERE nameLast = 'zzz'"
+    answer = pipeline.run_sql(fast_answer(sql), BusyOpenAI(), use_cache=False)
+    assert answer.escalated == 'empty_result'
+    assert (answer.sql, answer.error, answer.tier) == (sql, None, 'fast')
+    assert answer.result.num_rows == 0
@@ -0,0 +1,8 @@
+from prompt import query_description
+
+
+def test_summary_tables_are_recommended_only_when_documented():
+    assert 'CareerBatting' in query_description(None)
+    assert 'prefer the precomputed summary tables' in query_description(frozenset({'People', 'Batting'}))
+    pruned = query_description(frozenset({'People', 'Teams'}))
+    assert 'CareerBatting' not in pruned and 'SeasonLeaders' not in pruned
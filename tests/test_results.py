@@ -0,0 +1,19 @@
+import pyarrow as pa
+
+from governor import QueryGovernor
+
+
+def types(database, query):
+    table, _ = QueryGovernor().execute(database, query)
+    return {field.name: field.type for field in table.schema}
+
+
+def test_all_null_columns_keep_their_declared_type(database):
+    # no Batting rows for 1800: one row, all NULL
+    assert types(database, 'SELECT HR, max(b.HR), SUM(H), min(teamID) FROM Batting b WHERE yearID = 1800') == {
+        'HR': pa.float64(), 'max(b.HR)': pa.float64(), 'SUM(H)': pa.float64(), 'min(teamID)': pa.string()}
+
+
+def test_columns_with_values_are_typed_by_them(database):
+    assert types(database, "SELECT HR, H * 1.0 AS rate, playerID FROM Batting WHERE playerID = 'dunnad01'") == {
+        'HR': pa.int64(), 'rate': pa.float64(), 'playerID': pa.string()}
@@ -0,0 +1,62 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import tracing
+from llm import GovernedClient
+from streaming import stream_question_openai
+
+TOOLS = [{'type': 'function', 'function': {'name': 'ask_database', 'parameters': {}}}]
+
+
+def chunk(arguments=None, usage=None):
+    if arguments is None:
+        return SimpleNamespace(choices=[], usage=usage)
+    call = SimpleNamespace(index=0, function=SimpleNamespace(name='ask_database', arguments=arguments))
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(tool_calls=[call]))], usage=None)
+
+
+class Stream:
+    """A streamed response: the query's arguments in pieces, then a chunk with the usage."""
+
+    def __init__(self, query, total_tokens):
+        arguments = json.dumps({'query': query})
+        usage = SimpleNamespace(prompt_tokens=total_tokens - 50, completion_tokens=50, total_tokens=total_tokens)
+        self.chunks = [chunk(arguments[i:i + 8]) for i in range(0, len(arguments), 8)] + [chunk(usage=usage)]
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed.set()
+
+
+class OpenAI:
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return self.stream
+
+
+def tokens(kind):
+    return tracing.METRICS._counters.get('chatbot_llm_tokens_total', {}).get((('kind', kind),), 0)
+
+
+def test_streamed_usage_is_recorded_and_settles_the_token_bucket():
+    stream = Stream('SELECT sum(HR) FROM Batting', total_tokens=1_000)
+    openai = OpenAI(stream)
+    client = GovernedClient(openai, tokens_per_minute=6_000)
+    prompt_tokens = tokens('prompt')
+    name, arguments = stream_question_openai('how many home runs', TOOLS, client, 'gpt-test')
+    assert (name, arguments) == ('ask_database', {'query': 'SELECT sum(HR) FROM Batting'})
+    assert openai.requests[0]['stream_options'] == {'include_usage': True}
+    assert stream.closed.wait(5)
+    assert tokens('prompt') == prompt_tokens + 950
+    # the bucket was charged the 1000 tokens used, not the estimate
+    assert 4_900 < client.limiter.tokens.level <= 5_000
@@ -0,0 +1,69 @@
+import pytest
+
+from entities import EntityIndex
+from templates import TemplateCache, parameterize, render
+from validation import validate
+
+
+def columns(conn, sql):
+    statement, params = parameterize(sql)
+    return [d[0] for d in conn.execute(statement, params).description]
+
+
+def test_value_literals_become_parameters():
+    statement, params = parameterize("SELECT SUM(HR) FROM Batting WHERE playerID = 'aaronha01' AND yearID > 1960 "
+                                     "AND teamID IN ('ML1', 'ATL') LIMIT 10")
+    assert statement == "SELECT SUM(HR) FROM Batting WHERE playerID = ? AND yearID > ? AND teamID IN (?, ?) LIMIT ?"
+    assert params == ['aaronha01', 1960, 'ML1', 'ATL', 10]
+
+
+def test_string_alias_stays(database):
+    sql = "SELECT SUM(HR) 'homers' FROM Batting WHERE playerID = 'aaronha01'"
+    statement, params = parameterize(sql)
+    assert statement == "SELECT SUM(HR) 'homers' FROM Batting WHERE playerID = ?"
+    assert validate(database, sql) is None
+    assert columns(database, sql) == ['homers']
+    assert database.execute(statement, params).fetchall() == [(44,)]
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT nameFirst || ' ' || nameLast FROM People WHERE playerID = 'aaronha01'", ["nameFirst || ' ' || nameLast"]),
+    ("SELECT CASE WHEN lgID = 'NL' THEN 1 ELSE 0 END FROM Batting WHERE yearID = 2010",
+     ["CASE WHEN lgID = 'NL' THEN 1 ELSE 0 END"]),
+    ("SELECT HR * 1.0 / 2, substr(playerID, 1, 4) FROM Batting", ['HR * 1.0 / 2', 'substr(playerID, 1, 4)']),
+    ("SELECT (SELECT COUNT(*) FROM People WHERE nameLast = 'Smith') FROM Teams LIMIT 1",
+     ["(SELECT COUNT(*) FROM People WHERE nameLast = 'Smith')"]),
+])
+def test_unaliased_columns_keep_their_names(database, sql, expected):
+    assert columns(database, sql) == expected
+
+
+def test_validate_checks_the_statement_that_runs(database):
+    assert validate(database, "SELECT SUM(HR) FROM Batting WHERE playerID = 'aaronha01' AND yearID BETWEEN 1950 AND 1960") is None
+    assert validate(database, "SELECT nope FROM Batting WHERE playerID = 'x'") is not None
+
+
+def test_render_round_trips():
+    sql = "SELECT SUM(HR) AS 'total' FROM Batting WHERE playerID = 'o''neilpa01' AND yearID >= 1990"
+    assert render(*parameterize(sql)) == sql
+
+
+def test_template_fills_in_another_player(database):
+    index = EntityIndex.from_database(database)
+    cache = TemplateCache()
+    learned = 'how many home runs did Hank Aaron hit in 1957'
+    sql = "SELECT SUM(HR) 'homers' FROM Batting WHERE playerID = 'aaronha01' AND yearID = 1957"
+    assert cache.learn(learned, index.resolve(learned), 'model', sql)
+    question = 'how many home runs did Reggie Jackson hit in 1977'
+    filled = cache.match(question, index.resolve(question), 'model')
+    assert filled == "SELECT SUM(HR) 'homers' FROM Batting WHERE playerID = 'jacksre01' AND yearID = 1977"
+    assert database.execute(filled).fetchall() == [(32,)]
+
+
+def test_ambiguous_names_are_never_templated(database):
+    index = EntityIndex.from_database(database)
+    cache = TemplateCache()
+    question = 'how many home runs did John Smith hit'
+    assert len(index.resolve(question)[0].entities) == 2
+    assert not cache.learn(question, index.resolve(question), 'model',
+                           "SELECT SUM(HR) FROM Batting WHERE playerID = 'smithjo01'")
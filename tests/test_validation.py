@@ -0,0 +1,20 @@
+import pytest
+
+from executor import QueryCancelled
+from validation import repair_loop
+
+
+def test_a_stopped_job_is_not_a_failed_repair(database):
+    def repair(sql, error):
+        raise QueryCancelled()
+
+    with pytest.raises(QueryCancelled):
+        repair_loop(database, 'SELECT nope FROM People', repair)
+
+
+def test_a_failed_repair_request_keeps_the_error(database):
+    def repair(sql, error):
+        raise RuntimeError('OpenAI is down')
+
+    sql, error, repairs = repair_loop(database, 'SELECT nope FROM People', repair)
+    assert sql == 'SELECT nope FROM People' and 'nope' in error and repairs == 1
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-request tracing and metrics for the chat pipeline.
+
+Every question gets a Trace with one span per stage it went through (prompt, cache, llm, parse, validate, execute,
+render), each with its duration and attributes such as token and row counts. When the request is done the trace is
+written as one JSON line to TRACE_LOG, and its timings are added to the Prometheus metrics served at
+http://<host>:METRICS_PORT/metrics:
+
+    chatbot_stage_seconds{stage}        histogram of the time spent in each stage, stage="total" for the whole request
+    chatbot_requests_total{outcome}     requests by outcome: ok, error or no_query
+    chatbot_cache_total{cache,result}   question, template and result cache hits and misses
+    chatbot_errors_total{stage}         stages that failed
+    chatbot_llm_tokens_total{kind}      prompt and completion tokens, from the usage OpenAI reports
+    chatbot_rows_total                  rows returned by queries
+    chatbot_intent_total{intent}        questions answered with our own SQL by kind (intents.py), intent="none" if not
+    chatbot_llm_requests_total{outcome} OpenAI requests by outcome: ok, error or rejected by the rate limiter (llm.py)
+    chatbot_llm_retries_total{status}   OpenAI requests retried after a 429 or 5xx
+    chatbot_llm_coalesced_total         requests that shared the response of an identical one already in flight
+    chatbot_llm_waiting                 requests waiting for the rate limiter
+    chatbot_llm_queue_seconds           histogram of the time requests waited for the rate limiter
+    chatbot_tier_total{tier}            questions routed to the fast or strong model (model_router.py)
+    chatbot_tier_llm_seconds{tier}      histogram of the time each tier's model took to write the SQL
+    chatbot_escalations_total{reason}   fast answers handed to the strong model: no_query, invalid_sql or empty_result
+    chatbot_escalations_failed_total{reason} escalations whose strong model request failed, the fast answer stands
+    chatbot_hedge_requests_total{outcome} extra requests for hedged queries (hedging.py): sent, or skipped (cost ceiling),
+                                        and requests that failed (error), the first one included
+    chatbot_hedge_wins_total{candidate} hedged questions by which request's query won, 0 for the first, "none" if none
+    chatbot_history_bytes               bytes of chat history held in memory by all sessions (history.py)
+    chatbot_history_sessions            sessions with a chat history
+    chatbot_history_spilled_bytes       bytes of results spilled to disk
+    chatbot_sql_queued                  queries waiting for a worker of the query executor (executor.py)
+    chatbot_sql_running                 queries running on the executor's workers
+    chatbot_sql_queue_seconds           histogram of the time queries waited for a worker
+    chatbot_sql_rejected_total          queries refused because the executor's queue was full
+
+The current trace and span live in context variables, so code anywhere under answer_question can annotate them
+(tracing.annotate, tracing.record_usage) without having them passed in.
+"""
+
+import contextvars
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)   # seconds
+
+
+class Metrics:
+    """Thread safe counters, gauges and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}     # name -> {labels: value}
+        self._histograms = {}   # name -> {labels: [count per bucket..., sum, count]}
+        self._gauges = {}       # name -> {labels: value}
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._histograms.setdefault(name, {}).setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def render(self):
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{labels_text(labels)} {value}')
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f'# TYPE {name} gauge')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{labels_text(labels)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for labels, values in sorted(series.items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f'{name}_bucket{labels_text(labels, [("le", bound)])} {count}')
+                    lines.append(f'{name}_bucket{labels_text(labels, [("le", "+Inf")])} {values[-1]}')
+                    lines.append(f'{name}_sum{labels_text(labels)} {values[-2]:.6f}')
+                    lines.append(f'{name}_count{labels_text(labels)} {values[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+class Span:
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.offset = None    # seconds from the start of the trace
+        self.seconds = None
+        self.error = None
+
+
+class Trace:
+
+    def __init__(self, question):
+        self.id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.started = time.time()
+        self.seconds = None
+        self.attrs = {}
+        self.spans = []
+        self._perf_start = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            'trace_id': self.id, 'ts': round(self.started, 3), 'question': self.question,
+            'seconds': round(self.seconds, 6) if self.seconds is not None else None, **self.attrs,
+            'spans': [dict({'name': s.name, 'offset': round(s.offset, 6), 'seconds': round(s.seconds, 6)},
+                           **s.attrs, **({'error': s.error} if s.error else {})) for s in self.spans],
+        }
+
+
+METRICS = Metrics()
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+_current_span = contextvars.ContextVar('span', default=None)
+_log_path = None
+_log_lock = threading.Lock()
+
+
+def configure(log_path=None):
+    """Where finished traces are written: None or '' for nowhere, '-' for stdout, otherwise a JSONL file."""
+    global _log_path
+    _log_path = log_path or None
+
+
+@contextmanager
+def request(question):
+    """The trace for one question. If a trace is already active it's reused, so the app can wrap answer_question and
+    the rendering of its answer in one trace while answer_question still traces itself when called on its own."""
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = Trace(question)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attrs['outcome'] = 'error'
+        trace.attrs.setdefault('error', str(e))
+        raise
+    finally:
+        _current_trace.reset(token)
+        finish(trace)
+
+
+@contextmanager
+def activate(trace):
+    """Make an existing trace the current one, for work on its question that happens on another thread (batch.py
+    writes the SQL on one pool and runs it on another). Call finish(trace) once the question is done."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    trace = _current_trace.get()
+    current = Span(name, attrs)
+    started = time.perf_counter()
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        _current_span.reset(token)
+        if trace is not None:
+            current.offset = started - trace._perf_start
+            trace.spans.append(current)
+
+
+def annotate(**attrs):
+    """Add attributes to the current span (if there is one)."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def annotate_request(**attrs):
+    """Add attributes to the current trace (if there is one)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def count(name, amount=1, **labels):
+    METRICS.inc(name, amount, **labels)
+
+
+def record_usage(usage):
+    """Count the tokens from an OpenAI response's usage, and add them to the current span."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+    completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+    current = _current_span.get()
+    if current is not None:
+        current.attrs['prompt_tokens'] = current.attrs.get('prompt_tokens', 0) + prompt_tokens
+        current.attrs['completion_tokens'] = current.attrs.get('completion_tokens', 0) + completion_tokens
+    METRICS.inc('chatbot_llm_tokens_total', prompt_tokens, kind='prompt')
+    METRICS.inc('chatbot_llm_tokens_total', completion_tokens, kind='completion')
+
+
+def finish(trace):
+    if trace.seconds is None:
+        trace.seconds = time.perf_counter() - trace._perf_start
+    for s in trace.spans:
+        METRICS.observe('chatbot_stage_seconds', s.seconds, stage=s.name)
+        if s.error:
+            METRICS.inc('chatbot_errors_total', stage=s.name)
+    METRICS.observe('chatbot_stage_seconds', trace.seconds, stage='total')
+    METRICS.inc('chatbot_requests_total', outcome=trace.attrs.get('outcome', 'ok'))
+    if _log_path is None:
+        return
+    line = json.dumps(trace.to_dict(), default=str)
+    with _log_lock:
+        if _log_path == '-':
+            print(line, file=sys.stdout, flush=True)
+        else:
+            with open(_log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        data = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Serve /metrics on a background thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checks generated SQL before we run it, and asks OpenAI to fix it if it's broken.
+
+validate() compiles the statement with EXPLAIN on one of our read-only connections, with its literals bound the way
+they are when it runs. That parses the SQL and resolves every table and column against the real schema without
+running the query, and takes well under a millisecond. If it fails, repair_loop() sends OpenAI a short request holding only the error and the SQL (not the whole schema prompt)
+and validates the answer again, up to REPAIR_MAX_ATTEMPTS times or until REPAIR_BUDGET_SECONDS have gone by.
+"""
+
+import re
+import sqlite3
+import time
+
+import tracing
+from executor import QueryCancelled
+from templates import parameterize
+
+REPAIR_PROMPT = """This SQLite query fails with the error below. Reply with only the corrected SQL query, nothing else.
+
+Error: {error}
+
+Query:
+{sql}"""
+
+
+def validate(conn, sql):
+    """Returns None if sql is a single statement that compiles against the database, otherwise the error message."""
+    statement = sql.strip().rstrip(';').strip()
+    if not statement:
+        return 'the query is empty'
+    if not re.match(r'(SELECT|WITH|VALUES)\b', statement, re.IGNORECASE):
+        return 'only SELECT queries can be run against this database'
+    # compile it the way it will run, with its literals bound (templates.parameterize)
+    statement, params = parameterize(statement)
+    try:
+        conn.execute('EXPLAIN ' + statement, params)   # sqlite3 refuses more than one statement here, which is what we want
+    except (sqlite3.Error, sqlite3.Warning) as e:
+        return str(e)
+    return None
+
+
+def extract_sql(text):
+    """The SQL from a model reply, without any ``` fences or explanation around it."""
+    fenced = re.search(r'```(?:sql)?\s*(.*?)```', text, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    return text.strip()
+
+
+def repair_sql(client, model, sql, error):
+    """One compact repair request. Returns the model's corrected SQL."""
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": REPAIR_PROMPT.format(error=error, sql=sql)}],
+        temperature=0,
+    )
+    tracing.record_usage(response.usage)
+    return extract_sql(response.choices[0].message.content or '')
+
+
+def repair_loop(conn, sql, repair, max_attempts=2, budget_seconds=20.0):
+    """Validate sql, and while it doesn't compile call repair(sql, error) for a new version.
+    Stops after max_attempts repairs or once budget_seconds have passed, whichever comes first.
+    Returns (sql, error, repairs): error is None if the final sql compiles."""
+    started = time.monotonic()
+    error = validate(conn, sql)
+    repairs = 0
+    while error is not None and repairs < max_attempts and time.monotonic() - started < budget_seconds:
+        repairs += 1
+        try:
+            candidate = repair(sql, error)
+        except QueryCancelled:
+            raise   # the job was stopped, that's not a failed repair
+        except Exception as e:
+            print(f"SQL repair request failed: {e}")
+            break
+        if not candidate:
+            break
+        sql = candidate
+        error = validate(conn, sql)
+    return sql, error, repairs